@@ -0,0 +1,18 @@
+"""Load tests and microbenchmarks of the API, for comparing commits.
+
+Both seed a fresh database in a temporary directory (see workspace.py and seed.py) and print
+JSON, or write it to --output:
+
+    python -m benchmarks load --requests 200 --concurrency 10 --output before.json
+    python -m benchmarks micro --number 100
+    python -m benchmarks compare before.json after.json
+    python -m benchmarks plans
+    python -m benchmarks scaling --workers 8 --duration 10
+
+`load` sends requests to every route of main.py in process, through the ASGI interface, and
+reports throughput, latency percentiles and SQL statements per request for each. `micro` times
+serialization of schemas.User and the query functions of db/crud.py. `plans` explains the SQL
+of every route and exits with 1 if a plan scans a whole table. `scaling` starts server.py with
+1, 2, 4, ... worker processes and measures the read routes over HTTP. Settings such as
+FAST_JSON or DB_WRITE_QUEUE are taken from the environment as usual.
+"""
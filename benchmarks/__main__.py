@@ -0,0 +1,130 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from . import workspace
+
+# what `compare` shows, and whether more is better
+COMPARED = {"rps": True, "p50_ms": False, "p99_ms": False, "sql_per_request": False, "best_us": False, "sql_statements": False}
+
+
+def add_volumes(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--locations", type=int, default=200)
+    parser.add_argument("--goods", type=int, default=2000)
+    parser.add_argument("--shares", type=int, default=4000)
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random test data")
+    parser.add_argument("--workdir", help="directory for the database and blobs, a new temporary one by default")
+    parser.add_argument("--only", help="run only the benchmarks with this in their name")
+    parser.add_argument("--output", help="write the JSON report here instead of to stdout")
+
+
+def volumes(args):
+    from .seed import Volumes
+    v = Volumes(args.users, args.locations, args.goods, args.shares, args.images)
+    if min(v) < v.users:
+        sys.exit("every volume has to be at least --users, so each user owns some of everything")
+    return v
+
+
+def prepare(args):
+    workspace.prepare(args.workdir)
+    from .seed import seed
+    v = volumes(args)
+    seed(v, args.seed)
+    return v
+
+
+def write(report: dict, output) -> None:
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+def leaves(report: dict, prefix: str = ""):
+    """(name, metrics) of every dict in `report` that holds compared metrics."""
+    for name, value in report.items():
+        if isinstance(value, dict):
+            if COMPARED.keys() & value.keys():
+                yield prefix + name, value
+            else:
+                yield from leaves(value, f"{prefix}{name}: ")
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path) as f:
+        old = dict(leaves(json.load(f)))
+    with open(new_path) as f:
+        new = dict(leaves(json.load(f)))
+    width = max(map(len, new), default=0)
+    for name, metrics in new.items():
+        if name not in old:
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED.items():
+            if metric not in metrics or metric not in old[name]:
+                continue
+            before, after = old[name][metric], metrics[metric]
+            change = f"{(after - before) / before * 100:+.0f}%" if before else ""
+            changes.append(f"{metric} {before} -> {after} {change}".rstrip())
+        print(f"{name:<{width}}  " + ", ".join(changes))
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="load test every route")
+    add_volumes(load)
+    load.add_argument("--requests", type=int, default=200, help="requests per route")
+    load.add_argument("--concurrency", type=int, default=10)
+    load.add_argument("--warmup", type=int, default=10, help="untimed requests before each read scenario")
+    micro = commands.add_parser("micro", help="time serialization and crud queries")
+    add_volumes(micro)
+    micro.add_argument("--number", type=int, default=100, help="calls per timing round")
+    scaling = commands.add_parser("scaling", help="read throughput of server.py with 1, 2, 4, ... workers")
+    add_volumes(scaling)
+    scaling.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="the largest worker count, default the number of CPUs")
+    scaling.add_argument("--clients", type=int, default=os.cpu_count() or 1, help="load generator processes")
+    scaling.add_argument("--connections", type=int, default=16, help="connections per load generator")
+    scaling.add_argument("--duration", type=float, default=10, help="timed seconds per worker count")
+    scaling.add_argument("--warmup", type=float, default=2, help="untimed seconds before")
+    plans = commands.add_parser("plans", help="EXPLAIN the SQL of every route, exit 1 on full table scans")
+    add_volumes(plans)
+    plans.add_argument("--requests", type=int, default=3, help="requests per route")
+    diff = commands.add_parser("compare", help="compare two reports")
+    diff.add_argument("old")
+    diff.add_argument("new")
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        compare(args.old, args.new)
+    elif args.command == "plans":
+        v = prepare(args)
+        from . import plans
+        scans = asyncio.get_event_loop().run_until_complete(plans.run(v, args.requests))
+        for scan in scans:
+            print(f"full scan of {scan.table} by {', '.join(scan.scenarios)}:\n  {' '.join(scan.statement.split())}\n" + "".join(f"    {line}\n" for line in scan.plan))
+        print(f"{len(scans)} full table scans")
+        sys.exit(1 if scans else 0)
+    elif args.command == "scaling":
+        v = prepare(args)
+        from . import scaling
+        write(scaling.run(v, scaling.worker_counts(args.workers), args.clients, args.connections, args.warmup, args.duration, args.only), args.output)
+    elif args.command == "load":
+        v = prepare(args)
+        from . import load
+        report = asyncio.get_event_loop().run_until_complete(load.run(v, args.requests, args.concurrency, args.warmup, args.only))
+        write(report, args.output)
+    else:
+        v = prepare(args)
+        from . import micro
+        write(micro.run(v, args.number, args.only), args.output)
+
+
+main()
@@ -0,0 +1,89 @@
+"""Minimal in-process ASGI client: requests go straight into the app, no sockets and no extra dependencies."""
+import asyncio
+import json
+import secrets
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+from urllib.parse import urlencode
+
+Query = Union[Dict[str, object], Sequence[Tuple[str, object]]]
+
+
+class Response(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class Client:
+    def __init__(self, app):
+        self.app = app
+
+    async def startup(self) -> None:
+        await self.app.router.startup()
+
+    async def shutdown(self) -> None:
+        await self.app.router.shutdown()
+
+    async def request(self, method: str, path: str, params: Optional[Query] = None, headers: Optional[Dict[str, str]] = None, body: bytes = b"", json_body=None) -> Response:
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers.setdefault("content-type", "application/json")
+        headers.setdefault("host", "bench")
+        headers["content-length"] = str(len(body))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": urlencode(params or {}, doseq=True).encode(),
+            "headers": [(k.encode(), str(v).encode()) for k, v in headers.items()],
+            "client": ("127.0.0.1", 0),
+            "server": ("bench", 80),
+        }
+        sent = False
+        done = asyncio.Event()
+
+        async def receive():
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            await done.wait()
+            return {"type": "http.disconnect"}
+
+        status, response_headers, chunks = 500, {}, []
+
+        async def send(message):
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = {k.decode().lower(): v.decode() for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            done.set()
+        return Response(status, response_headers, b"".join(chunks))
+
+
+def multipart(name: str, filename: str, content: bytes, content_type: str = "application/octet-stream") -> Tuple[bytes, str]:
+    """A multipart/form-data body with one file field, and its Content-Type."""
+    boundary = secrets.token_hex(16)
+    body: List[bytes] = [
+        f"--{boundary}\r\n".encode(),
+        f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode(),
+        f"Content-Type: {content_type}\r\n\r\n".encode(),
+        content,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ]
+    return b"".join(body), f"multipart/form-data; boundary={boundary}"
@@ -0,0 +1,280 @@
+"""Load test: every route of main.py, one scenario after the other, at a fixed concurrency.
+
+Each scenario sends `requests` requests from `concurrency` concurrent clients and records their
+latencies and status codes. The SQL statements per request come from the per request counts
+that db.metrics collects. Write scenarios act as the owner of what they write; the delete
+scenarios delete what the create scenarios before them created, so every run leaves the seeded
+rows intact.
+"""
+import asyncio
+import os
+import platform
+import sqlite3
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from db import metrics
+from db.storage import blob_store
+
+from .asgi import Client, Response, multipart
+from .seed import BASE_DATE, CENTER, FUTURE_DATE, PNG, WORDS, Volumes, email, seeded_share
+from .workspace import git_revision
+
+BULK_ITEMS = 10
+AVAILABILITY_GOODS = 20
+# flags that change what is measured, recorded with the results
+SETTINGS = ("FAST_JSON", "RESPONSE_CACHE", "RESPONSE_CACHE_URL", "DB_WRITE_QUEUE", "SQLITE_TUNING", "DB_POOL_SIZE", "IMAGE_WORKERS")
+
+
+class Bench:
+    """What the scenarios share: the seeded volumes and the ids the create scenarios collected."""
+
+    def __init__(self, volumes: Volumes):
+        self.volumes = volumes
+        self.digest = blob_store.put(PNG)
+        self.pools: Dict[str, list] = {}
+
+    def user(self, i: int) -> int:
+        return i % self.volumes.users + 1
+
+    def as_user(self, i: int, **params) -> dict:
+        return dict(params, email=email(self.user(i)))
+
+    def owned(self, i: int, total: int, k: int = 0) -> int:
+        """A seeded row id out of `total` that belongs to user(i); different ones for growing i and k."""
+        u, users = self.user(i), self.volumes.users
+        count = (total - u) // users + 1
+        return u + (i // users + k) % count * users
+
+    def collect(self, pool: str, item) -> None:
+        self.pools.setdefault(pool, []).append(item)
+
+
+class Scenario(NamedTuple):
+    name: str
+    method: str
+    # (bench, i, pool item) -> keyword arguments of Client.request
+    build: Callable[[Bench, int, object], dict]
+    # (bench, i, response) of successful requests, to remember what was created
+    collect: Optional[Callable[[Bench, int, Response], None]] = None
+    # the requests are spread over the items of this pool, each item is used once if `consume`
+    pool: Optional[str] = None
+    consume: bool = True
+    scale: float = 1.0
+
+
+def iso(dt) -> str:
+    return dt.isoformat()
+
+
+def good_body(i: int) -> dict:
+    return {"title": f"{WORDS[i % len(WORDS)]} {i}", "description": " ".join(WORDS[i % 7:i % 7 + 5]), "location_id": None}
+
+
+def location_body(i: int) -> dict:
+    return {"name": f"bench location {i}", "zip": "10115", "city": "Berlin", "address": f"Bench street {i}", "lat": CENTER[0], "lon": CENTER[1]}
+
+
+def image_body(i: int) -> dict:
+    return {"name": f"bench {i}.png", "url": None, "mime_type": "image/png", "good_id": None, "share_id": None}
+
+
+def share_body(b: Bench, share_id: int) -> dict:
+    share = seeded_share(share_id, b.volumes)
+    return {"id": share_id, "good_id": share["good_id"], "start_date": iso(share["start_date"]), "planned_end_date": iso(share["planned_end_date"]), "end_date": iso(share["end_date"]), "location_id": None}
+
+
+def new_share_body(b: Bench, n: int) -> dict:
+    # an hour on its own day, so no two created shares and no seeded share overlap
+    start = FUTURE_DATE + timedelta(days=n)
+    return {"good_id": n % b.volumes.goods + 1, "start_date": iso(start), "planned_end_date": iso(start + timedelta(hours=1)), "location_id": None}
+
+
+def owner_items(b: Bench, i: int, total: int, body: Callable[[int], dict]) -> List[dict]:
+    return [dict(body(i * BULK_ITEMS + k), id=b.owned(i, total, k)) for k in range(BULK_ITEMS)]
+
+
+def collect_id(pool: str):
+    return lambda b, i, res: b.collect(pool, (email(b.user(i)), res.json()["id"]))
+
+
+def collect_ids(pool: str):
+    return lambda b, i, res: b.collect(pool, (email(b.user(i)), [item["id"] for item in res.json()["items"] if item["id"]]))
+
+
+def by_owner(path: str):
+    """Delete one collected (email, id) item."""
+    return lambda b, i, item: dict(path=path.format(item[1]), params={"email": item[0]})
+
+
+def by_owner_bulk(b: Bench, i: int, item) -> dict:
+    return dict(params={"email": item[0]}, json_body=item[1])
+
+
+def upload_content(b: Bench, i: int, item) -> dict:
+    body, content_type = multipart("file", "bench.png", PNG, "image/png")
+    return dict(path=f"/upload/images/{b.owned(i, b.volumes.images)}", params=b.as_user(i), headers={"content-type": content_type}, body=body)
+
+
+def patch_upload(b: Bench, i: int, item) -> dict:
+    headers = {"content-type": "application/offset+octet-stream", "upload-offset": "0", "tus-resumable": "1.0.0"}
+    return dict(path=item[1], params={"email": item[0]}, headers=headers, body=PNG)
+
+
+SCENARIOS: List[Scenario] = [
+    # reads
+    Scenario("GET /metrics", "GET", lambda b, i, _: dict(path="/metrics")),
+    Scenario("GET /users/", "GET", lambda b, i, _: dict(path="/users/", params=b.as_user(i, limit=20))),
+    Scenario("GET /users/?fields=id,name", "GET", lambda b, i, _: dict(path="/users/", params=b.as_user(i, limit=20, fields="id,name"))),
+    Scenario("GET /users/me", "GET", lambda b, i, _: dict(path="/users/me", params=b.as_user(i))),
+    Scenario("GET /users/{user_id}", "GET", lambda b, i, _: dict(path=f"/users/{b.user(i)}", params=b.as_user(i + 1))),
+    Scenario("GET /goods/", "GET", lambda b, i, _: dict(path="/goods/", params={"skip": i % 10 * 100})),
+    Scenario("GET /goods/?fields=id,title", "GET", lambda b, i, _: dict(path="/goods/", params={"skip": i % 10 * 100, "fields": "id,title"})),
+    Scenario("GET /goods/?q=", "GET", lambda b, i, _: dict(path="/goods/", params={"q": WORDS[i % len(WORDS)], "limit": 20})),
+    Scenario("GET /goods/nearby", "GET", lambda b, i, _: dict(path="/goods/nearby", params={"lat": CENTER[0], "lon": CENTER[1], "radius_km": 5, "limit": 20})),
+    Scenario("GET /goods/export", "GET", lambda b, i, _: dict(path="/goods/export"), scale=0.1),
+    Scenario("GET /goods/availability", "GET", lambda b, i, _: dict(path="/goods/availability", params=[("good_id", (i * AVAILABILITY_GOODS + k) % b.volumes.goods + 1) for k in range(AVAILABILITY_GOODS)] + [("from", iso(BASE_DATE)), ("to", iso(BASE_DATE + timedelta(days=30)))])),
+    Scenario("GET /goods/{good_id}/availability", "GET", lambda b, i, _: dict(path=f"/goods/{i % b.volumes.goods + 1}/availability", params={"from": iso(BASE_DATE)})),
+    Scenario("GET /locations/", "GET", lambda b, i, _: dict(path="/locations/", params=b.as_user(i))),
+    Scenario("GET /shares/", "GET", lambda b, i, _: dict(path="/shares/", params=b.as_user(i))),
+    Scenario("GET /shares/export", "GET", lambda b, i, _: dict(path="/shares/export", params=b.as_user(i)), scale=0.1),
+    Scenario("GET /images/", "GET", lambda b, i, _: dict(path="/images/", params=b.as_user(i))),
+    Scenario("GET /images/{image_id}", "GET", lambda b, i, _: dict(path=f"/images/{i % b.volumes.images + 1}", params=b.as_user(i))),
+    Scenario("GET /images/{image_id} If-None-Match", "GET", lambda b, i, _: dict(path=f"/images/{i % b.volumes.images + 1}", params=b.as_user(i), headers={"if-none-match": f'"{b.digest}"'})),
+    # creates and updates
+    Scenario("POST /users/", "POST", lambda b, i, _: dict(path="/users/", json_body={"name": f"bench{i}", "email": f"bench{i}@example.com"}), lambda b, i, res: b.collect("users", (f"bench{i}@example.com", res.json()["id"]))),
+    Scenario("PUT /users/{user_id}", "PUT", lambda b, i, _: dict(path=f"/users/{b.user(i)}", params=b.as_user(i), json_body={"name": f"user{b.user(i)}", "is_active": True, "public": True})),
+    Scenario("PATCH /users/{user_id}", "PATCH", lambda b, i, _: dict(path=f"/users/{b.user(i)}", params=b.as_user(i), json_body={"public": True})),
+    Scenario("POST /users/{user_id}/goods/", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/goods/", params=b.as_user(i), json_body=good_body(i)), collect_id("goods")),
+    Scenario("POST /users/{user_id}/goods/bulk", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/goods/bulk", params=b.as_user(i), json_body=[good_body(i * BULK_ITEMS + k) for k in range(BULK_ITEMS)]), collect_ids("goods_bulk")),
+    Scenario("PUT /goods/bulk", "PUT", lambda b, i, _: dict(path="/goods/bulk", params=b.as_user(i), json_body=owner_items(b, i, b.volumes.goods, good_body))),
+    Scenario("PUT /goods/{good_id}", "PUT", lambda b, i, _: dict(path=f"/goods/{b.owned(i, b.volumes.goods)}", params=b.as_user(i), json_body=good_body(i))),
+    Scenario("PATCH /goods/{good_id}", "PATCH", lambda b, i, _: dict(path=f"/goods/{b.owned(i, b.volumes.goods)}", params=b.as_user(i), json_body={"description": good_body(i)["description"]})),
+    Scenario("POST /users/{user_id}/locations/", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/locations/", params=b.as_user(i), json_body=location_body(i)), collect_id("locations")),
+    Scenario("POST /users/{user_id}/locations/bulk", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/locations/bulk", params=b.as_user(i), json_body=[location_body(i * BULK_ITEMS + k) for k in range(BULK_ITEMS)]), collect_ids("locations_bulk")),
+    Scenario("PUT /locations/bulk", "PUT", lambda b, i, _: dict(path="/locations/bulk", params=b.as_user(i), json_body=owner_items(b, i, b.volumes.locations, lambda n: dict(location_body(n), public=True)))),
+    Scenario("PUT /locations/{location_id}", "PUT", lambda b, i, _: dict(path=f"/locations/{b.owned(i, b.volumes.locations)}", params=b.as_user(i), json_body=dict(location_body(i), public=True))),
+    Scenario("PATCH /locations/{location_id}", "PATCH", lambda b, i, _: dict(path=f"/locations/{b.owned(i, b.volumes.locations)}", params=b.as_user(i), json_body={"city": "Berlin"})),
+    Scenario("POST /users/{user_id}/shares/", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/shares/", params=b.as_user(i), json_body=new_share_body(b, 2 * i)), collect_id("shares")),
+    Scenario("POST /users/{user_id}/shares/bulk", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/shares/bulk", params=b.as_user(i), json_body=[new_share_body(b, 2 * (i * BULK_ITEMS + k) + 1) for k in range(BULK_ITEMS)]), collect_ids("shares_bulk")),
+    Scenario("PUT /shares/bulk", "PUT", lambda b, i, _: dict(path="/shares/bulk", params=b.as_user(i), json_body=[share_body(b, b.owned(i, b.volumes.shares, k)) for k in range(BULK_ITEMS)])),
+    Scenario("PUT /shares/{share_id}", "PUT", lambda b, i, _: dict(path=f"/shares/{b.owned(i, b.volumes.shares)}", params=b.as_user(i), json_body=share_body(b, b.owned(i, b.volumes.shares)))),
+    Scenario("PATCH /shares/{share_id}", "PATCH", lambda b, i, _: dict(path=f"/shares/{b.owned(i, b.volumes.shares)}", params=b.as_user(i), json_body={"planned_end_date": share_body(b, b.owned(i, b.volumes.shares))["planned_end_date"]})),
+    Scenario("POST /users/{user_id}/images/", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/images/", params=b.as_user(i), json_body=image_body(i)), collect_id("images")),
+    Scenario("POST /users/{user_id}/images/bulk", "POST", lambda b, i, _: dict(path=f"/users/{b.user(i)}/images/bulk", params=b.as_user(i), json_body=[image_body(i * BULK_ITEMS + k) for k in range(BULK_ITEMS)]), collect_ids("images_bulk")),
+    Scenario("PUT /images/bulk", "PUT", lambda b, i, _: dict(path="/images/bulk", params=b.as_user(i), json_body=owner_items(b, i, b.volumes.images, image_body))),
+    Scenario("PUT /images/{image_id}", "PUT", lambda b, i, _: dict(path=f"/images/{b.owned(i, b.volumes.images)}", params=b.as_user(i), json_body=image_body(i))),
+    Scenario("PATCH /images/{image_id}", "PATCH", lambda b, i, _: dict(path=f"/images/{b.owned(i, b.volumes.images)}", params=b.as_user(i), json_body={"name": image_body(i)["name"]})),
+    Scenario("POST /upload/images/{image_id}", "POST", upload_content),
+    Scenario("POST /upload/images/{image_id}/resumable", "POST", lambda b, i, _: dict(path=f"/upload/images/{b.owned(i, b.volumes.images)}/resumable", params=b.as_user(i), headers={"upload-length": str(len(PNG)), "tus-resumable": "1.0.0"}), lambda b, i, res: b.collect("uploads", (email(b.user(i)), res.headers["location"])), scale=2),
+    Scenario("HEAD /upload/resumable/{upload_id}", "HEAD", lambda b, i, item: dict(path=item[1], params={"email": item[0]}, headers={"tus-resumable": "1.0.0"}), pool="uploads", consume=False),
+    Scenario("PATCH /upload/resumable/{upload_id}", "PATCH", patch_upload, pool="uploads"),
+    Scenario("DELETE /upload/resumable/{upload_id}", "DELETE", lambda b, i, item: dict(path=item[1], params={"email": item[0]}, headers={"tus-resumable": "1.0.0"}), pool="uploads"),
+    # deletes of what was created above
+    Scenario("DELETE /goods/bulk", "DELETE", lambda b, i, item: dict(path="/goods/bulk", **by_owner_bulk(b, i, item)), pool="goods_bulk"),
+    Scenario("DELETE /goods/{good_id}", "DELETE", by_owner("/goods/{}"), pool="goods"),
+    Scenario("DELETE /locations/bulk", "DELETE", lambda b, i, item: dict(path="/locations/bulk", **by_owner_bulk(b, i, item)), pool="locations_bulk"),
+    Scenario("DELETE /location/{location_id}", "DELETE", by_owner("/location/{}"), pool="locations"),
+    Scenario("DELETE /shares/bulk", "DELETE", lambda b, i, item: dict(path="/shares/bulk", **by_owner_bulk(b, i, item)), pool="shares_bulk"),
+    Scenario("DELETE /share/{share_id}", "DELETE", by_owner("/share/{}"), pool="shares"),
+    Scenario("DELETE /images/bulk", "DELETE", lambda b, i, item: dict(path="/images/bulk", **by_owner_bulk(b, i, item)), pool="images_bulk"),
+    Scenario("DELETE /images/{image_id}", "DELETE", by_owner("/images/{}"), pool="images"),
+    Scenario("DELETE /users/{user_id}", "DELETE", by_owner("/users/{}"), pool="users"),
+]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest rank percentile of sorted `values`."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values) + 0.5) - 1))]
+
+
+class Result(NamedTuple):
+    requests: int
+    seconds: float
+    latencies: List[float]
+    statuses: Dict[int, int]
+    sql_statements: float
+
+    def report(self) -> dict:
+        latencies = sorted(self.latencies)
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            "requests": self.requests,
+            "status": {str(status): n for status, n in sorted(self.statuses.items())},
+            "rps": round(self.requests / self.seconds, 1) if self.seconds else 0.0,
+            "p50_ms": ms(percentile(latencies, 50)),
+            "p90_ms": ms(percentile(latencies, 90)),
+            "p99_ms": ms(percentile(latencies, 99)),
+            "max_ms": ms(latencies[-1]) if latencies else 0.0,
+            "sql_per_request": round(self.sql_statements / self.requests, 2) if self.requests else 0.0,
+        }
+
+
+async def run_scenario(client: Client, bench: Bench, scenario: Scenario, requests: int, concurrency: int, warmup: int = 0) -> Result:
+    count = max(1, round(requests * scenario.scale))
+    items: list = [None] * count
+    if scenario.pool is not None:
+        pool = bench.pools.get(scenario.pool, [])
+        if scenario.consume:
+            count = min(count, len(pool))
+            items = [pool.pop() for _ in range(count)]
+        else:
+            items = [pool[i % len(pool)] for i in range(count)] if pool else []
+            count = len(items)
+    elif scenario.method == "GET":
+        for i in range(warmup):
+            await send(client, bench, scenario, i, None)
+
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    todo = iter(range(count))
+
+    async def worker():
+        for i in todo:
+            start = time.perf_counter()
+            res = await send(client, bench, scenario, i, items[i])
+            latencies.append(time.perf_counter() - start)
+            statuses[res.status] += 1
+            if scenario.collect is not None and res.status < 400:
+                scenario.collect(bench, i, res)
+
+    statements, _ = metrics.DB_STATEMENTS.total()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, count))))
+    seconds = time.perf_counter() - start
+    return Result(count, seconds, latencies, dict(statuses), metrics.DB_STATEMENTS.total()[0] - statements)
+
+
+async def send(client: Client, bench: Bench, scenario: Scenario, i: int, item) -> Response:
+    return await client.request(scenario.method, **scenario.build(bench, i, item))
+
+
+async def run(volumes: Volumes, requests: int = 200, concurrency: int = 10, warmup: int = 10, only: Optional[str] = None) -> dict:
+    from main import app
+    client = Client(app)
+    bench = Bench(volumes)
+    scenarios = [s for s in SCENARIOS if only is None or only in s.name]
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "volumes": volumes._asdict(),
+            "requests": requests,
+            "concurrency": concurrency,
+            "settings": {name: os.environ[name] for name in SETTINGS if name in os.environ},
+        },
+        "scenarios": {},
+    }
+    await client.startup()
+    try:
+        for scenario in scenarios:
+            result = await run_scenario(client, bench, scenario, requests, concurrency, warmup)
+            report["scenarios"][scenario.name] = result.report()
+    finally:
+        await client.shutdown()
+    return report
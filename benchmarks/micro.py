@@ -0,0 +1,97 @@
+"""Microbenchmarks: serialization of schemas.User and the query functions of db/crud.py.
+
+Every query runs in a fresh session, like it does per request, so nothing is served from the
+identity map of the previous call.
+"""
+import platform
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List, Optional
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import parse_obj_as
+
+from db import crud, schemas, serializer
+from db.database import SessionLocal, engine
+from db.querycount import QueryCounter
+
+from .seed import BASE_DATE, CENTER, WORDS, Volumes, email
+from .workspace import git_revision
+
+
+def timeit(fn: Callable[[], object], number: int, repeat: int = 5) -> Dict[str, float]:
+    """Per call microseconds: the best of `repeat` rounds and their mean."""
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        rounds.append((time.perf_counter() - start) / number * 1e6)
+    return {"best_us": round(min(rounds), 1), "mean_us": round(sum(rounds) / len(rounds), 1)}
+
+
+def response_model_json(schema, obj) -> bytes:
+    """What FastAPI does with a response_model: validate, jsonable_encoder, json.dumps."""
+    return JSONResponse(jsonable_encoder(parse_obj_as(List[schema] if isinstance(obj, list) else schema, obj))).body
+
+
+def serialization(volumes: Volumes, number: int) -> Dict[str, dict]:
+    db = SessionLocal()
+    try:
+        current_user = crud.resolve_user(db, email(1))
+        user = crud.get_user(db, current_user, user_id=1)
+        users = crud.get_users(db, current_user, limit=20)
+        results = {}
+        for name, obj in (("User", user), ("List[User] x20", users)):
+            size = len(response_model_json(schemas.User, obj))
+            results[f"{name} response_model"] = dict(timeit(lambda: response_model_json(schemas.User, obj), number), bytes=size)
+            results[f"{name} serializer{'+orjson' if serializer.orjson else ''}"] = dict(timeit(lambda: serializer.serialize(schemas.User, obj), number), bytes=size)
+            results[f"{name} validation only"] = timeit(lambda: parse_obj_as(List[schemas.User] if isinstance(obj, list) else schemas.User, obj), number)
+        return results
+    finally:
+        db.close()
+
+
+def queries(volumes: Volumes, number: int) -> Dict[str, dict]:
+    db = SessionLocal()
+    current_user = crud.resolve_user(db, email(1))
+    db.close()
+    good_ids = list(range(1, min(volumes.goods, 20) + 1))
+    cases = {
+        "resolve_user": lambda db: crud.resolve_user(db, email(1)),
+        "get_user": lambda db: crud.get_user(db, current_user, user_id=1),
+        "get_user_by_email": lambda db: crud.get_user_by_email(db, email(1)),
+        "get_users limit=20": lambda db: crud.get_users(db, current_user, limit=20),
+        "get_users limit=20 fields=id,name": lambda db: crud.get_users(db, current_user, limit=20, fields=("id", "name")),
+        "get_goods": lambda db: crud.get_goods(db, q=None),
+        "get_goods skip=1000": lambda db: crud.get_goods(db, skip=1000, q=None),
+        "get_goods after=1000": lambda db: crud.get_goods(db, after=1000, q=None),
+        "get_goods q": lambda db: crud.get_goods(db, q=WORDS[0], limit=20),
+        "get_goods_nearby": lambda db: crud.get_goods_nearby(db, CENTER[0], CENTER[1], 5, limit=20),
+        "get_locations": lambda db: crud.get_locations(db, current_user),
+        "get_shares": lambda db: crud.get_shares(db, current_user),
+        "get_images": lambda db: crud.get_images(db, current_user),
+        "get_image": lambda db: crud.get_image(db, current_user, image_id=1),
+        "get_availability x20": lambda db: crud.get_availability(db, good_ids, BASE_DATE, BASE_DATE + timedelta(days=30)),
+    }
+    results = {}
+    for name, query in cases.items():
+        def call():
+            db = SessionLocal()
+            try:
+                query(db)
+            finally:
+                db.close()
+        with QueryCounter(engine) as counter:
+            call()
+        results[name] = dict(timeit(call, number), sql_statements=counter.count)
+    return results
+
+
+def run(volumes: Volumes, number: int = 100, only: Optional[str] = None) -> dict:
+    results = {"serialization": serialization(volumes, number), "queries": queries(volumes, number)}
+    if only is not None:
+        results = {group: {name: r for name, r in cases.items() if only in name} for group, cases in results.items()}
+    meta = {"revision": git_revision(), "python": platform.python_version(), "volumes": volumes._asdict(), "number": number, "orjson": serializer.orjson is not None}
+    return dict(meta=meta, **results)
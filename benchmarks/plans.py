@@ -0,0 +1,103 @@
+"""Query plan check: EXPLAIN every SQL statement the routes run and fail on full table scans.
+
+Every load scenario runs a few requests, one at a time, while the statements they send are
+collected with the parameters of their first run. Each distinct statement is then explained on
+the sync engine: EXPLAIN QUERY PLAN on SQLite, EXPLAIN with sequential scans disabled on
+Postgres, so a Seq Scan left in the plan means no index can serve it. A scan is reported with
+the scenarios that ran the statement, unless ALLOWED_SCANS says reading the whole table is what
+the scenario asks for.
+"""
+import re
+from typing import Dict, List, NamedTuple, Set, Tuple
+
+from sqlalchemy import event
+
+from db.database import async_engine, engine
+from db.models import Base
+
+from .asgi import Client
+from .load import SCENARIOS, Bench, run_scenario
+from .seed import Volumes
+
+# (scenario, table) pairs where a scan of the table is expected
+ALLOWED_SCANS = {
+    # unfiltered pages in primary key order, SQLite walks the table b-tree and stops at the limit
+    ("GET /users/", "users"),
+    ("GET /users/?fields=id,name", "users"),
+    ("GET /goods/", "goods"),
+    ("GET /goods/?fields=id,title", "goods"),
+    # all goods
+    ("GET /goods/export", "goods"),
+}
+
+STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class Scan(NamedTuple):
+    table: str
+    statement: str
+    plan: List[str]
+    scenarios: List[str]
+
+
+class StatementLog:
+    """The distinct statements run on the engines, with their first parameters and the scenarios that ran them."""
+
+    def __init__(self):
+        self.scenario = None
+        self.statements: Dict[str, Tuple[object, Set[str]]] = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.scenario is None or not statement.lstrip().upper().startswith(STATEMENTS):
+            return
+        if executemany:
+            parameters = parameters[0]
+        self.statements.setdefault(statement, (parameters, set()))[1].add(self.scenario)
+
+
+def explain(statement: str, parameters) -> List[str]:
+    with engine.connect() as conn, conn.begin():
+        if conn.dialect.name == "sqlite":
+            return [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)]
+        conn.exec_driver_sql("SET LOCAL enable_seqscan = off")
+        return [row[0] for row in conn.exec_driver_sql("EXPLAIN " + statement, parameters)]
+
+
+def scanned_tables(plan: List[str]) -> Set[str]:
+    tables = set(Base.metadata.tables)
+    scanned = set()
+    for line in plan:
+        # SQLite: "SCAN goods", "SCAN goods USING INDEX ...", but not "SCAN goods_fts VIRTUAL TABLE ..."
+        # Postgres: "Seq Scan on goods"
+        match = re.match(r"\s*(?:->\s*)?(?:SCAN|Seq Scan on) (\w+)", line)
+        if match and match.group(1) in tables and "VIRTUAL TABLE" not in line:
+            scanned.add(match.group(1))
+    return scanned
+
+
+async def run(volumes: Volumes, requests: int = 3) -> List[Scan]:
+    from main import app
+    client = Client(app)
+    bench = Bench(volumes)
+    log = StatementLog()
+    for e in (engine, async_engine.sync_engine):
+        event.listen(e, "before_cursor_execute", log)
+    await client.startup()
+    try:
+        for scenario in SCENARIOS:
+            log.scenario = scenario.name
+            await run_scenario(client, bench, scenario, requests, concurrency=1)
+            log.scenario = None
+    finally:
+        await client.shutdown()
+        for e in (engine, async_engine.sync_engine):
+            event.remove(e, "before_cursor_execute", log)
+
+    scans = []
+    for statement, (parameters, scenarios) in log.statements.items():
+        plan = explain(statement, parameters)
+        for table in sorted(scanned_tables(plan)):
+            unexpected = sorted(s for s in scenarios if (s, table) not in ALLOWED_SCANS)
+            if unexpected:
+                scans.append(Scan(table, statement, plan, unexpected))
+    return scans
@@ -0,0 +1,193 @@
+"""Throughput scaling: the read routes served by server.py with 1, 2, 4, ... worker processes.
+
+Unlike `load`, this goes through real sockets. For every worker count, server.py is started on
+the seeded working directory and `clients` load generator processes, each with `connections`
+keep-alive HTTP/1.1 connections, send the read scenarios of load.py round robin for `duration`
+seconds, after `warmup` seconds that are not counted. The report has throughput, latency
+percentiles and the speedup over one worker for each count. The load generators share the
+CPUs with the server, so the speedup stays below the worker count even where the API scales.
+"""
+import asyncio
+import multiprocessing
+import os
+import platform
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+
+from .asgi import Response
+from .load import SCENARIOS, SETTINGS, Bench, percentile
+from .seed import Volumes
+from .workspace import REPO_ROOT, git_revision
+
+
+def read_scenarios(only: Optional[str] = None):
+    """The GET scenarios of load.py that neither depend on earlier writes nor stream exports."""
+    return [s for s in SCENARIOS if s.method == "GET" and s.pool is None and s.scale == 1 and s.name != "GET /metrics" and (only is None or only in s.name)]
+
+
+class Connection:
+    """One keep-alive HTTP/1.1 connection, just enough of the protocol for the API's responses."""
+
+    def __init__(self, host: str, port: int):
+        self.host, self.port = host, port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, method: str, path: str, params=None, headers: Optional[Dict[str, str]] = None) -> Response:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        target = path + ("?" + urlencode(params, doseq=True) if params else "")
+        lines = [f"{method} {target} HTTP/1.1", f"host: {self.host}:{self.port}", "content-length: 0"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+        head = (await self.reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+        status = int(head[0].split(" ", 2)[1])
+        response_headers = dict((k.strip().lower(), v.strip()) for k, v in (line.split(":", 1) for line in head[1:] if line))
+        if response_headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunks.append((await self.reader.readexactly(size + 2))[:size])
+                if not size:
+                    break
+            body = b"".join(chunks)
+        else:
+            body = await self.reader.readexactly(int(response_headers.get("content-length", "0")))
+        if response_headers.get("connection") == "close":
+            self.close()
+        return Response(status, response_headers, body)
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+
+async def generate(port: int, volumes: Volumes, offset: int, connections: int, warmup: float, duration: float, only: Optional[str]) -> Tuple[List[float], Dict[int, int], int]:
+    """Send requests on `connections` connections until the time is up; (latencies, statuses, errors) of the timed ones."""
+    bench = Bench(volumes)
+    scenarios = read_scenarios(only)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    errors = 0
+    start = time.perf_counter() + warmup
+    end = start + duration
+    counter = iter(range(offset, sys.maxsize))
+
+    async def worker():
+        nonlocal errors
+        connection = Connection("127.0.0.1", port)
+        try:
+            for i in counter:
+                scenario = scenarios[i % len(scenarios)]
+                sent = time.perf_counter()
+                if sent >= end:
+                    return
+                try:
+                    res = await connection.request(scenario.method, **scenario.build(bench, i // len(scenarios), None))
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    connection.close()
+                    errors += sent >= start
+                    continue
+                if sent >= start:
+                    latencies.append(time.perf_counter() - sent)
+                    statuses[res.status] += 1
+        finally:
+            connection.close()
+
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return latencies, dict(statuses), errors
+
+
+def generator(*args) -> Tuple[List[float], Dict[int, int], int]:
+    return asyncio.run(generate(*args))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(server: subprocess.Popen, port: int, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"server.py exited with {server.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as s:
+                s.sendall(b"GET /metrics HTTP/1.1\r\nhost: bench\r\nconnection: close\r\n\r\n")
+                if s.recv(12).startswith(b"HTTP/1.1 200"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server.py did not start")
+
+
+def measure(workers: int, volumes: Volumes, clients: int, connections: int, warmup: float, duration: float, only: Optional[str]) -> dict:
+    port = free_port()
+    command = [sys.executable, os.path.join(REPO_ROOT, "server.py"), "--workers", str(workers), "--port", str(port), "--log-level", "warning"]
+    server = subprocess.Popen(command, cwd=os.getcwd())
+    try:
+        wait_ready(server, port)
+        # far apart offsets, so the clients ask for different rows
+        args = [(port, volumes, n * 1_000_000, connections, warmup, duration, only) for n in range(clients)]
+        with multiprocessing.get_context("spawn").Pool(clients) as pool:
+            results = pool.starmap(generator, args)
+    finally:
+        server.terminate()
+        server.wait(30)
+    latencies = sorted(latency for result in results for latency in result[0])
+    statuses: Counter = Counter()
+    for result in results:
+        statuses.update(result[1])
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        "requests": len(latencies),
+        "status": {str(status): n for status, n in sorted(statuses.items())},
+        "errors": sum(result[2] for result in results),
+        "rps": round(len(latencies) / duration, 1),
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p90_ms": ms(percentile(latencies, 90)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1]) if latencies else 0.0,
+    }
+
+
+def worker_counts(maximum: int) -> List[int]:
+    """1, 2, 4, ... up to and including `maximum`."""
+    counts = [1]
+    while counts[-1] * 2 < maximum:
+        counts.append(counts[-1] * 2)
+    return counts + [maximum] if maximum > 1 else counts
+
+
+def run(volumes: Volumes, workers: List[int], clients: int, connections: int, warmup: float, duration: float, only: Optional[str] = None) -> dict:
+    report = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "cpu_count": os.cpu_count(),
+            "volumes": volumes._asdict(),
+            "clients": clients,
+            "connections": connections,
+            "duration": duration,
+            "scenarios": [s.name for s in read_scenarios(only)],
+            "settings": {name: os.environ[name] for name in SETTINGS if name in os.environ},
+        },
+        "workers": {},
+    }
+    for count in workers:
+        result = measure(count, volumes, clients, connections, warmup, duration, only)
+        base = report["workers"].get("1", result)["rps"]
+        result["speedup"] = round(result["rps"] / base, 2) if base else 0.0
+        report["workers"][str(count)] = result
+    return report
@@ -0,0 +1,92 @@
+"""Deterministic test data, inserted through the models.
+
+Rows get consecutive ids from 1 and are spread over the users round robin, so the scenarios can
+compute which user owns what (`owner`, `email`, `seeded_share`) instead of querying for it.
+Every seeded image points at the same tiny PNG in the blob store.
+"""
+import base64
+import random
+from datetime import datetime, timedelta
+from typing import NamedTuple
+
+from sqlalchemy import text
+
+from db import models
+from db.database import SessionLocal
+from db.storage import blob_store
+
+BASE_DATE = datetime(2020, 1, 1)
+# shares written by the benchmarks start here, after all seeded ones
+FUTURE_DATE = datetime(2100, 1, 1)
+CENTER = (52.52, 13.405)
+
+PNG = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAIAAACQd1PeAAAADElEQVR4nGP4z8AAAAMBAQDJ/pLvAAAAAElFTkSuQmCC")
+
+WORDS = ["drill", "ladder", "tent", "bike", "kayak", "projector", "sewing", "machine", "camera", "lawn",
+         "mower", "saw", "grill", "speaker", "board", "game", "trailer", "canoe", "hammer", "table"]
+
+CHUNK_SIZE = 10000
+
+
+class Volumes(NamedTuple):
+    users: int = 100
+    locations: int = 200
+    goods: int = 2000
+    shares: int = 4000
+    images: int = 1000
+
+
+def email(user_id: int) -> str:
+    return f"user{user_id}@example.com"
+
+
+def owner(row_id: int, volumes: Volumes) -> int:
+    return (row_id - 1) % volumes.users + 1
+
+
+def seeded_share(share_id: int, volumes: Volumes) -> dict:
+    """The share row with this id; the shares of a good follow each other two days apart."""
+    good_id = (share_id - 1) % volumes.goods + 1
+    start = BASE_DATE + timedelta(days=2 * ((share_id - 1) // volumes.goods))
+    end = start + timedelta(days=1)
+    return dict(id=share_id, user_id=owner(share_id, volumes), good_id=good_id, start_date=start, planned_end_date=end, end_date=end, location_id=None)
+
+
+def _insert(db, model, rows) -> None:
+    for i in range(0, len(rows), CHUNK_SIZE):
+        db.bulk_insert_mappings(model, rows[i:i + CHUNK_SIZE])
+
+
+def seed(volumes: Volumes, rng_seed: int = 0) -> None:
+    rng = random.Random(rng_seed)
+    digest = blob_store.put(PNG)
+    db = SessionLocal()
+    try:
+        _insert(db, models.User, [
+            dict(id=i, name=f"user{i}", email=email(i), hashed_password="notreallyhashed", is_active=True, public=True)
+            for i in range(1, volumes.users + 1)
+        ])
+        _insert(db, models.Location, [
+            dict(id=i, user_id=owner(i, volumes), name=f"location {i}", public=True, zip=f"{10000 + i % 90000}", city="Berlin", address=f"Street {i}",
+                 lat=CENTER[0] + rng.uniform(-0.2, 0.2), lon=CENTER[1] + rng.uniform(-0.3, 0.3))
+            for i in range(1, volumes.locations + 1)
+        ])
+        _insert(db, models.Good, [
+            dict(id=i, owner_id=owner(i, volumes), location_id=(i - 1) % volumes.locations + 1 if volumes.locations else None,
+                 title=" ".join(rng.sample(WORDS, 2)), description=" ".join(rng.choices(WORDS, k=8)))
+            for i in range(1, volumes.goods + 1)
+        ])
+        _insert(db, models.Share, [seeded_share(i, volumes) for i in range(1, volumes.shares + 1)])
+        _insert(db, models.Image, [
+            dict(id=i, user_id=owner(i, volumes), name=f"image {i}.png", mime_type="image/png", digest=digest, size=len(PNG), updated_at=BASE_DATE,
+                 good_id=(i - 1) % volumes.goods + 1 if volumes.goods else None)
+            for i in range(1, volumes.images + 1)
+        ])
+        if db.get_bind().dialect.name == "postgresql":
+            # the ids above were explicit, move the sequences past them
+            for model in (models.User, models.Location, models.Good, models.Share, models.Image):
+                table = model.__tablename__
+                db.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), coalesce(max(id), 0) + 1, false) FROM {table}"))
+        db.commit()
+    finally:
+        db.close()
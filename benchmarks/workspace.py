@@ -0,0 +1,38 @@
+"""A throwaway working directory with a freshly migrated database.
+
+db/database.py and the blob store use paths relative to the working directory (./database.db,
+./blobs), so the benchmarks chdir into a temporary directory before anything touches them and
+migrate it with the repo's alembic setup.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def prepare(path: Optional[str] = None) -> str:
+    """chdir into `path` (a new temporary directory by default) and migrate its database to head."""
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    path = path or tempfile.mkdtemp(prefix="sharegut-bench-")
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    from alembic import command
+    from alembic.config import Config
+    config = Config(os.path.join(REPO_ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(REPO_ROOT, "db"))
+    command.upgrade(config, "head")
+    return path
+
+
+def git_revision() -> Optional[str]:
+    """The checked out commit, with -dirty when tracked files were changed."""
+    try:
+        revision = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return revision + ("-dirty" if dirty else "")
@@ -0,0 +1,265 @@
+"""Async versions of the functions in crud.py.
+
+Each one runs its sync counterpart on the AsyncSession through `run_sync`, so the query logic
+lives in one place. Results whose response model embeds relationships that are not eager
+loaded (fresh rows after a commit) are converted to the schema inside `run_sync`, where the
+remaining lazy loads can still reach the database. Writes go through the group-commit write
+queue instead when it is enabled (DB_WRITE_QUEUE=1). Writes to data that is embedded in
+cached responses invalidate the matching response cache tags.
+"""
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import crud, jobs, models, schemas
+from .responsecache import invalidates
+from .writequeue import write_queue
+
+
+def serialized(schema, fn):
+    def call(session, *args, **kwargs):
+        res = fn(session, *args, **kwargs)
+        if res is None:
+            return None
+        if isinstance(res, list):
+            return [schema.from_orm(r) for r in res]
+        return schema.from_orm(res)
+    return call
+
+
+async def run_write(db: AsyncSession, fn, *args, **kwargs):
+    if write_queue is not None:
+        return await write_queue.submit(fn, *args, **kwargs)
+    return await db.run_sync(fn, *args, **kwargs)
+
+
+async def resolve_user(db: AsyncSession, email: str):
+    return await db.run_sync(crud.resolve_user, email)
+
+
+async def get_user(db: AsyncSession, current_user: schemas.CurrentUser, user_id: int):
+    return await db.run_sync(crud.get_user, current_user, user_id)
+
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.run_sync(crud.get_user_by_email, email)
+
+
+async def get_user_by_name(db: AsyncSession, name: str):
+    return await db.run_sync(crud.get_user_by_name, name)
+
+
+async def get_users(db: AsyncSession, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    return await db.run_sync(crud.get_users, current_user, skip=skip, limit=limit, after=after, fields=fields)
+
+
+async def create_user(db: AsyncSession, user: schemas.UserCreate):
+    return await run_write(db, serialized(schemas.User, crud.create_user), user)
+
+
+async def get_goods(db: AsyncSession, skip: int = 0, limit: int = 100, q: str = "", after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    return await db.run_sync(crud.get_goods, skip=skip, limit=limit, q=q, after=after, fields=fields)
+
+
+async def get_goods_nearby(db: AsyncSession, lat: float, lon: float, radius_km: float, limit: int = 100, after=None):
+    return await db.run_sync(crud.get_goods_nearby, lat, lon, radius_km, limit=limit, after=after)
+
+
+@invalidates("goods")
+async def create_user_good(db: AsyncSession, current_user: schemas.CurrentUser, good: schemas.GoodCreate, user_id: int):
+    return await run_write(db, serialized(schemas.Good, crud.create_user_good), current_user, good=good, user_id=user_id)
+
+
+async def create_location(db: AsyncSession, current_user: schemas.CurrentUser, location: schemas.LocationCreate, user_id: int):
+    return await run_write(db, crud.create_location, current_user, location=location, user_id=user_id)
+
+
+async def get_locations(db: AsyncSession, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    return await db.run_sync(crud.get_locations, current_user, skip=skip, limit=limit, after=after, fields=fields)
+
+
+async def create_share(db: AsyncSession, current_user: schemas.CurrentUser, share: schemas.ShareCreate, user_id: int):
+    return await run_write(db, serialized(schemas.Share, crud.create_share), current_user, share=share, user_id=user_id)
+
+
+async def get_shares(db: AsyncSession, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[Tuple[datetime, int]] = None, fields: Optional[Sequence[str]] = None):
+    return await db.run_sync(crud.get_shares, current_user, skip=skip, limit=limit, after=after, fields=fields)
+
+
+async def get_availability(db: AsyncSession, good_ids: List[int], start: datetime, end: Optional[datetime] = None):
+    return await db.run_sync(crud.get_availability, good_ids, start, end)
+
+
+@invalidates("goods")
+async def create_image(db: AsyncSession, current_user: schemas.CurrentUser, image: schemas.ImageCreate, user_id: int):
+    return await run_write(db, crud.create_image, current_user, image=image, user_id=user_id)
+
+
+@invalidates("goods")
+async def add_image_file(db: AsyncSession, current_user: schemas.CurrentUser, image_id: int, digest: str, size: int):
+    return await run_write(db, crud.add_image_file, current_user, image_id=image_id, digest=digest, size=size)
+
+
+async def get_image(db: AsyncSession, current_user: schemas.CurrentUser, image_id: int):
+    return await db.run_sync(crud.get_image, current_user, image_id=image_id)
+
+
+async def update_user(db: AsyncSession, current_user: schemas.CurrentUser, user: schemas.UserUpdate, user_id: int):
+    return await run_write(db, serialized(schemas.User, crud.update_user), current_user, user, user_id)
+
+
+@invalidates("goods")
+async def update_good(db: AsyncSession, current_user: schemas.CurrentUser, good: schemas.GoodUpdate, good_id: int):
+    return await run_write(db, serialized(schemas.Good, crud.update_good), current_user, good=good, good_id=good_id)
+
+
+@invalidates("goods")
+async def update_image(db: AsyncSession, current_user: schemas.CurrentUser, image: schemas.ImageUpdate, image_id: int):
+    return await run_write(db, crud.update_image, current_user, image=image, image_id=image_id)
+
+
+async def update_share(db: AsyncSession, current_user: schemas.CurrentUser, share: schemas.ShareUpdate, share_id: int):
+    return await run_write(db, serialized(schemas.Share, crud.update_share), current_user, share=share, share_id=share_id)
+
+
+@invalidates("goods")
+async def update_location(db: AsyncSession, current_user: schemas.CurrentUser, location: schemas.LocationUpdate, location_id: int):
+    return await run_write(db, crud.update_location, current_user, location=location, location_id=location_id)
+
+
+async def patch_user(db: AsyncSession, current_user: schemas.CurrentUser, user: schemas.UserPatch, user_id: int, version: Optional[int] = None):
+    return await run_write(db, serialized(schemas.User, crud.patch_user), current_user, user, user_id, version)
+
+
+@invalidates("goods")
+async def patch_good(db: AsyncSession, current_user: schemas.CurrentUser, good: schemas.GoodPatch, good_id: int, version: Optional[int] = None):
+    return await run_write(db, serialized(schemas.Good, crud.patch_good), current_user, good=good, good_id=good_id, version=version)
+
+
+@invalidates("goods")
+async def patch_image(db: AsyncSession, current_user: schemas.CurrentUser, image: schemas.ImagePatch, image_id: int, version: Optional[int] = None):
+    return await run_write(db, crud.patch_image, current_user, image=image, image_id=image_id, version=version)
+
+
+async def patch_share(db: AsyncSession, current_user: schemas.CurrentUser, share: schemas.SharePatch, share_id: int, version: Optional[int] = None):
+    return await run_write(db, serialized(schemas.Share, crud.patch_share), current_user, share=share, share_id=share_id, version=version)
+
+
+@invalidates("goods")
+async def patch_location(db: AsyncSession, current_user: schemas.CurrentUser, location: schemas.LocationPatch, location_id: int, version: Optional[int] = None):
+    return await run_write(db, crud.patch_location, current_user, location=location, location_id=location_id, version=version)
+
+
+@invalidates("goods")
+async def delete_image(db: AsyncSession, current_user: schemas.CurrentUser, image_id: int):
+    return await run_write(db, crud.delete_image, current_user, image_id=image_id)
+
+
+@invalidates("goods")
+async def delete_location(db: AsyncSession, current_user: schemas.CurrentUser, location_id: int):
+    return await run_write(db, crud.delete_location, current_user, location_id=location_id)
+
+
+@invalidates("goods")
+async def delete_share(db: AsyncSession, current_user: schemas.CurrentUser, share_id: int):
+    return await run_write(db, crud.delete_share, current_user, share_id=share_id)
+
+
+@invalidates("goods")
+async def delete_good(db: AsyncSession, current_user: schemas.CurrentUser, good_id: int):
+    return await run_write(db, crud.delete_good, current_user, good_id=good_id)
+
+
+@invalidates("goods")
+async def delete_user(db: AsyncSession, current_user: schemas.CurrentUser, user_id: int):
+    return await run_write(db, crud.delete_user, current_user, user_id=user_id)
+
+
+async def get_images(db: AsyncSession, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    return await db.run_sync(crud.get_images, current_user, skip=skip, limit=limit, after=after, fields=fields)
+
+
+@invalidates("goods")
+async def bulk_create_goods(db: AsyncSession, current_user: schemas.CurrentUser, goods: List[schemas.GoodCreate], user_id: int):
+    return await run_write(db, crud.bulk_create_goods, current_user, goods, user_id=user_id)
+
+
+@invalidates("goods")
+async def bulk_update_goods(db: AsyncSession, current_user: schemas.CurrentUser, goods: List[schemas.GoodBulkUpdate]):
+    return await run_write(db, crud.bulk_update_goods, current_user, goods)
+
+
+@invalidates("goods")
+async def bulk_delete_goods(db: AsyncSession, current_user: schemas.CurrentUser, ids: List[int]):
+    return await run_write(db, crud.bulk_delete_goods, current_user, ids)
+
+
+async def bulk_create_locations(db: AsyncSession, current_user: schemas.CurrentUser, locations: List[schemas.LocationCreate], user_id: int):
+    return await run_write(db, crud.bulk_create_locations, current_user, locations, user_id=user_id)
+
+
+@invalidates("goods")
+async def bulk_update_locations(db: AsyncSession, current_user: schemas.CurrentUser, locations: List[schemas.LocationBulkUpdate]):
+    return await run_write(db, crud.bulk_update_locations, current_user, locations)
+
+
+@invalidates("goods")
+async def bulk_delete_locations(db: AsyncSession, current_user: schemas.CurrentUser, ids: List[int]):
+    return await run_write(db, crud.bulk_delete_locations, current_user, ids)
+
+
+async def bulk_create_shares(db: AsyncSession, current_user: schemas.CurrentUser, shares: List[schemas.ShareCreate], user_id: int):
+    return await run_write(db, crud.bulk_create_shares, current_user, shares, user_id=user_id)
+
+
+async def bulk_update_shares(db: AsyncSession, current_user: schemas.CurrentUser, shares: List[schemas.ShareBulkUpdate]):
+    return await run_write(db, crud.bulk_update_shares, current_user, shares)
+
+
+@invalidates("goods")
+async def bulk_delete_shares(db: AsyncSession, current_user: schemas.CurrentUser, ids: List[int]):
+    return await run_write(db, crud.bulk_delete_shares, current_user, ids)
+
+
+@invalidates("goods")
+async def bulk_create_images(db: AsyncSession, current_user: schemas.CurrentUser, images: List[schemas.ImageCreate], user_id: int):
+    return await run_write(db, crud.bulk_create_images, current_user, images, user_id=user_id)
+
+
+@invalidates("goods")
+async def bulk_update_images(db: AsyncSession, current_user: schemas.CurrentUser, images: List[schemas.ImageBulkUpdate]):
+    return await run_write(db, crud.bulk_update_images, current_user, images)
+
+
+@invalidates("goods")
+async def bulk_delete_images(db: AsyncSession, current_user: schemas.CurrentUser, ids: List[int]):
+    return await run_write(db, crud.bulk_delete_images, current_user, ids)
+
+
+async def get_job_status(db: AsyncSession):
+    return await db.run_sync(lambda session: schemas.JobStatus(**jobs.status(session)))
+
+
+# exports: server-side cursor, one partition of rows at a time. The identity map only holds weak
+# references to unmodified rows, so rows of finished partitions are freed and memory stays flat.
+
+async def stream_partitions(db: AsyncSession, statement, chunk_size: int) -> AsyncIterator[list]:
+    result = await db.stream(statement.execution_options(yield_per=chunk_size))
+    async for rows in result.scalars().partitions():
+        yield rows
+
+
+def stream_goods(db: AsyncSession, chunk_size: int = 500) -> AsyncIterator[List[models.Good]]:
+    statement = select(models.Good).options(*crud.good_load_options).order_by(models.Good.id)
+    return stream_partitions(db, statement, chunk_size)
+
+
+def stream_shares(db: AsyncSession, current_user: schemas.CurrentUser, chunk_size: int = 500) -> AsyncIterator[List[models.Share]]:
+    statement = (
+        select(models.Share).options(*crud.share_load_options)
+        .filter(models.Share.user_id == current_user.id)
+        .order_by(models.Share.start_date, models.Share.id)
+    )
+    return stream_partitions(db, statement, chunk_size)
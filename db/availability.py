@@ -0,0 +1,91 @@
+"""Share periods per good: availability lookups and rejection of overlapping shares.
+
+A share occupies its good from `start_date` until `end_date`, or `planned_end_date` while it has
+not ended yet; without either it is open ended. Periods are half open, so a share may start
+at the moment the previous one ends. The lookups use the ix_shares_good_id_period index on
+(good_id, start_date, end).
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from . import models
+
+CHUNK_SIZE = 500
+
+
+class ShareConflict(Exception):
+    pass
+
+
+def share_end():
+    return func.coalesce(models.Share.end_date, models.Share.planned_end_date)
+
+
+def overlaps(start: datetime, end: Optional[datetime], other_start: datetime, other_end: Optional[datetime]) -> bool:
+    return (end is None or other_start < end) and (other_end is None or other_end > start)
+
+
+def busy_periods(db: Session, good_ids: Iterable[int], start: datetime, end: Optional[datetime] = None) -> Dict[int, list]:
+    """(id, good_id, start_date, end) rows of the shares overlapping [start, end), by good and in start order."""
+    periods = defaultdict(list)
+    ids = sorted(set(good_ids))
+    for i in range(0, len(ids), CHUNK_SIZE):
+        query = (
+            db.query(models.Share.id, models.Share.good_id, models.Share.start_date, share_end().label("end"))
+            .filter(models.Share.good_id.in_(ids[i:i + CHUNK_SIZE]))
+            .filter(or_(share_end().is_(None), share_end() > start))
+            .order_by(models.Share.good_id, models.Share.start_date)
+        )
+        if end is not None:
+            query = query.filter(models.Share.start_date < end)
+        for row in query:
+            periods[row.good_id].append(row)
+    return periods
+
+
+def lock_goods(db: Session, good_ids: Iterable[int]) -> None:
+    """Serialize share writes per good until the transaction ends.
+
+    SQLite needs no row locks: the share insert or update already holds its single write lock
+    while the overlaps are checked.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return
+    ids = sorted(set(i for i in good_ids if i is not None))
+    for i in range(0, len(ids), CHUNK_SIZE):
+        # in id order, so two writers locking overlapping sets cannot deadlock
+        db.query(models.Good.id).filter(models.Good.id.in_(ids[i:i + CHUNK_SIZE])).order_by(models.Good.id).with_for_update().all()
+
+
+def rejected_overlaps(db: Session, share_ids: List[int]) -> Set[int]:
+    """Check freshly written shares, in order, against each other and all other shares.
+
+    Call after the shares were flushed. A share is rejected if it overlaps a share that is not
+    among `share_ids`, or one of them that came earlier and was not rejected itself.
+    """
+    candidates = []
+    for i in range(0, len(share_ids), CHUNK_SIZE):
+        chunk = share_ids[i:i + CHUNK_SIZE]
+        candidates += db.query(models.Share.id, models.Share.good_id, models.Share.start_date, share_end().label("end")).filter(models.Share.id.in_(chunk))
+    candidates = [c for c in candidates if c.good_id is not None]
+    if not candidates:
+        return set()
+    order = {share_id: n for n, share_id in enumerate(share_ids)}
+    candidates.sort(key=lambda c: order[c.id])
+    start = min(c.start_date for c in candidates)
+    end = None if any(c.end is None for c in candidates) else max(c.end for c in candidates)
+    new_ids = set(share_ids)
+    taken = defaultdict(list)
+    for good_id, rows in busy_periods(db, (c.good_id for c in candidates), start, end).items():
+        taken[good_id] = [r for r in rows if r.id not in new_ids]
+    rejected = set()
+    for c in candidates:
+        if any(overlaps(c.start_date, c.end, t.start_date, t.end) for t in taken[c.good_id]):
+            rejected.add(c.id)
+        else:
+            taken[c.good_id].append(c)
+    return rejected
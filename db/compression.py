@@ -0,0 +1,174 @@
+"""Negotiated response compression: zstd, brotli or gzip, whichever the client accepts.
+
+`CompressionMiddleware` compresses responses of textual types (JSON, NDJSON, CSV, text) that are
+at least COMPRESSION_MIN_SIZE bytes, or streamed, on the threadpool so the event loop keeps
+serving other requests meanwhile. Streamed responses are flushed after every chunk, so
+exports still arrive piece by piece. Responses that already carry a Content-Encoding pass
+through untouched, which is how routes can send variants they compressed (and cached) ahead.
+
+brotli and zstd need the `brotli` and `zstandard` packages; without them only gzip is offered.
+"""
+import os
+import zlib
+from typing import Dict, Optional
+
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSION = os.environ.get("COMPRESSION", "1") == "1"
+COMPRESSION_MIN_SIZE = int(os.environ.get("COMPRESSION_MIN_SIZE", "1024"))
+# server preference among the encodings a client accepts equally
+COMPRESSION_ENCODINGS = os.environ.get("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+GZIP_LEVEL = int(os.environ.get("COMPRESSION_GZIP_LEVEL", "6"))
+BROTLI_LEVEL = int(os.environ.get("COMPRESSION_BROTLI_LEVEL", "4"))
+ZSTD_LEVEL = int(os.environ.get("COMPRESSION_ZSTD_LEVEL", "3"))
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "application/xml", "application/javascript", "image/svg+xml")
+
+
+class GzipEncoder:
+    def __init__(self, level: int = GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, level: int = BROTLI_LEVEL):
+        self._compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = ZSTD_LEVEL):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+ENCODERS = {"gzip": GzipEncoder}
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+if zstandard is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+
+# the configured encodings that are available, most preferred first
+encodings = [e.strip() for e in COMPRESSION_ENCODINGS.split(",") if e.strip() in ENCODERS] if COMPRESSION else []
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    """The encoding to use for a request's Accept-Encoding header, None for identity."""
+    if not accept_encoding or not encodings:
+        return None
+    weights: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+    best, best_q = None, 0.0
+    for encoding in encodings:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+def compress(encoding: str, data: bytes) -> bytes:
+    encoder = ENCODERS[encoding]()
+    return encoder.compress(data) + encoder.finish()
+
+
+def encode_chunk(encoder, data: bytes, last: bool) -> bytes:
+    """Compress a chunk of a stream and flush it, so the client can decode it right away."""
+    return encoder.compress(data) + (encoder.finish() if last else encoder.flush())
+
+
+def compressible(headers: Headers) -> bool:
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type.startswith("text/") or content_type in COMPRESSIBLE_TYPES
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not encodings:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding"))
+        start = None
+        encoder = None
+
+        async def send_compressed(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                # held back until the first body chunk tells whether it is worth compressing
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+            if start is not None:
+                headers = MutableHeaders(raw=start.setdefault("headers", []))
+                if compressible(headers) and "content-encoding" not in headers and start["status"] not in (204, 206, 304):
+                    headers.add_vary_header("Accept-Encoding")
+                    if encoding is not None and (more_body or len(body) >= self.minimum_size):
+                        encoder = ENCODERS[encoding]()
+                        headers["Content-Encoding"] = encoding
+                        if "content-length" in headers:
+                            del headers["content-length"]
+                        # the compressed bytes differ, so a strong validator of the identity body does not apply
+                        etag = headers.get("etag")
+                        if etag and not etag.startswith("W/"):
+                            headers["ETag"] = "W/" + etag
+                        if not more_body:
+                            body = await run_in_threadpool(compress, encoding, body)
+                            headers["Content-Length"] = str(len(body))
+                            encoder = None
+                await send(start)
+                start = None
+            if encoder is not None:
+                body = await run_in_threadpool(encode_chunk, encoder, body, not more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
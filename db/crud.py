@@ -1,229 +1,569 @@
-from sqlalchemy.orm import Session
-
-from . import models, schemas
-
-
-def get_user(db: Session, email: str, user_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
-    return db.query(models.User).filter(models.User.id == user_id).first()
+import os
+import time
+from datetime import datetime
+from functools import partial
+from typing import Callable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import and_, insert, or_, select, update
+from sqlalchemy.orm import Session, joinedload, load_only, selectinload
+
+from . import availability, geo, jobs, models, schemas, search
+from .cache import TTLCache
+from .storage import blob_store
+from .variants import VARIANTS
+
+# email -> user id of authenticated callers, so each request resolves its caller at most once.
+# Per process: with several workers, the others only forget a deleted user after USER_CACHE_TTL seconds.
+USER_CACHE_TTL = float(os.environ.get("USER_CACHE_TTL", "60"))
+user_id_cache = TTLCache(maxsize=1024, ttl=USER_CACHE_TTL)
+
+# loader options matching the nested response models in schemas.py, so serialization never lazy loads,
+# by the name of the relationship field
+good_loads = {"location": joinedload(models.Good.location), "images": selectinload(models.Good.images)}
+share_loads = {"location": joinedload(models.Share.location), "images": selectinload(models.Share.images)}
+good_load_options = tuple(good_loads.values())
+share_load_options = tuple(share_loads.values())
+user_loads = {
+    "goods": selectinload(models.User.goods).options(*good_load_options),
+    "locations": selectinload(models.User.locations),
+    "shares": selectinload(models.User.shares).options(*share_load_options),
+    "images": selectinload(models.User.images),
+}
+user_load_options = tuple(user_loads.values())
+
+
+def load_options(loads: dict, fields: Optional[Sequence[str]] = None, keys: Sequence[str] = ("id",)) -> tuple:
+    """Loader options for a list query. With `fields`, only those columns and relationships are
+    loaded, plus the `keys` columns the query itself needs to sort and page.
+    """
+    if fields is None:
+        return tuple(loads.values())
+    columns = [name for name in fields if name not in loads]
+    return (load_only(*dict.fromkeys([*keys, *columns])), *(loads[name] for name in fields if name in loads))
+
+
+def resolve_user(db: Session, email: str):
+    user_id = user_id_cache.get(email)
+    if user_id is None:
+        u = db.query(models.User.id).filter(models.User.email == email).first()
+        if not u:
+            return None
+        user_id = u.id
+        user_id_cache.set(email, user_id)
+    return schemas.CurrentUser(id=user_id, email=email)
+
+
+def get_user(db: Session, current_user: schemas.CurrentUser, user_id: int):
+    return db.query(models.User).options(*user_load_options).filter(models.User.id == user_id).first()
 
 
 def get_user_by_email(db: Session, email: str):
-    return db.query(models.User).filter(models.User.email == email).first()
+    return db.query(models.User).options(*user_load_options).filter(models.User.email == email).first()
 
 
 def get_user_by_name(db: Session, name: str):
     return db.query(models.User).filter(models.User.name == name).first()
 
 
-def get_users(db: Session, email: str, skip: int = 0, limit: int = 100):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
-    return db.query(models.User).offset(skip).limit(limit).all()
+def get_users(db: Session, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    query = db.query(models.User).options(*load_options(user_loads, fields)).order_by(models.User.id)
+    if after is not None:
+        query = query.filter(models.User.id > after)
+    return query.offset(skip).limit(limit).all()
 
 
 def create_user(db: Session, user: schemas.UserCreate):
     db_user = models.User(**user.dict())
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
+    user_id_cache.pop(db_user.email)
     return db_user
 
 
-def get_goods(db: Session, skip: int = 0, limit: int = 100, q: str = ""):
+def get_goods(db: Session, skip: int = 0, limit: int = 100, q: str = "", after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    options = load_options(good_loads, fields)
     if q is not None:
-        return db.query(models.Good).filter(models.Good.title.ilike(q)).offset(skip).limit(limit).all()
-    else:
-        return db.query(models.Good).offset(skip).limit(limit).all()
+        return search.filter_goods(db, db.query(models.Good).options(*options), q).offset(skip).limit(limit).all()
+    query = db.query(models.Good).options(*options).order_by(models.Good.id)
+    if after is not None:
+        query = query.filter(models.Good.id > after)
+    return query.offset(skip).limit(limit).all()
+
 
+def get_goods_nearby(db: Session, lat: float, lon: float, radius_km: float, limit: int = 100, after=None):
+    return geo.goods_nearby(db, lat, lon, radius_km, limit=limit, after=after)
 
-def create_user_good(db: Session, email: str, good: schemas.GoodCreate, user_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u or user_id != u.id:
+
+def create_user_good(db: Session, current_user: schemas.CurrentUser, good: schemas.GoodCreate, user_id: int):
+    if user_id != current_user.id:
         return None
     db_good = models.Good(**good.dict(), owner_id=user_id)
     db.add(db_good)
     db.commit()
-    db.refresh(db_good)
     return db_good
 
 
-def create_location(db: Session, email: str, location: schemas.LocationCreate, user_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u or user_id != u.id:
+def create_location(db: Session, current_user: schemas.CurrentUser, location: schemas.LocationCreate, user_id: int):
+    if user_id != current_user.id:
         return None
     db_location = models.Location(**location.dict(), user_id=user_id)
     db.add(db_location)
     db.commit()
-    db.refresh(db_location)
     return db_location
 
 
-def get_locations(db: Session, email: str, skip: int = 0, limit: int = 100):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
-    return db.query(models.Location).filter(models.Location.user_id == u.id).offset(skip).limit(limit).all()
+def get_locations(db: Session, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    query = db.query(models.Location).options(*load_options({}, fields)).filter(models.Location.user_id == current_user.id).order_by(models.Location.id)
+    if after is not None:
+        query = query.filter(models.Location.id > after)
+    return query.offset(skip).limit(limit).all()
 
 
-def create_share(db: Session, email: str, share: schemas.ShareCreate, user_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u or user_id != u.id:
+def create_share(db: Session, current_user: schemas.CurrentUser, share: schemas.ShareCreate, user_id: int):
+    if user_id != current_user.id:
         return None
+    availability.lock_goods(db, [share.good_id])
     db_share = models.Share(**share.dict(), user_id=user_id)
     db.add(db_share)
+    db.flush()
+    check_overlap(db, db_share.id)
     db.commit()
-    db.refresh(db_share)
     return db_share
 
 
-def get_shares(db: Session, email: str, skip: int = 0, limit: int = 100):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
-    return db.query(models.Share).filter(models.Share.user_id == u.id).offset(skip).limit(limit).all()
+def check_overlap(db: Session, share_id: int):
+    if availability.rejected_overlaps(db, [share_id]):
+        db.rollback()
+        raise availability.ShareConflict("The good is already shared in that period")
+
+
+def get_availability(db: Session, good_ids: List[int], start: datetime, end: Optional[datetime] = None):
+    return availability.busy_periods(db, good_ids, start, end)
+
 
+def get_shares(db: Session, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[Tuple[datetime, int]] = None, fields: Optional[Sequence[str]] = None):
+    query = (
+        db.query(models.Share).options(*load_options(share_loads, fields, keys=("id", "start_date")))
+        .filter(models.Share.user_id == current_user.id)
+        .order_by(models.Share.start_date, models.Share.id)
+    )
+    if after is not None:
+        start_date, share_id = after
+        query = query.filter(or_(
+            models.Share.start_date > start_date,
+            and_(models.Share.start_date == start_date, models.Share.id > share_id),
+        ))
+    return query.offset(skip).limit(limit).all()
 
-def create_image(db: Session, email: str, image: schemas.ImageCreate, user_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u or user_id != u.id:
+
+def create_image(db: Session, current_user: schemas.CurrentUser, image: schemas.ImageCreate, user_id: int):
+    if user_id != current_user.id:
         return None
     db_image = models.Image(**image.dict(), user_id=user_id)
     db.add(db_image)
     db.commit()
-    db.refresh(db_image)
     return db_image
 
 
-def add_image_file(db: Session, email: str, image_id: int, content: bytes):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
+def add_image_file(db: Session, current_user: schemas.CurrentUser, image_id: int, digest: str, size: int):
+    db_image = db.query(models.Image).filter(models.Image.user_id == current_user.id).filter(models.Image.id == image_id).first()
+    if not db_image:
         return None
-    db_image = db.query(models.Image).filter(models.Image.user_id == u.id).filter(models.Image.id == image_id).first()
-    db_image.content = content
+    if db_image.digest is not None and db_image.digest != digest:
+        enqueue_blob_collection(db, [db_image.digest])
+    db_image.digest = digest
+    db_image.size = size
+    db_image.updated_at = datetime.utcnow()
     db.add(db_image)
     db.commit()
-    db.refresh(db_image)
     return db_image
 
 
-def get_image(db: Session, email: str, image_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
+def get_image(db: Session, current_user: schemas.CurrentUser, image_id: int):
     return db.query(models.Image).filter(models.Image.id == image_id).first()
 
 
-def update_user(db: Session, email: str, user: schemas.UserUpdate, user_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u or user_id != u.id:
+def update_user(db: Session, current_user: schemas.CurrentUser, user: schemas.UserUpdate, user_id: int):
+    if user_id != current_user.id:
         return None
     db_user = models.User(**user.dict(), id=user_id)
     db_user = db.merge(db_user)
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
+    user_id_cache.pop(current_user.email)
     return db_user
 
 
-def update_good(db: Session, email: str, good: schemas.GoodUpdate, good_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
+def update_good(db: Session, current_user: schemas.CurrentUser, good: schemas.GoodUpdate, good_id: int):
     db_good = models.Good(**good.dict(), id=good_id)
     db_good = db.merge(db_good)
     db.add(db_good)
     db.commit()
-    db.refresh(db_good)
     return db_good
 
 
-def update_image(db: Session, email: str, image: schemas.ImageUpdate, image_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
+def update_image(db: Session, current_user: schemas.CurrentUser, image: schemas.ImageUpdate, image_id: int):
     db_image = models.Image(**image.dict(), id=image_id)
     db_image = db.merge(db_image)
     db.add(db_image)
     db.commit()
-    db.refresh(db_image)
     return db_image
 
 
-def update_share(db: Session, email: str, share: schemas.ShareUpdate, share_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
+def update_share(db: Session, current_user: schemas.CurrentUser, share: schemas.ShareUpdate, share_id: int):
+    availability.lock_goods(db, [share.good_id])
     db_share = models.Share(**share.dict(), id=share_id)
     db_share = db.merge(db_share)
     db.add(db_share)
+    db.flush()
+    check_overlap(db, db_share.id)
     db.commit()
-    db.refresh(db_share)
     return db_share
 
 
-def update_location(db: Session, email: str, location: schemas.LocationUpdate, location_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
+def update_location(db: Session, current_user: schemas.CurrentUser, location: schemas.LocationUpdate, location_id: int):
     db_location = models.Location(**location.dict(), id=location_id)
     db_location = db.merge(db_location)
     db.add(db_location)
     db.commit()
-    db.refresh(db_location)
     return db_location
 
 
-def delete_image(db: Session, email: str, image_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
+def delete_image(db: Session, current_user: schemas.CurrentUser, image_id: int):
+    return len(bulk_delete_images(db, current_user, [image_id]))
+
+
+def delete_location(db: Session, current_user: schemas.CurrentUser, location_id: int):
+    return len(bulk_delete_locations(db, current_user, [location_id]))
+
+
+def delete_share(db: Session, current_user: schemas.CurrentUser, share_id: int):
+    return len(bulk_delete_shares(db, current_user, [share_id]))
+
+
+def delete_good(db: Session, current_user: schemas.CurrentUser, good_id: int):
+    return len(bulk_delete_goods(db, current_user, [good_id]))
+
+
+def delete_user(db: Session, current_user: schemas.CurrentUser, user_id: int):
+    if user_id != current_user.id:
         return None
-    res = db.query(models.Image).filter(models.Image.user_id == u.id).filter(models.Image.id == image_id).delete()
+    after_delete(db, "delete_user_rows", user_id=user_id)
+    res = db.query(models.User).filter(models.User.id == user_id).delete()
     db.commit()
+    user_id_cache.pop(current_user.email)
     return res
 
 
-def delete_location(db: Session, email: str, location_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
+# sparse updates: one UPDATE ... RETURNING instead of merge (SELECT, UPDATE of every column) and refresh (SELECT)
+
+patch_good_options = (selectinload(models.Good.location), selectinload(models.Good.images))
+patch_share_options = (selectinload(models.Share.location), selectinload(models.Share.images))
+
+
+class VersionConflict(Exception):
+    def __init__(self, version: int):
+        super().__init__(f"The row was changed in the meantime, its version is now {version}")
+        self.version = version
+
+
+def patch_row(db: Session, model, owner_column, owner_id: int, row_id: int, changes: dict, version: Optional[int] = None, options: Sequence = ()):
+    """Apply `changes` to the row if `owner_id` owns it, and bump its version. Does not commit.
+
+    Returns the updated row, or None if there is no such row of the owner. With `version`, the
+    row is only updated while it still has that version, else VersionConflict is raised.
+    """
+    table = model.__table__
+    statement = update(table).where(table.c.id == row_id).where(owner_column == owner_id).values(**changes, version=table.c.version + 1)
+    if version is not None:
+        statement = statement.where(table.c.version == version)
+    if db.get_bind().dialect.full_returning:
+        query = select(model).from_statement(statement.returning(*table.c)).options(*options).execution_options(populate_existing=True)
+        row = db.execute(query).scalars().first()
+    else:
+        # SQLite has RETURNING only with SQLAlchemy 2, read the row back by primary key instead
+        row = db.get(model, row_id, options=options, populate_existing=True) if db.execute(statement).rowcount else None
+    if row is None and version is not None:
+        current = db.query(model.version).filter(model.id == row_id).filter(owner_column == owner_id).scalar()
+        if current is not None:
+            raise VersionConflict(current)
+    return row
+
+
+def bump_versions(db: Session, model, ids: Set[int]) -> None:
+    """Count an update of these rows; bulk updates skip the ORM event that does it for single rows."""
+    ids = list(ids)
+    table = model.__table__
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        db.execute(update(table).where(table.c.id.in_(ids[i:i + BULK_CHUNK_SIZE])).values(version=table.c.version + 1))
+
+
+def patch_user(db: Session, current_user: schemas.CurrentUser, user: schemas.UserPatch, user_id: int, version: Optional[int] = None):
+    if user_id != current_user.id:
         return None
-    res = db.query(models.Location).filter(models.Location.user_id == u.id).filter(models.Location.id == location_id).delete()
+    db_user = patch_row(db, models.User, models.User.id, current_user.id, user_id, user.dict(exclude_unset=True), version, user_load_options)
     db.commit()
-    return res
+    return db_user
 
 
-def delete_share(db: Session, email: str, share_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
-    res = db.query(models.Share).filter(models.Share.user_id == u.id).filter(models.Share.id == share_id).delete()
+def patch_good(db: Session, current_user: schemas.CurrentUser, good: schemas.GoodPatch, good_id: int, version: Optional[int] = None):
+    db_good = patch_row(db, models.Good, models.Good.owner_id, current_user.id, good_id, good.dict(exclude_unset=True), version, patch_good_options)
     db.commit()
-    return res
+    return db_good
 
 
-def delete_good(db: Session, email: str, good_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
-        return None
-    res = db.query(models.Good).filter(models.Good.owner_id == u.id).filter(models.Good.id == good_id).delete()
+def patch_location(db: Session, current_user: schemas.CurrentUser, location: schemas.LocationPatch, location_id: int, version: Optional[int] = None):
+    db_location = patch_row(db, models.Location, models.Location.user_id, current_user.id, location_id, location.dict(exclude_unset=True), version)
     db.commit()
-    return res
+    return db_location
+
+
+def patch_image(db: Session, current_user: schemas.CurrentUser, image: schemas.ImagePatch, image_id: int, version: Optional[int] = None):
+    db_image = patch_row(db, models.Image, models.Image.user_id, current_user.id, image_id, image.dict(exclude_unset=True), version)
+    db.commit()
+    return db_image
+
+
+def patch_share(db: Session, current_user: schemas.CurrentUser, share: schemas.SharePatch, share_id: int, version: Optional[int] = None):
+    changes = share.dict(exclude_unset=True)
+    db_share = patch_row(db, models.Share, models.Share.user_id, current_user.id, share_id, changes, version, patch_share_options)
+    if db_share is not None and changes.keys() & {"good_id", "start_date", "planned_end_date", "end_date"}:
+        availability.lock_goods(db, [db_share.good_id])
+        check_overlap(db, share_id)
+    db.commit()
+    return db_share
+
+
+def get_images(db: Session, current_user: schemas.CurrentUser, skip: int = 0, limit: int = 100, after: Optional[int] = None, fields: Optional[Sequence[str]] = None):
+    query = db.query(models.Image).options(*load_options({}, fields)).filter(models.Image.user_id == current_user.id).order_by(models.Image.id)
+    if after is not None:
+        query = query.filter(models.Image.id > after)
+    return query.offset(skip).limit(limit).all()
 
 
-def delete_user(db: Session, email: str, user_id: int):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u or u.id != user_id:
+# bulk writes: one transaction and executemany instead of a commit and refresh per row
+
+BULK_CHUNK_SIZE = 500
+
+
+def insert_rows(db: Session, model, rows: List[dict]) -> List[int]:
+    """Insert the rows without committing, returns their ids in order."""
+    if not db.get_bind().dialect.full_returning:
+        db.bulk_insert_mappings(model, rows, return_defaults=True)
+        return [row["id"] for row in rows]
+    # one multi-row INSERT ... RETURNING per chunk instead of a statement per row
+    table = model.__table__
+    ids = []
+    for i in range(0, len(rows), BULK_CHUNK_SIZE):
+        ids += db.execute(insert(table).values(rows[i:i + BULK_CHUNK_SIZE]).returning(table.c.id)).scalars().all()
+    return ids
+
+
+def bulk_insert(db: Session, model, rows: List[dict]) -> List[int]:
+    ids = insert_rows(db, model, rows)
+    db.commit()
+    return ids
+
+
+def owned_ids(db: Session, model, owner_column, owner_id: int, ids: List[int]) -> Set[int]:
+    found = set()
+    unique = list(set(ids))
+    for i in range(0, len(unique), BULK_CHUNK_SIZE):
+        chunk = unique[i:i + BULK_CHUNK_SIZE]
+        found.update(r.id for r in db.query(model.id).filter(owner_column == owner_id).filter(model.id.in_(chunk)))
+    return found
+
+
+def bulk_update(db: Session, model, owner_column, owner_id: int, rows: List[dict]) -> Set[int]:
+    """Update the rows owned by `owner_id`, returns the ids that were updated."""
+    found = owned_ids(db, model, owner_column, owner_id, [row["id"] for row in rows])
+    db.bulk_update_mappings(model, [row for row in rows if row["id"] in found])
+    bump_versions(db, model, found)
+    db.commit()
+    return found
+
+
+def bulk_delete(db: Session, model, owner_column, owner_id: int, ids: List[int], before: Optional[Callable] = None) -> Set[int]:
+    """Delete the rows owned by `owner_id`, returns the ids that were deleted.
+    `before(db, ids=...)` is called with the ids first, e.g. to clean up what refers to them."""
+    found = owned_ids(db, model, owner_column, owner_id, ids)
+    found_list = sorted(found)
+    if found_list and before is not None:
+        before(db, ids=found_list)
+    for i in range(0, len(found_list), BULK_CHUNK_SIZE):
+        db.query(model).filter(owner_column == owner_id).filter(model.id.in_(found_list[i:i + BULK_CHUNK_SIZE])).delete(synchronize_session=False)
+    db.commit()
+    return found
+
+
+def bulk_create_goods(db: Session, current_user: schemas.CurrentUser, goods: List[schemas.GoodCreate], user_id: int):
+    if user_id != current_user.id:
         return None
-    res = db.query(models.User).filter(models.User.id == user_id).delete()
+    return bulk_insert(db, models.Good, [dict(good.dict(), owner_id=user_id) for good in goods])
+
+
+def bulk_update_goods(db: Session, current_user: schemas.CurrentUser, goods: List[schemas.GoodBulkUpdate]):
+    return bulk_update(db, models.Good, models.Good.owner_id, current_user.id, [good.dict() for good in goods])
+
+
+def bulk_delete_goods(db: Session, current_user: schemas.CurrentUser, ids: List[int]):
+    return bulk_delete(db, models.Good, models.Good.owner_id, current_user.id, ids, partial(after_delete, kind="detach_goods"))
+
+
+def bulk_create_locations(db: Session, current_user: schemas.CurrentUser, locations: List[schemas.LocationCreate], user_id: int):
+    if user_id != current_user.id:
+        return None
+    return bulk_insert(db, models.Location, [dict(location.dict(), user_id=user_id) for location in locations])
+
+
+def bulk_update_locations(db: Session, current_user: schemas.CurrentUser, locations: List[schemas.LocationBulkUpdate]):
+    return bulk_update(db, models.Location, models.Location.user_id, current_user.id, [location.dict() for location in locations])
+
+
+def bulk_delete_locations(db: Session, current_user: schemas.CurrentUser, ids: List[int]):
+    return bulk_delete(db, models.Location, models.Location.user_id, current_user.id, ids, partial(after_delete, kind="detach_locations"))
+
+
+def bulk_create_shares(db: Session, current_user: schemas.CurrentUser, shares: List[schemas.ShareCreate], user_id: int):
+    if user_id != current_user.id:
+        return None
+    availability.lock_goods(db, (share.good_id for share in shares))
+    ids = insert_rows(db, models.Share, [dict(share.dict(), user_id=user_id) for share in shares])
+    rejected = list(availability.rejected_overlaps(db, ids))
+    for i in range(0, len(rejected), BULK_CHUNK_SIZE):
+        db.query(models.Share).filter(models.Share.id.in_(rejected[i:i + BULK_CHUNK_SIZE])).delete(synchronize_session=False)
     db.commit()
-    return res
+    # None for the shares that overlap another one
+    return [None if share_id in rejected else share_id for share_id in ids]
+
+
+def bulk_update_shares(db: Session, current_user: schemas.CurrentUser, shares: List[schemas.ShareBulkUpdate]) -> Tuple[Set[int], Set[int]]:
+    """Returns the ids that were updated and the ids left unchanged because the update would overlap another share."""
+    found = owned_ids(db, models.Share, models.Share.user_id, current_user.id, [share.id for share in shares])
+    rows = [share.dict() for share in shares if share.id in found]
+    availability.lock_goods(db, (row["good_id"] for row in rows))
+    columns = [getattr(models.Share, name) for name in schemas.ShareBulkUpdate.__fields__]
+    ids = list(found)
+    previous = []
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        previous += [dict(r._mapping) for r in db.query(*columns).filter(models.Share.id.in_(ids[i:i + BULK_CHUNK_SIZE]))]
+    db.bulk_update_mappings(models.Share, rows)
+    rejected = availability.rejected_overlaps(db, [row["id"] for row in rows])
+    # put the rejected shares back the way they were
+    db.bulk_update_mappings(models.Share, [row for row in previous if row["id"] in rejected])
+    bump_versions(db, models.Share, found - rejected)
+    db.commit()
+    return found - rejected, rejected
 
 
-def get_images(db: Session, email: str, skip: int = 0, limit: int = 100):
-    u = db.query(models.User).filter(models.User.email == email).first()
-    if not u:
+def bulk_delete_shares(db: Session, current_user: schemas.CurrentUser, ids: List[int]):
+    return bulk_delete(db, models.Share, models.Share.user_id, current_user.id, ids, partial(after_delete, kind="detach_shares"))
+
+
+def bulk_create_images(db: Session, current_user: schemas.CurrentUser, images: List[schemas.ImageCreate], user_id: int):
+    if user_id != current_user.id:
         return None
-    return db.query(models.Image).filter(models.Image.user_id == u.id).offset(skip).limit(limit).all()
+    return bulk_insert(db, models.Image, [dict(image.dict(), user_id=user_id) for image in images])
+
+
+def bulk_update_images(db: Session, current_user: schemas.CurrentUser, images: List[schemas.ImageBulkUpdate]):
+    return bulk_update(db, models.Image, models.Image.user_id, current_user.id, [image.dict() for image in images])
+
+
+def bulk_delete_images(db: Session, current_user: schemas.CurrentUser, ids: List[int]):
+    return bulk_delete(db, models.Image, models.Image.user_id, current_user.id, ids, collect_image_blobs)
+
+
+# follow-up work of deletes, run after the commit as background jobs (see jobs.py)
+
+# blobs stored again this recently are kept, an upload of the same content may be about to refer to them
+BLOB_GRACE_SECONDS = 600
+
+
+def after_delete(db: Session, kind: str, **payload) -> None:
+    """Clean up the rows that refer to rows about to be deleted. SQLite does not enforce foreign
+    keys, so there the cleanup is a job and the delete stays quick; elsewhere the foreign keys
+    would reject the delete, so the cleanup runs first, in the same transaction."""
+    if db.get_bind().dialect.name == "sqlite":
+        jobs.enqueue(db, kind, **payload)
+    else:
+        jobs.handlers[kind].fn(db, **payload)
+
+
+def detach(db: Session, column, ids: List[int]) -> None:
+    """Set `column` to NULL in the rows that refer to `ids`."""
+    model = column.class_
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        db.query(model).filter(column.in_(ids[i:i + BULK_CHUNK_SIZE])).update({column: None, model.version: model.version + 1}, synchronize_session=False)
+
+
+def delete_ids(db: Session, model, ids: List[int]) -> None:
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        db.query(model).filter(model.id.in_(ids[i:i + BULK_CHUNK_SIZE])).delete(synchronize_session=False)
+
+
+@jobs.handler("detach_goods", invalidates=("goods",))
+def detach_goods(db: Session, ids: List[int]) -> None:
+    """Detach the images from deleted goods and delete the goods' shares, a share is always of a good."""
+    detach(db, models.Image.good_id, ids)
+    share_ids = []
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        share_ids += [r.id for r in db.query(models.Share.id).filter(models.Share.good_id.in_(ids[i:i + BULK_CHUNK_SIZE]))]
+    detach_shares(db, share_ids)
+    delete_ids(db, models.Share, share_ids)
+
+
+# goods embed their location_id and their images, with the images' share_id
+@jobs.handler("detach_locations", invalidates=("goods",))
+def detach_locations(db: Session, ids: List[int]) -> None:
+    detach(db, models.Good.location_id, ids)
+    detach(db, models.Share.location_id, ids)
+
+
+@jobs.handler("detach_shares", invalidates=("goods",))
+def detach_shares(db: Session, ids: List[int]) -> None:
+    detach(db, models.Image.share_id, ids)
+
+
+@jobs.handler("delete_user_rows", invalidates=("goods",))
+def delete_user_rows(db: Session, user_id: int) -> None:
+    """Delete what a deleted user owned, detaching the rows of other users from it; their shares of
+    the user's goods are deleted."""
+    digests = [r.digest for r in db.query(models.Image.digest).filter(models.Image.user_id == user_id).filter(models.Image.digest.isnot(None)).distinct()]
+    db.query(models.Image).filter(models.Image.user_id == user_id).delete(synchronize_session=False)
+    for model, owner_column, detach_rows in ((models.Share, models.Share.user_id, detach_shares), (models.Good, models.Good.owner_id, detach_goods), (models.Location, models.Location.user_id, detach_locations)):
+        ids = [r.id for r in db.query(model.id).filter(owner_column == user_id)]
+        detach_rows(db, ids)
+        delete_ids(db, model, ids)
+    enqueue_blob_collection(db, digests)
+
+
+def collect_image_blobs(db: Session, ids: List[int]) -> None:
+    """Queue the blobs of images about to be deleted for garbage collection."""
+    digests = set()
+    for i in range(0, len(ids), BULK_CHUNK_SIZE):
+        digests.update(r.digest for r in db.query(models.Image.digest).filter(models.Image.id.in_(ids[i:i + BULK_CHUNK_SIZE])).filter(models.Image.digest.isnot(None)))
+    enqueue_blob_collection(db, sorted(digests))
+
+
+def enqueue_blob_collection(db: Session, digests: List[str]) -> None:
+    # always a job: files are not rolled back with the transaction, so they go once it is committed
+    for i in range(0, len(digests), BULK_CHUNK_SIZE):
+        jobs.enqueue(db, "collect_blobs", digests=digests[i:i + BULK_CHUNK_SIZE])
+
+
+@jobs.handler("collect_blobs")
+def collect_blobs(db: Session, digests: List[str]) -> None:
+    """Delete the blobs, and their variants, that no image refers to anymore."""
+    referenced = {r.digest for r in db.query(models.Image.digest).filter(models.Image.digest.in_(digests))}
+    recent = []
+    for digest in sorted(set(digests) - referenced):
+        if blob_store.exists(digest) and time.time() - blob_store.modified(digest) < BLOB_GRACE_SECONDS:
+            recent.append(digest)
+            continue
+        for variant in VARIANTS:
+            blob_store.delete(digest, variant)
+        blob_store.delete(digest)
+    if recent:
+        # look again once the grace period is over
+        jobs.enqueue(db, "collect_blobs", delay=BLOB_GRACE_SECONDS, digests=recent)
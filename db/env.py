@@ -1,3 +1,4 @@
+import os
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
@@ -18,8 +19,21 @@ fileConfig(config.config_file_name)
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from db.models import Base
+from db.database import SQLALCHEMY_DATABASE_URL
 target_metadata = Base.metadata
 
+# DATABASE_URL takes precedence over sqlalchemy.url, like it does for the app
+if "DATABASE_URL" in os.environ:
+    config.set_main_option("sqlalchemy.url", SQLALCHEMY_DATABASE_URL.replace("%", "%%"))
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    # full text search and spatial index tables (and their shadow tables) are maintained by hand in the migrations
+    if type_ == "table" and name.startswith(("goods_fts", "locations_rtree")):
+        return False
+    return True
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -44,6 +58,7 @@ def run_migrations_offline():
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
         render_as_batch=config.get_main_option('sqlalchemy.url').startswith('sqlite:///')
     )
 
@@ -66,7 +81,8 @@ def run_migrations_online():
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            include_object=include_object
         )
 
         with context.begin_transaction():
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterable, List, Tuple
+
+from pydantic import BaseModel
+from pydantic.fields import SHAPE_SINGLETON
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+def csv_columns(schema, prefix: Tuple[str, ...] = ()) -> List[Tuple[str, ...]]:
+    """Column paths of a schema; nested models are flattened into `parent.field` columns, lists stay one JSON column."""
+    columns = []
+    for name, field in schema.__fields__.items():
+        path = prefix + (name,)
+        if field.shape == SHAPE_SINGLETON and isinstance(field.type_, type) and issubclass(field.type_, BaseModel):
+            columns += csv_columns(field.type_, path)
+        else:
+            columns.append(path)
+    return columns
+
+
+def csv_value(data: dict, path: Tuple[str, ...]):
+    for key in path:
+        if data is None:
+            return ""
+        data = data[key]
+    if data is None:
+        return ""
+    if isinstance(data, datetime):
+        return data.isoformat()
+    if isinstance(data, (list, dict)):
+        return json.dumps(data, default=str)
+    return data
+
+
+def csv_header(schema) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow([".".join(path) for path in csv_columns(schema)])
+    return buf.getvalue()
+
+
+def to_csv(schema, rows: Iterable) -> str:
+    columns = csv_columns(schema)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        data = schema.from_orm(row).dict()
+        writer.writerow([csv_value(data, path) for path in columns])
+    return buf.getvalue()
+
+
+def to_ndjson(schema, rows: Iterable) -> str:
+    return "".join(schema.from_orm(row).json() + "\n" for row in rows)
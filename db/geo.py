@@ -0,0 +1,73 @@
+import heapq
+import math
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import column, table
+from sqlalchemy.orm import Session, contains_eager, selectinload
+
+from . import models
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+# R*Tree index over locations(lat, lon), see migration 5b7e0f93c1a8
+locations_rtree = table("locations_rtree", column("id"), column("min_lat"), column("max_lat"), column("min_lon"), column("max_lon"))
+
+
+def bounding_box(lat: float, lon: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """(min_lat, max_lat, min_lon, max_lon) enclosing the circle; the full longitude range near poles and the antimeridian."""
+    dlat = radius_km / KM_PER_DEGREE
+    min_lat, max_lat = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return min_lat, max_lat, -180.0, 180.0
+    dlon = math.degrees(math.asin(min(math.sin(math.radians(dlat)) / math.cos(math.radians(lat)), 1.0)))
+    if lon - dlon < -180.0 or lon + dlon > 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, lon - dlon, lon + dlon
+
+
+def haversine_km(lat: float, lon: float, lats: Sequence[float], lons: Sequence[float]) -> List[float]:
+    """Great-circle distances from one point to many, computed for the whole candidate batch at once."""
+    phi = math.radians(lat)
+    cos_phi = math.cos(phi)
+    lam = math.radians(lon)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+    return [
+        2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(
+            sin((radians(la) - phi) / 2) ** 2 + cos_phi * cos(radians(la)) * sin((radians(lo) - lam) / 2) ** 2
+        )))
+        for la, lo in zip(lats, lons)
+    ]
+
+
+def goods_nearby(db: Session, lat: float, lon: float, radius_km: float, limit: int = 100, after: Optional[Tuple[float, int]] = None):
+    """Goods whose location lies within `radius_km`, as (good, distance_km) sorted by (distance, id).
+
+    `after` is the (distance_km, id) of the last good of the previous page. The candidates in the
+    bounding box are only fetched as (id, lat, lon); goods and their images are loaded for the page.
+    """
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_km)
+    query = db.query(models.Good.id, models.Location.lat, models.Location.lon).join(models.Good.location)
+    if db.get_bind().dialect.name == "sqlite":
+        query = query.join(locations_rtree, locations_rtree.c.id == models.Location.id).filter(
+            locations_rtree.c.max_lat >= min_lat, locations_rtree.c.min_lat <= max_lat,
+            locations_rtree.c.max_lon >= min_lon, locations_rtree.c.min_lon <= max_lon,
+        )
+    else:
+        query = query.filter(models.Location.lat.between(min_lat, max_lat), models.Location.lon.between(min_lon, max_lon))
+    rows = query.all()
+
+    distances = haversine_km(lat, lon, [r.lat for r in rows], [r.lon for r in rows])
+    hits = [(d, r.id) for d, r in zip(distances, rows) if d <= radius_km]
+    if after is not None:
+        hits = [h for h in hits if h > tuple(after)]
+    page = heapq.nsmallest(limit, hits)
+    if not page:
+        return []
+    goods = {
+        good.id: good for good in db.query(models.Good).join(models.Good.location)
+        .options(contains_eager(models.Good.location), selectinload(models.Good.images))
+        .filter(models.Good.id.in_([good_id for _, good_id in page]))
+    }
+    # a good deleted in between is left out
+    return [(goods[good_id], d) for d, good_id in page if good_id in goods]
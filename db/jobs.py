@@ -0,0 +1,214 @@
+"""Durable background jobs for the work that follows a write: cascades, blob cleanup.
+
+A job is a row of the `jobs` table. `enqueue` adds it in the session of the write it follows,
+so it is committed, or rolled back, together with that write and only ever runs after it.
+`JobWorker` polls the table for due jobs on the event loop and runs each one on the threadpool,
+in a transaction of its own, with the handler registered for its kind. A failing job is
+retried with exponential backoff, JOB_MAX_ATTEMPTS times at most, and then kept as `failed`
+for inspection; finished jobs are deleted.
+
+A claimed job is leased: its run_at moves JOB_LEASE_SECONDS ahead, and a job still `running`
+after that, because its worker died, is claimed again. Claims are conditional updates, so the
+workers of several app processes and the ones started on their own with `python -m db.jobs`
+can share the table.
+"""
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from . import metrics, models
+from .database import SessionLocal
+from .responsecache import response_cache
+
+logger = logging.getLogger(__name__)
+
+# Set JOB_WORKER=0 to leave the jobs to workers started with `python -m db.jobs`.
+JOB_WORKER = os.environ.get("JOB_WORKER", "1") == "1"
+# seconds between looks for due jobs; commits of this process that enqueue a job wake its worker right away
+JOB_POLL_SECONDS = float(os.environ.get("JOB_POLL_SECONDS", "1.0"))
+JOB_BATCH = int(os.environ.get("JOB_BATCH", "10"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "5"))
+# the first retry waits this long, every further one twice as long as the one before
+JOB_RETRY_SECONDS = float(os.environ.get("JOB_RETRY_SECONDS", "5"))
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "300"))
+
+PENDING, RUNNING, FAILED = "pending", "running", "failed"
+
+
+class Handler(NamedTuple):
+    fn: Callable
+    invalidates: Tuple[str, ...]
+
+
+handlers: Dict[str, Handler] = {}
+
+
+def handler(kind: str, invalidates: Iterable[str] = ()):
+    """Register `fn(db, **payload)` to run the jobs of a kind. It must not commit: the worker
+    commits its work together with the removal of the job, then invalidates the response
+    cache tags in `invalidates`."""
+    def register(fn):
+        handlers[kind] = Handler(fn, tuple(invalidates))
+        return fn
+    return register
+
+
+def enqueue(db: Session, kind: str, delay: float = 0, **payload) -> None:
+    """Add a job to the transaction of `db`, due `delay` seconds from now."""
+    now = datetime.utcnow()
+    db.add(models.Job(kind=kind, payload=json.dumps(payload), status=PENDING, attempts=0, run_at=now + timedelta(seconds=delay), created_at=now))
+    db.info["jobs_enqueued"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_worker(session):
+    if session.info.pop("jobs_enqueued", False) and worker is not None:
+        worker.wake()
+
+
+def claim(limit: int = JOB_BATCH) -> List[models.Job]:
+    """Lease up to `limit` due jobs, skipping the ones another worker claimed first."""
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        due = (models.Job.status.in_((PENDING, RUNNING)), models.Job.run_at <= now)
+        ids = [r.id for r in db.query(models.Job.id).filter(*due).order_by(models.Job.run_at).limit(limit)]
+        # end the read, on SQLite a write in the same transaction fails if another one committed meanwhile
+        db.rollback()
+        claimed = []
+        for job_id in ids:
+            if db.query(models.Job).filter(models.Job.id == job_id, *due).update({
+                models.Job.status: RUNNING,
+                models.Job.attempts: models.Job.attempts + 1,
+                models.Job.run_at: now + timedelta(seconds=JOB_LEASE_SECONDS),
+            }, synchronize_session=False):
+                claimed.append(job_id)
+        db.commit()
+        if not claimed:
+            return []
+        return db.query(models.Job).filter(models.Job.id.in_(claimed)).order_by(models.Job.id).all()
+    finally:
+        db.close()
+
+
+def run(job: models.Job) -> None:
+    db = SessionLocal()
+    try:
+        # handlers read, then write
+        db.connection(execution_options={"sqlite_immediate": True})
+        handlers[job.kind].fn(db, **json.loads(job.payload))
+        db.query(models.Job).filter(models.Job.id == job.id).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+def retry(job: models.Job, error: str) -> bool:
+    """Schedule the next attempt of a job that failed; False once it is out of attempts."""
+    db = SessionLocal()
+    try:
+        values = {models.Job.status: FAILED, models.Job.last_error: error}
+        if job.attempts < JOB_MAX_ATTEMPTS:
+            delay = JOB_RETRY_SECONDS * 2 ** (job.attempts - 1)
+            values.update({models.Job.status: PENDING, models.Job.run_at: datetime.utcnow() + timedelta(seconds=delay)})
+        db.query(models.Job).filter(models.Job.id == job.id).update(values, synchronize_session=False)
+        db.commit()
+        return job.attempts < JOB_MAX_ATTEMPTS
+    finally:
+        db.close()
+
+
+class JobWorker:
+    def __init__(self, poll_seconds: float = JOB_POLL_SECONDS, batch: int = JOB_BATCH):
+        self.poll_seconds = poll_seconds
+        self.batch = batch
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self.run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def wake(self) -> None:
+        """Look for due jobs now. Safe to call from any thread."""
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def run_forever(self) -> None:
+        self._loop = asyncio.get_event_loop()
+        self._wakeup = asyncio.Event()
+        try:
+            while True:
+                # cleared before claiming, so a wake-up during the batch is not lost
+                self._wakeup.clear()
+                try:
+                    ran = await self.run_due()
+                except Exception:
+                    logger.exception("Claiming jobs failed")
+                    ran = 0
+                if ran < self.batch:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self._loop = None
+
+    async def run_due(self) -> int:
+        """Run the jobs that are due, one after the other; returns how many were claimed."""
+        jobs = await run_in_threadpool(claim, self.batch)
+        for job in jobs:
+            try:
+                await run_in_threadpool(run, job)
+            except Exception as e:
+                logger.exception("Job %s (%s) failed on attempt %s", job.id, job.kind, job.attempts)
+                again = await run_in_threadpool(retry, job, f"{type(e).__name__}: {e}")
+                metrics.JOBS.inc(kind=job.kind, outcome="retry" if again else "failed")
+                continue
+            metrics.JOBS.inc(kind=job.kind, outcome="done")
+            tags = handlers[job.kind].invalidates
+            if tags and response_cache is not None:
+                await response_cache.invalidate(*tags)
+        return len(jobs)
+
+
+worker: Optional[JobWorker] = JobWorker() if JOB_WORKER else None
+
+
+def status(db: Session) -> dict:
+    """Queued jobs by kind and status, when the oldest pending one was enqueued, and the latest failures."""
+    counts: Dict[str, Dict[str, int]] = {}
+    for kind, job_status, count in db.query(models.Job.kind, models.Job.status, func.count()).group_by(models.Job.kind, models.Job.status):
+        counts.setdefault(kind, {})[job_status] = count
+    oldest = db.query(func.min(models.Job.created_at)).filter(models.Job.status == PENDING).scalar()
+    failed = db.query(models.Job).filter(models.Job.status == FAILED).order_by(models.Job.id.desc()).limit(20).all()
+    return dict(counts=counts, oldest_pending=oldest, failed=failed)
+
+
+if __name__ == "__main__":
+    # a worker without the app, e.g. next to app processes started with JOB_WORKER=0
+    from db import crud, jobs  # crud registers the handlers, in db.jobs rather than in this __main__ copy
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(jobs.JobWorker().run_forever())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,226 @@
+"""Request and SQL metrics in the Prometheus text exposition format.
+
+`MetricsMiddleware` times every request and records its status and response size by route
+template. The SQLAlchemy cursor events attribute each statement, and the time it took, to the
+request it ran for through a context variable, which follows the request into `run_sync`
+greenlets, the threadpool and the write queue. Requests slower than SLOW_REQUEST_SECONDS are
+logged with their slowest statements.
+"""
+import heapq
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+SLOW_REQUEST_SECONDS = float(os.environ.get("SLOW_REQUEST_SECONDS", "1.0"))
+SLOW_REQUEST_STATEMENTS = 5
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+def _labels(names: Sequence[str], values: Sequence[str], le: Optional[str] = None) -> str:
+    pairs = list(zip(names, values))
+    if le is not None:
+        pairs.append(("le", le))
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines += self._samples(key, value)
+        return lines
+
+    def _samples(self, key, value) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}"]
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        if not self.labelnames:
+            self._values[()] = 0
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # per bucket counts, then sum and count
+            data = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    data[i] += 1
+            data[-2] += value
+            data[-1] += 1
+
+    def total(self) -> Tuple[float, int]:
+        """Sum and count of the observations over all label values."""
+        with self._lock:
+            return sum(data[-2] for data in self._values.values()), sum(data[-1] for data in self._values.values())
+
+    def _samples(self, key, value) -> List[str]:
+        lines = [f"{self.name}_bucket{_labels(self.labelnames, key, str(bound))} {n}" for bound, n in zip(self.buckets, value)]
+        lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, '+Inf')} {value[-1]}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {value[-2]}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {value[-1]}")
+        return lines
+
+
+REQUESTS = Counter("http_requests_total", "Finished requests.", ("method", "route", "status"))
+LATENCY = Histogram("http_request_duration_seconds", "Time from request to the last byte of the response.", ("method", "route"))
+IN_FLIGHT = Gauge("http_requests_in_flight", "Requests being served.")
+RESPONSE_SIZE = Histogram("http_response_size_bytes", "Response body size.", ("method", "route"), SIZE_BUCKETS)
+DB_STATEMENTS = Histogram("http_request_db_statements", "SQL statements run for a request.", ("method", "route"), STATEMENT_BUCKETS)
+DB_SECONDS = Counter("http_request_db_seconds_total", "Time spent executing SQL statements for requests.", ("method", "route"))
+DB_UNTRACKED = Counter("db_statements_untracked_total", "SQL statements run outside of any request, e.g. group commits.")
+JOBS = Counter("jobs_total", "Background job runs by outcome: done, retry or failed.", ("kind", "outcome"))
+
+METRICS = [REQUESTS, LATENCY, IN_FLIGHT, RESPONSE_SIZE, DB_STATEMENTS, DB_SECONDS, DB_UNTRACKED, JOBS]
+
+
+def render() -> str:
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+class RequestStats:
+    """SQL run for one request: statement count, total time and the slowest few statements."""
+
+    def __init__(self):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+
+    def add(self, statement: str, seconds: float) -> None:
+        self.statements += 1
+        self.sql_seconds += seconds
+        if len(self.slowest) < SLOW_REQUEST_STATEMENTS:
+            heapq.heappush(self.slowest, (seconds, statement))
+        elif seconds > self.slowest[0][0]:
+            heapq.heapreplace(self.slowest, (seconds, statement))
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = current_request.get()
+    if stats is None:
+        DB_UNTRACKED.inc()
+    else:
+        stats.add(statement, elapsed)
+
+
+def _handle_error(context):
+    # a failed statement gets no after_cursor_execute
+    if context.connection is not None and context.connection.info.get("query_start"):
+        context.connection.info["query_start"].pop()
+
+
+def instrument_engine(engine) -> None:
+    engine = getattr(engine, "sync_engine", engine)
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._routes: Dict[object, str] = {}
+
+    def _route(self, scope) -> str:
+        """The path template of the matched route, so /goods/1 and /goods/2 are counted together."""
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if endpoint not in self._routes:
+            self._routes = {getattr(route, "endpoint", None): route.path for route in scope["app"].routes}
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status, size = 500, 0
+
+        async def send_counting(message):
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_counting)
+        finally:
+            elapsed = time.perf_counter() - start
+            IN_FLIGHT.dec()
+            current_request.reset(token)
+            method, route = scope["method"], self._route(scope)
+            REQUESTS.inc(method=method, route=route, status=status)
+            LATENCY.observe(elapsed, method=method, route=route)
+            RESPONSE_SIZE.observe(size, method=method, route=route)
+            DB_STATEMENTS.observe(stats.statements, method=method, route=route)
+            DB_SECONDS.inc(stats.sql_seconds, method=method, route=route)
+            if elapsed >= SLOW_REQUEST_SECONDS:
+                slowest = "".join(f"\n  {seconds:.3f}s {' '.join(statement.split())}" for seconds, statement in sorted(stats.slowest, reverse=True))
+                logger.warning("Slow request %s %s took %.3fs, %d SQL statements in %.3fs. Slowest:%s",
+                               method, scope["path"], elapsed, stats.statements, stats.sql_seconds, slowest)
@@ -1,13 +1,29 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Float, DateTime, LargeBinary
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Float, DateTime, FetchedValue, event, func
+from sqlalchemy.orm import object_session, relationship
 
 from .database import Base
 
 
-class User(Base):
+class Versioned:
+    # counts the updates of a row, for optimistic concurrency control of PATCH requests (see crud.patch_row)
+    # server_onupdate: the version + 1 of an update is read back in the flush, as RETURNING where the
+    # dialect has it, so crud.py needs no refresh after the commit
+    version = Column(Integer, nullable=False, default=1, server_default="1", server_onupdate=FetchedValue())
+
+    __mapper_args__ = {"eager_defaults": True}
+
+
+@event.listens_for(Versioned, "before_update", propagate=True)
+def bump_version(mapper, connection, target):
+    # bulk updates bypass this, crud.bump_versions does it for them
+    if object_session(target).is_modified(target, include_collections=False):
+        target.version = mapper.class_.version + 1
+
+
+class User(Versioned, Base):
     __tablename__ = "users"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String, unique=True, index=True)
     email = Column(String, unique=True, index=True)
     hashed_password = Column(String)
@@ -20,10 +36,10 @@ class User(Base):
     images = relationship("Image", back_populates="user")
     
 
-class Location(Base):
+class Location(Versioned, Base):
     __tablename__ = "locations"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     name = Column(String, index=True)
     public = Column(Boolean, default=True)
@@ -38,48 +54,78 @@ class Location(Base):
     shares = relationship("Share", back_populates="location")
     
 
-class Good(Base):
+class Good(Versioned, Base):
     __tablename__ = "goods"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     title = Column(String, index=True)
-    description = Column(String, index=True)
+    description = Column(String)
     owner_id = Column(Integer, ForeignKey("users.id"))
-    location_id = Column(Integer, ForeignKey("locations.id"))
+    location_id = Column(Integer, ForeignKey("locations.id"), index=True)
 
     owner = relationship("User", back_populates="goods")
     location = relationship("Location", back_populates="goods")
     images = relationship("Image", back_populates="good")
     
 
-class Image(Base):
+class Image(Versioned, Base):
     __tablename__ = "images"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     name = Column(String, index=True)
     url = Column(String)
-    content = Column(LargeBinary)
+    digest = Column(String(64), index=True)
+    size = Column(Integer)
+    updated_at = Column(DateTime)
     mime_type = Column(String, default="image/jpeg")
-    good_id = Column(Integer, ForeignKey("goods.id"))
-    share_id = Column(Integer, ForeignKey("shares.id"))
+    good_id = Column(Integer, ForeignKey("goods.id"), index=True)
+    share_id = Column(Integer, ForeignKey("shares.id"), index=True)
     
     shares = relationship("Share", back_populates="images")
     good = relationship("Good", back_populates="images")
     user = relationship("User", back_populates="images")
     
 
-class Share(Base):
+class Share(Versioned, Base):
     __tablename__ = "shares"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     good_id = Column(Integer, ForeignKey("goods.id"))
-    start_date = Column(DateTime, index=True)
+    start_date = Column(DateTime)
     planned_end_date = Column(DateTime)
     end_date = Column(DateTime)
-    location_id = Column(Integer, ForeignKey("locations.id"))
+    location_id = Column(Integer, ForeignKey("locations.id"), index=True)
 
     images = relationship("Image", back_populates="shares")
     user = relationship("User", back_populates="shares")
     location = relationship("Location", back_populates="shares")
+
+
+class Job(Base):
+    """Work queued to run after a commit, see jobs.py."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String, nullable=False)
+    payload = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    # when a pending job is due, or the lease of a running one ends
+    run_at = Column(DateTime, nullable=False)
+    created_at = Column(DateTime, nullable=False)
+    last_error = Column(String)
+
+
+# the rows of an owner, in the order the list endpoints page them; also serve deletes by (owner, id)
+Index("ix_goods_owner_id_id", Good.owner_id, Good.id)
+Index("ix_locations_user_id_id", Location.user_id, Location.id)
+Index("ix_images_user_id_id", Image.user_id, Image.id)
+Index("ix_shares_user_id_start_date_id", Share.user_id, Share.start_date, Share.id)
+
+# availability lookups: shares of a good by period, end being end_date or else planned_end_date
+Index("ix_shares_good_id_period", Share.good_id, Share.start_date, func.coalesce(Share.end_date, Share.planned_end_date))
+
+# due jobs
+Index("ix_jobs_status_run_at", Job.status, Job.run_at)
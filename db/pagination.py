@@ -0,0 +1,34 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+
+def encode_cursor(*values: Any) -> str:
+    """Opaque cursor for keyset pagination, holding the sort key of the last row of a page."""
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, *types: type) -> List[Any]:
+    """The sort key in `cursor`, checked and converted to `types` (int, float or datetime, from ISO format)."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(types):
+        raise ValueError("Invalid cursor")
+    return [convert(value, t) for value, t in zip(values, types)]
+
+
+def convert(value: Any, t: type) -> Any:
+    # bool is an int to isinstance, but never a sort key
+    if t is datetime and isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+    elif t is float and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    elif t is int and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    raise ValueError("Invalid cursor")
@@ -0,0 +1,46 @@
+from typing import List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .database import async_engine as default_engine
+
+
+class QueryCountExceeded(AssertionError):
+    pass
+
+
+class QueryCounter:
+    """Context manager recording the SQL statements executed on an engine.
+
+    With `limit` set, leaving the block raises QueryCountExceeded when more statements
+    were issued, which makes N+1 regressions fail loudly:
+
+        with QueryCounter(limit=6):
+            client.get("/users/", params={"email": email})
+    """
+
+    def __init__(self, engine: Engine = default_engine, limit: Optional[int] = None):
+        # events of an AsyncEngine are registered on the sync engine it proxies
+        self.engine = getattr(engine, "sync_engine", engine)
+        self.limit = limit
+        self.statements: List[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+    def __enter__(self):
+        self.statements = []
+        event.listen(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        event.remove(self.engine, "before_cursor_execute", self._before_cursor_execute)
+        if exc_type is None and self.limit is not None and self.count > self.limit:
+            raise QueryCountExceeded(
+                f"{self.count} statements executed, expected at most {self.limit}:\n" + "\n".join(self.statements)
+            )
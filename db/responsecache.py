@@ -0,0 +1,118 @@
+"""Cache of serialized responses for public read endpoints, invalidated by tag.
+
+Every tag has a random version token, and the versions of its tags are part of an entry's
+key. Invalidating a tag replaces its token, so all entries built from the old data stop
+being found at once and age out of the LRU/TTL. An entry computed by a read that raced with
+the write is stored under the old version and never served.
+
+The backend is anything with the `get`/`set`/`delete` subset of `redis.asyncio.Redis`: the
+in-process `MemoryBackend` by default, a Redis server when RESPONSE_CACHE_URL is set, or with
+local:///path/to/socket the cache process that server.py shares between its workers.
+"""
+import functools
+import json
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "1") == "1"
+# e.g. redis://localhost:6379/0 (needs the redis package) or local:///path/to/socket (see sharedcache.py);
+# empty keeps the cache in process
+RESPONSE_CACHE_URL = os.environ.get("RESPONSE_CACHE_URL", "")
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "1024"))
+RESPONSE_CACHE_TTL = int(os.environ.get("RESPONSE_CACHE_TTL", "60"))
+
+
+class MemoryBackend:
+    """In-process LRU with the subset of the redis.asyncio.Redis API used by ResponseCache."""
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires is not None and expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        if nx and await self.get(key) is not None:
+            return None
+        self._data[key] = (time.monotonic() + ex if ex else None, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return True
+
+    async def delete(self, *keys: str) -> int:
+        return sum(self._data.pop(key, None) is not None for key in keys)
+
+
+class ResponseCache:
+    def __init__(self, backend, ttl: int = RESPONSE_CACHE_TTL, prefix: str = "response:"):
+        self.backend = backend
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def _version(self, tag: str) -> str:
+        key = f"{self.prefix}tag:{tag}"
+        version = await self.backend.get(key)
+        if version is None:
+            await self.backend.set(key, secrets.token_hex(8).encode(), nx=True)
+            version = await self.backend.get(key)
+        return version.decode() if isinstance(version, bytes) else version
+
+    async def key(self, name: str, tags: Iterable[str], **params) -> str:
+        versions = [await self._version(tag) for tag in tags]
+        return self.prefix + json.dumps([name, versions, sorted(params.items())], separators=(",", ":"))
+
+    async def get(self, key: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        """The cached body and headers."""
+        value = await self.backend.get(key)
+        if value is None:
+            return None
+        headers, body = value.split(b"\n", 1)
+        return body, json.loads(headers)
+
+    async def set(self, key: str, body: bytes, headers: Optional[Dict[str, str]] = None) -> None:
+        await self.backend.set(key, json.dumps(headers or {}).encode() + b"\n" + body, ex=self.ttl)
+
+    async def invalidate(self, *tags: str) -> None:
+        for tag in tags:
+            await self.backend.set(f"{self.prefix}tag:{tag}", secrets.token_hex(8).encode())
+
+
+def create_backend(url: str = RESPONSE_CACHE_URL):
+    if not url:
+        return MemoryBackend()
+    if url.startswith("local://"):
+        from .sharedcache import SocketBackend
+        return SocketBackend(url[len("local://"):])
+    import redis.asyncio
+    return redis.asyncio.Redis.from_url(url)
+
+
+response_cache: Optional[ResponseCache] = None
+if RESPONSE_CACHE:
+    response_cache = ResponseCache(create_backend())
+
+
+def invalidates(*tags: str):
+    """Decorate an async write so the given tags are invalidated once it returned."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def call(*args, **kwargs):
+            res = await fn(*args, **kwargs)
+            if response_cache is not None:
+                await response_cache.invalidate(*tags)
+            return res
+        return call
+    return decorator
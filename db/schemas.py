@@ -1,8 +1,14 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from datetime import datetime
 
-from pydantic import BaseModel
+from pydantic import BaseModel, validator
+
+
+def not_null(value):
+    if value is None:
+        raise ValueError("may be left out, but not null")
+    return value
 
 
 class LocationBase(BaseModel):
@@ -25,10 +31,28 @@ class LocationUpdate(LocationBase):
         orm_mode = True
 
 
+class LocationBulkUpdate(LocationUpdate):
+    id: int
+
+
+class LocationPatch(BaseModel):
+    """Only the fields that are sent are changed."""
+    name: Optional[str]
+    zip: Optional[str]
+    city: Optional[str]
+    address: Optional[str]
+    lat: Optional[float]
+    lon: Optional[float]
+    public: Optional[bool]
+
+    _not_null = validator("*", pre=True, allow_reuse=True)(not_null)
+
+
 class Location(LocationBase):
     id: int
     user_id: int
     public: bool
+    version: int
     
     class Config:
         orm_mode = True
@@ -50,10 +74,28 @@ class ImageUpdate(ImageBase):
     pass
 
 
+class ImageBulkUpdate(ImageUpdate):
+    id: int
+
+
+class ImagePatch(BaseModel):
+    """Only the fields that are sent are changed."""
+    name: Optional[str]
+    url: Optional[str]
+    mime_type: Optional[str]
+    good_id: Optional[int]
+    share_id: Optional[int]
+
+    _not_null = validator("name", pre=True, allow_reuse=True)(not_null)
+
+
 class Image(ImageBase):
     id: int
     user_id: int
-    content: Optional[bytes]
+    digest: Optional[str]
+    size: Optional[int]
+    updated_at: Optional[datetime]
+    version: int
     
     class Config:
         orm_mode = True
@@ -62,6 +104,10 @@ class Image(ImageBase):
 class ImageNoContent(ImageBase):
     id: int
     user_id: int
+    digest: Optional[str]
+    size: Optional[int]
+    updated_at: Optional[datetime]
+    version: int
     
     class Config:
         orm_mode = True
@@ -80,9 +126,23 @@ class GoodUpdate(GoodBase):
     location_id: Optional[int]
 
 
+class GoodBulkUpdate(GoodUpdate):
+    id: int
+
+
+class GoodPatch(BaseModel):
+    """Only the fields that are sent are changed."""
+    title: Optional[str]
+    description: Optional[str]
+    location_id: Optional[int]
+
+    _not_null = validator("title", pre=True, allow_reuse=True)(not_null)
+
+
 class Good(GoodBase):
     id: int
     owner_id: int
+    version: int
     location: Optional[Location] = None
     images: List[ImageNoContent] = []
 
@@ -90,12 +150,17 @@ class Good(GoodBase):
         orm_mode = True
 
 
+class GoodDistance(Good):
+    distance_km: float
+
+
 class ShareBase(BaseModel):
     good_id: int
     start_date: datetime
     
     
 class ShareCreate(ShareBase):
+    planned_end_date: Optional[datetime] = None
     location_id: Optional[int]
 
 
@@ -103,11 +168,27 @@ class ShareUpdate(ShareBase):
     planned_end_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     location_id: Optional[int]
+
+
+class ShareBulkUpdate(ShareUpdate):
+    id: int
     
 
+class SharePatch(BaseModel):
+    """Only the fields that are sent are changed."""
+    good_id: Optional[int]
+    start_date: Optional[datetime]
+    planned_end_date: Optional[datetime]
+    end_date: Optional[datetime]
+    location_id: Optional[int]
+
+    _not_null = validator("good_id", "start_date", pre=True, allow_reuse=True)(not_null)
+
+
 class Share(ShareBase):
     id: int
     user_id: int
+    version: int
     planned_end_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     images: List[ImageNoContent] = []
@@ -117,6 +198,17 @@ class Share(ShareBase):
         orm_mode = True
 
 
+class BusyPeriod(BaseModel):
+    start_date: datetime
+    end_date: Optional[datetime] = None
+
+
+class Availability(BaseModel):
+    good_id: int
+    available: bool
+    busy: List[BusyPeriod] = []
+
+
 class UserBase(BaseModel):
     name: str
 
@@ -133,10 +225,20 @@ class UserUpdate(UserBase):
         orm_mode = True
         
 
+class UserPatch(BaseModel):
+    """Only the fields that are sent are changed."""
+    name: Optional[str]
+    is_active: Optional[bool]
+    public: Optional[bool]
+
+    _not_null = validator("*", pre=True, allow_reuse=True)(not_null)
+
+
 class User(UserBase):
     id: int
     is_active: bool
     public: bool
+    version: int
     goods: List[Good] = []
     locations: List[Location] = []
     shares: List[Share] = []
@@ -144,3 +246,40 @@ class User(UserBase):
 
     class Config:
         orm_mode = True
+
+
+class CurrentUser(BaseModel):
+    id: int
+    email: str
+
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[Any] = None
+
+
+class BulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    items: List[BulkItemResult]
+
+
+class Job(BaseModel):
+    id: int
+    kind: str
+    status: str
+    attempts: int
+    run_at: datetime
+    created_at: datetime
+    last_error: Optional[str]
+
+    class Config:
+        orm_mode = True
+
+
+class JobStatus(BaseModel):
+    # kind -> status -> number of jobs
+    counts: Dict[str, Dict[str, int]]
+    oldest_pending: Optional[datetime]
+    failed: List[Job]
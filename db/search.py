@@ -0,0 +1,52 @@
+import re
+from typing import List
+
+from sqlalchemy import column, false, func, literal_column, table, text
+from sqlalchemy.orm import Query, Session
+
+from . import models
+
+# FTS5 external-content index over goods(title, description), see migration 8f2a6c41d0e3
+goods_fts = table("goods_fts", column("rowid"))
+
+# expression the Postgres GIN index in migration 8f2a6c41d0e3 is built on, must stay identical
+goods_tsvector = func.to_tsvector(
+    literal_column("'simple'"),
+    func.coalesce(models.Good.title, "") + " " + func.coalesce(models.Good.description, ""),
+)
+
+
+def search_terms(q: str) -> List[str]:
+    return re.findall(r"\w+", q.lower())
+
+
+def escape_like(value: str) -> str:
+    """`value` with the LIKE wildcards escaped, for matching it literally with escape="\\"."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def title_contains(q: str):
+    """Case insensitive substring match on the title, the fallback where there is no full-text index."""
+    return models.Good.title.ilike(f"%{escape_like(q)}%", escape="\\")
+
+
+def filter_goods(db: Session, query: Query, q: str) -> Query:
+    """Restrict a goods query to full-text matches of `q`, best matches first.
+
+    Every word of `q` has to match the title or description, the last one as a prefix.
+    """
+    terms = search_terms(q)
+    if not terms:
+        return query.filter(false())
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        match = " ".join(f'"{t}"' for t in terms[:-1]) + f' "{terms[-1]}"*'
+        return (
+            query.join(goods_fts, goods_fts.c.rowid == models.Good.id)
+            .filter(text("goods_fts MATCH :fts_query").bindparams(fts_query=match.strip()))
+            .order_by(text("bm25(goods_fts)"), models.Good.id)
+        )
+    if dialect == "postgresql":
+        tsquery = func.to_tsquery(literal_column("'simple'"), " & ".join(terms[:-1] + [terms[-1] + ":*"]))
+        return query.filter(goods_tsvector.op("@@")(tsquery)).order_by(func.ts_rank(goods_tsvector, tsquery).desc(), models.Good.id)
+    return query.filter(title_contains(q))
@@ -0,0 +1,123 @@
+"""Response cache backend shared by the worker processes of a host, over a Unix socket.
+
+`serve` keeps a MemoryBackend in a process of its own and answers get/set/delete requests on
+a Unix domain socket; `SocketBackend` is its client, with the get/set/delete subset of
+redis.asyncio.Redis that ResponseCache uses. Select it with RESPONSE_CACHE_URL=local:///path;
+server.py starts one for its workers when there is more than one, so a write in any worker
+invalidates the cached responses of all of them.
+
+A request is the op (1 byte: g get, s set, n set if not exists, d delete), the expiry in
+seconds (0 for none), the key length and the value length, then key and value. The reply is
+the length of the value, -1 for none, then the value.
+"""
+import asyncio
+import os
+import socket
+import struct
+import sys
+from typing import List, Optional, Tuple
+
+REQUEST = struct.Struct("!ciII")
+REPLY = struct.Struct("!i")
+
+
+async def handle(backend, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while True:
+            try:
+                op, ex, key_size, value_size = REQUEST.unpack(await reader.readexactly(REQUEST.size))
+                key = (await reader.readexactly(key_size)).decode()
+                value = await reader.readexactly(value_size)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                return
+            if op == b"g":
+                result = await backend.get(key)
+            elif op in (b"s", b"n"):
+                result = b"1" if await backend.set(key, value, ex=ex or None, nx=op == b"n") else None
+            else:
+                result = str(await backend.delete(key)).encode()
+            writer.write(REPLY.pack(-1) if result is None else REPLY.pack(len(result)) + result)
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(path: str, maxsize: int) -> None:
+    # imported here, responsecache imports this module when its backend is a SocketBackend
+    from .responsecache import MemoryBackend
+    backend = MemoryBackend(maxsize)
+    if os.path.exists(path):
+        os.unlink(path)
+    # only this user may connect
+    umask = os.umask(0o077)
+    try:
+        server = await asyncio.start_unix_server(lambda reader, writer: handle(backend, reader, writer), path)
+    finally:
+        os.umask(umask)
+    async with server:
+        await server.serve_forever()
+
+
+def run(path: str, maxsize: int) -> None:
+    try:
+        asyncio.run(serve(path, maxsize))
+    except KeyboardInterrupt:
+        pass
+
+
+def ready(path: str) -> bool:
+    """Whether `serve` accepts connections on `path`."""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as s:
+        try:
+            s.connect(path)
+        except OSError:
+            return False
+    return True
+
+
+class SocketBackend:
+    """Client of `serve`, keeping up to `max_idle` connections open for the next requests."""
+
+    def __init__(self, path: str, max_idle: int = 8):
+        self.path = path
+        self.max_idle = max_idle
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+
+    async def _call(self, op: bytes, key: str, value: bytes = b"", ex: int = 0) -> Optional[bytes]:
+        request = REQUEST.pack(op, ex, len(key.encode()), len(value)) + key.encode() + value
+        while True:
+            reused = bool(self._idle)
+            reader, writer = self._idle.pop() if reused else await asyncio.open_unix_connection(self.path)
+            try:
+                writer.write(request)
+                size, = REPLY.unpack(await reader.readexactly(REPLY.size))
+                result = None if size < 0 else await reader.readexactly(size)
+                break
+            except (asyncio.IncompleteReadError, ConnectionError):
+                writer.close()
+                # an idle connection may have been closed by a restarted server, try a new one
+                if not reused:
+                    raise
+            except BaseException:
+                writer.close()
+                raise
+        if len(self._idle) < self.max_idle:
+            self._idle.append((reader, writer))
+        else:
+            writer.close()
+        return result
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self._call(b"g", key)
+
+    async def set(self, key: str, value: bytes, ex: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        return True if await self._call(b"n" if nx else b"s", key, value, ex or 0) is not None else None
+
+    async def delete(self, *keys: str) -> int:
+        return sum([int(await self._call(b"d", key)) for key in keys])
+
+
+if __name__ == "__main__":
+    # python -m db.sharedcache /path/to/socket, for workers started some other way than server.py
+    from db.responsecache import RESPONSE_CACHE_SIZE
+    run(sys.argv[1], RESPONSE_CACHE_SIZE)
@@ -0,0 +1,49 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Production profile applied to every SQLite connection. Set SQLITE_TUNING=0 to keep SQLite defaults.
+SQLITE_TUNING = os.environ.get("SQLITE_TUNING", "1") != "0"
+SQLITE_PRAGMAS = {
+    # readers no longer block behind writers and a commit is an append to the WAL
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    # in WAL mode NORMAL is still corruption safe, it only skips the fsync per commit
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # negative values are KiB
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", str(-64 * 1024))),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT", "5000")),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+
+def apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def configure_engine(engine: Engine, explicit_transactions: bool = False) -> None:
+    """Apply SQLITE_PRAGMAS on each new connection of `engine` (a sync engine, or `AsyncEngine.sync_engine`).
+
+    `explicit_transactions` makes pysqlite leave transaction control to SQLAlchemy, which is
+    required for SAVEPOINTs (`Session.begin_nested`) to work.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    if SQLITE_TUNING:
+        event.listen(engine, "connect", apply_pragmas)
+    if explicit_transactions:
+        @event.listens_for(engine, "connect")
+        def disable_pysqlite_transactions(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def begin(conn):
+            # execution option sqlite_immediate: take the write lock upfront. A transaction that reads
+            # first fails right away with "database is locked" when it writes after another commit.
+            conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.get_execution_options().get("sqlite_immediate") else "BEGIN")
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Optional, Tuple
+
+BLOB_STORAGE_PATH = os.environ.get("BLOB_STORAGE_PATH", "./blobs")
+
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobStore(ABC):
+    """Content-addressed storage for image bytes, keyed by SHA-256 hex digest.
+
+    Derived files (resized variants) are stored under the digest of their original plus a variant name.
+    Storing content that is there already refreshes its modification time, so the garbage
+    collection of unreferenced blobs (crud.collect_blobs) can leave alone what was just uploaded.
+    """
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        ...
+
+    @abstractmethod
+    def put_file(self, f: BinaryIO) -> Tuple[str, int]:
+        """Store the rest of a file object chunk by chunk; returns (digest, size)."""
+
+    @abstractmethod
+    def put_variant(self, digest: str, variant: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def open(self, digest: str, variant: Optional[str] = None) -> BinaryIO:
+        ...
+
+    @abstractmethod
+    def size(self, digest: str, variant: Optional[str] = None) -> int:
+        ...
+
+    @abstractmethod
+    def exists(self, digest: str, variant: Optional[str] = None) -> bool:
+        ...
+
+    @abstractmethod
+    def delete(self, digest: str, variant: Optional[str] = None) -> None:
+        ...
+
+    @abstractmethod
+    def modified(self, digest: str) -> float:
+        """When the blob was last stored, as a Unix timestamp."""
+
+    def local_path(self, digest: str, variant: Optional[str] = None) -> Optional[str]:
+        """Filesystem path of the blob if the backend keeps one, so it can be served with sendfile."""
+        return None
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root: str = BLOB_STORAGE_PATH):
+        self.root = root
+
+    def _path(self, digest: str, variant: Optional[str] = None) -> str:
+        if not re.fullmatch(r"[0-9a-f]{64}", digest):
+            raise ValueError("Invalid digest")
+        name = digest
+        if variant is not None:
+            if not re.fullmatch(r"[a-z0-9_]+", variant):
+                raise ValueError("Invalid variant")
+            name = f"{digest}.{variant}"
+        return os.path.join(self.root, digest[:2], digest[2:4], name)
+
+    def _write(self, path: str, data: bytes) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temp file in the same directory and rename, so readers never see partial blobs
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            self._write(path, data)
+        return digest
+
+    def put_file(self, f: BinaryIO) -> Tuple[str, int]:
+        os.makedirs(self.root, exist_ok=True)
+        # the digest is only known at the end, so stream into a temp file under root and move it into place
+        fd, tmp = tempfile.mkstemp(dir=self.root)
+        h = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as out:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                    h.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = h.hexdigest()
+            path = self._path(digest)
+            if os.path.exists(path):
+                os.unlink(tmp)
+                os.utime(path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        return digest, size
+
+    def put_variant(self, digest: str, variant: str, data: bytes) -> None:
+        self._write(self._path(digest, variant), data)
+
+    def open(self, digest: str, variant: Optional[str] = None) -> BinaryIO:
+        return open(self._path(digest, variant), "rb")
+
+    def size(self, digest: str, variant: Optional[str] = None) -> int:
+        return os.path.getsize(self._path(digest, variant))
+
+    def exists(self, digest: str, variant: Optional[str] = None) -> bool:
+        return os.path.exists(self._path(digest, variant))
+
+    def delete(self, digest: str, variant: Optional[str] = None) -> None:
+        try:
+            os.unlink(self._path(digest, variant))
+        except FileNotFoundError:
+            pass
+
+    def modified(self, digest: str) -> float:
+        return os.path.getmtime(self._path(digest))
+
+    def local_path(self, digest: str, variant: Optional[str] = None) -> Optional[str]:
+        return self._path(digest, variant)
+
+
+blob_store: BlobStore = LocalBlobStore()
@@ -0,0 +1,90 @@
+"""Resumable uploads in the style of the tus protocol (https://tus.io/protocols/resumable-upload.html).
+
+A client announces the total length, then PATCHes the bytes in as many pieces as it likes, each
+starting at the offset the server reports. The bytes already received live in a partial file,
+so an interrupted upload continues where it stopped. The metadata is kept in a JSON file next
+to it, which keeps uploads visible to every worker process.
+"""
+import json
+import os
+import re
+import secrets
+from typing import Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not on Windows, concurrent PATCHes are not detected there
+    fcntl = None
+
+from .storage import BLOB_STORAGE_PATH, BlobStore
+
+UPLOAD_PATH = os.environ.get("UPLOAD_PATH", os.path.join(BLOB_STORAGE_PATH, "uploads"))
+MAX_UPLOAD_SIZE = int(os.environ.get("MAX_UPLOAD_SIZE", str(100 * 1024 * 1024)))
+
+TUS_VERSION = "1.0.0"
+
+
+class UploadConflict(Exception):
+    pass
+
+
+def _path(upload_id: str, ext: str = "part") -> str:
+    if not re.fullmatch(r"[0-9a-f]{32}", upload_id):
+        raise ValueError("Invalid upload id")
+    return os.path.join(UPLOAD_PATH, f"{upload_id}.{ext}")
+
+
+def create(image_id: int, user_id: int, length: int) -> str:
+    os.makedirs(UPLOAD_PATH, exist_ok=True)
+    upload_id = secrets.token_hex(16)
+    open(_path(upload_id), "wb").close()
+    with open(_path(upload_id, "json"), "w") as f:
+        json.dump({"image_id": image_id, "user_id": user_id, "length": length}, f)
+    return upload_id
+
+
+def info(upload_id: str) -> Optional[dict]:
+    """Metadata plus the current `offset`, or None for unknown uploads."""
+    try:
+        with open(_path(upload_id, "json")) as f:
+            meta = json.load(f)
+        meta["offset"] = os.path.getsize(_path(upload_id))
+    except (ValueError, FileNotFoundError):
+        return None
+    return meta
+
+
+def open_at(upload_id: str, offset: int):
+    """Open the partial file for appending.
+
+    The file stays locked until it is closed, so two PATCHes of the same upload cannot interleave,
+    and the client's offset has to match what was received so far.
+    """
+    f = open(_path(upload_id), "ab")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        current = f.tell()
+    except BlockingIOError:
+        f.close()
+        raise UploadConflict("Upload is in progress")
+    if current != offset:
+        f.close()
+        raise UploadConflict(f"Upload offset is {current}")
+    return f
+
+
+def finish(upload_id: str, store: BlobStore) -> Tuple[str, int]:
+    """Move a complete upload into the blob store; returns (digest, size)."""
+    with open(_path(upload_id), "rb") as f:
+        digest, size = store.put_file(f)
+    delete(upload_id)
+    return digest, size
+
+
+def delete(upload_id: str) -> None:
+    for ext in ("part", "json"):
+        try:
+            os.unlink(_path(upload_id, ext))
+        except FileNotFoundError:
+            pass
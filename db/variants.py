@@ -0,0 +1,75 @@
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional
+
+try:
+    from PIL import Image as PILImage
+except ImportError:  # Pillow is optional, without it only the originals are served
+    PILImage = None
+
+from .storage import BlobStore
+
+logger = logging.getLogger(__name__)
+
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", str(max((os.cpu_count() or 2) // 2, 1))))
+
+# name -> (longest side in px, Pillow format, mime type)
+VARIANTS = {
+    "thumb": (200, "JPEG", "image/jpeg"),
+    "medium": (800, "JPEG", "image/jpeg"),
+    "thumb_webp": (200, "WEBP", "image/webp"),
+    "medium_webp": (800, "WEBP", "image/webp"),
+}
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def generate_variants(store: BlobStore, digest: str) -> None:
+    """Render every missing variant of an original. Runs in a worker process."""
+    missing = [name for name in VARIANTS if not store.exists(digest, name)]
+    if not missing:
+        return
+    with store.open(digest) as f:
+        original = PILImage.open(f)
+        original.load()
+    if original.mode not in ("RGB", "RGBA"):
+        original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+    for name in missing:
+        size, format, _ = VARIANTS[name]
+        img = original.copy()
+        img.thumbnail((size, size))
+        if format == "JPEG" and img.mode != "RGB":
+            img = img.convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format=format, quality=82)
+        store.put_variant(digest, name, buf.getvalue())
+
+
+def _log_failure(future: Future) -> None:
+    exc = future.exception()
+    if exc is not None:
+        logger.warning("Generating image variants failed: %r", exc)
+
+
+def schedule_variants(store: BlobStore, digest: str) -> Optional[Future]:
+    """Queue variant generation on the worker pool; returns None when Pillow is not installed."""
+    global _executor
+    if PILImage is None:
+        return None
+    if _executor is None:
+        # not forked: the app process runs the event loop, database threads and the job worker, whose
+        # locks a fork could copy while held; the workers only need the store and the digest
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    future = _executor.submit(generate_variants, store, digest)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def shutdown() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
@@ -0,0 +1,66 @@
+"""Move image content to blob store
+
+Revision ID: 3d9c1e7a5b20
+Revises: a5893aac2414
+Create Date: 2026-10-18 09:12:41.208512
+
+"""
+import base64
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.storage import blob_store
+
+
+# revision identifiers, used by Alembic.
+revision = '3d9c1e7a5b20'
+down_revision = 'a5893aac2414'
+branch_labels = None
+depends_on = None
+
+
+images = sa.table('images',
+    sa.column('id', sa.Integer()),
+    sa.column('content', sa.LargeBinary()),
+    sa.column('digest', sa.String()),
+    sa.column('size', sa.Integer()),
+)
+
+
+def upgrade():
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.add_column(sa.Column('digest', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('size', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_images_digest'), ['digest'], unique=False)
+
+    conn = op.get_bind()
+    ids = [row.id for row in conn.execute(sa.select([images.c.id]).where(images.c.content.isnot(None)))]
+    # one row at a time, so only a single image is held in memory
+    for image_id in ids:
+        content = conn.execute(sa.select([images.c.content]).where(images.c.id == image_id)).scalar()
+        data = base64.b64decode(content)
+        digest = blob_store.put(data)
+        conn.execute(images.update().where(images.c.id == image_id).values(digest=digest, size=len(data)))
+
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.drop_column('content')
+
+
+def downgrade():
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.add_column(sa.Column('content', sa.LargeBinary(), nullable=True))
+
+    conn = op.get_bind()
+    rows = conn.execute(sa.select([images.c.id, images.c.digest]).where(images.c.digest.isnot(None))).fetchall()
+    for row in rows:
+        if not blob_store.exists(row.digest):
+            continue
+        with blob_store.open(row.digest) as f:
+            content = base64.b64encode(f.read())
+        conn.execute(images.update().where(images.c.id == row.id).values(content=content))
+
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.drop_index(batch_op.f('ix_images_digest'))
+        batch_op.drop_column('size')
+        batch_op.drop_column('digest')
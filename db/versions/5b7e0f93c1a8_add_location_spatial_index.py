@@ -0,0 +1,45 @@
+"""Add location spatial index
+
+Revision ID: 5b7e0f93c1a8
+Revises: 8f2a6c41d0e3
+Create Date: 2026-10-18 10:48:02.137764
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '5b7e0f93c1a8'
+down_revision = '8f2a6c41d0e3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE locations_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+        op.execute("""CREATE TRIGGER locations_rtree_ai AFTER INSERT ON locations BEGIN
+            INSERT INTO locations_rtree SELECT new.id, new.lat, new.lat, new.lon, new.lon WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END""")
+        op.execute("""CREATE TRIGGER locations_rtree_ad AFTER DELETE ON locations BEGIN
+            DELETE FROM locations_rtree WHERE id = old.id;
+        END""")
+        op.execute("""CREATE TRIGGER locations_rtree_au AFTER UPDATE OF lat, lon ON locations BEGIN
+            DELETE FROM locations_rtree WHERE id = old.id;
+            INSERT INTO locations_rtree SELECT new.id, new.lat, new.lat, new.lon, new.lon WHERE new.lat IS NOT NULL AND new.lon IS NOT NULL;
+        END""")
+        op.execute("INSERT INTO locations_rtree SELECT id, lat, lat, lon, lon FROM locations WHERE lat IS NOT NULL AND lon IS NOT NULL")
+    else:
+        op.create_index('ix_locations_lat_lon', 'locations', ['lat', 'lon'], unique=False)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS locations_rtree_au")
+        op.execute("DROP TRIGGER IF EXISTS locations_rtree_ad")
+        op.execute("DROP TRIGGER IF EXISTS locations_rtree_ai")
+        op.execute("DROP TABLE IF EXISTS locations_rtree")
+    else:
+        op.drop_index('ix_locations_lat_lon', table_name='locations')
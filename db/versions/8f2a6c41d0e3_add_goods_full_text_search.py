@@ -0,0 +1,45 @@
+"""Add goods full text search
+
+Revision ID: 8f2a6c41d0e3
+Revises: 3d9c1e7a5b20
+Create Date: 2026-10-18 10:03:17.551920
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8f2a6c41d0e3'
+down_revision = '3d9c1e7a5b20'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE goods_fts USING fts5(title, description, content='goods', content_rowid='id', tokenize='unicode61')")
+        op.execute("""CREATE TRIGGER goods_fts_ai AFTER INSERT ON goods BEGIN
+            INSERT INTO goods_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END""")
+        op.execute("""CREATE TRIGGER goods_fts_ad AFTER DELETE ON goods BEGIN
+            INSERT INTO goods_fts(goods_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+        END""")
+        op.execute("""CREATE TRIGGER goods_fts_au AFTER UPDATE OF title, description ON goods BEGIN
+            INSERT INTO goods_fts(goods_fts, rowid, title, description) VALUES ('delete', old.id, old.title, old.description);
+            INSERT INTO goods_fts(rowid, title, description) VALUES (new.id, new.title, new.description);
+        END""")
+        op.execute("INSERT INTO goods_fts(goods_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute("CREATE INDEX ix_goods_fts ON goods USING gin (to_tsvector('simple', coalesce(title, '') || ' ' || coalesce(description, '')))")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS goods_fts_au")
+        op.execute("DROP TRIGGER IF EXISTS goods_fts_ad")
+        op.execute("DROP TRIGGER IF EXISTS goods_fts_ai")
+        op.execute("DROP TABLE IF EXISTS goods_fts")
+    elif dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_goods_fts")
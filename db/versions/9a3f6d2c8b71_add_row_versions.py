@@ -0,0 +1,29 @@
+"""Add row versions
+
+Revision ID: 9a3f6d2c8b71
+Revises: e4a90b7c3f18
+Create Date: 2026-10-18 16:02:44.180263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9a3f6d2c8b71'
+down_revision = 'e4a90b7c3f18'
+branch_labels = None
+depends_on = None
+
+TABLES = ('users', 'locations', 'goods', 'images', 'shares')
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    # a plain DROP COLUMN (SQLite 3.35+): recreating the tables in batch mode would lose the search and spatial index triggers
+    for table in TABLES:
+        op.drop_column(table, 'version')
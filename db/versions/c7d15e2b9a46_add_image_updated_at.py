@@ -0,0 +1,35 @@
+"""Add image updated_at
+
+Revision ID: c7d15e2b9a46
+Revises: 5b7e0f93c1a8
+Create Date: 2026-10-18 14:05:37.581204
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d15e2b9a46'
+down_revision = '5b7e0f93c1a8'
+branch_labels = None
+depends_on = None
+
+
+images = sa.table('images',
+    sa.column('digest', sa.String()),
+    sa.column('updated_at', sa.DateTime()),
+)
+
+
+def upgrade():
+    op.add_column('images', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    # existing content has no known upload time, start its validators from now
+    op.execute(images.update().where(images.c.digest.isnot(None)).values(updated_at=datetime.utcnow()))
+
+
+def downgrade():
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.drop_column('updated_at')
@@ -0,0 +1,53 @@
+"""Add owner and foreign key indexes
+
+Revision ID: d2c4f7a9e153
+Revises: 9a3f6d2c8b71
+Create Date: 2026-10-18 17:24:51.662018
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2c4f7a9e153'
+down_revision = '9a3f6d2c8b71'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_goods_owner_id_id', 'goods', ['owner_id', 'id'], unique=False)
+    op.create_index('ix_locations_user_id_id', 'locations', ['user_id', 'id'], unique=False)
+    op.create_index('ix_images_user_id_id', 'images', ['user_id', 'id'], unique=False)
+    op.create_index('ix_shares_user_id_start_date_id', 'shares', ['user_id', 'start_date', 'id'], unique=False)
+    op.create_index(op.f('ix_goods_location_id'), 'goods', ['location_id'], unique=False)
+    op.create_index(op.f('ix_shares_location_id'), 'shares', ['location_id'], unique=False)
+    op.create_index(op.f('ix_images_good_id'), 'images', ['good_id'], unique=False)
+    op.create_index(op.f('ix_images_share_id'), 'images', ['share_id'], unique=False)
+    # primary keys are indexed already, descriptions are only searched through the full text index,
+    # and shares by start date only per user (ix_shares_user_id_start_date_id) or good (ix_shares_good_id_period)
+    op.drop_index('ix_users_id', table_name='users')
+    op.drop_index('ix_locations_id', table_name='locations')
+    op.drop_index('ix_goods_id', table_name='goods')
+    op.drop_index('ix_shares_id', table_name='shares')
+    op.drop_index('ix_images_id', table_name='images')
+    op.drop_index('ix_goods_description', table_name='goods')
+    op.drop_index('ix_shares_start_date', table_name='shares')
+
+
+def downgrade():
+    op.create_index('ix_shares_start_date', 'shares', ['start_date'], unique=False)
+    op.create_index('ix_goods_description', 'goods', ['description'], unique=False)
+    op.create_index('ix_images_id', 'images', ['id'], unique=False)
+    op.create_index('ix_shares_id', 'shares', ['id'], unique=False)
+    op.create_index('ix_goods_id', 'goods', ['id'], unique=False)
+    op.create_index('ix_locations_id', 'locations', ['id'], unique=False)
+    op.create_index('ix_users_id', 'users', ['id'], unique=False)
+    op.drop_index(op.f('ix_images_share_id'), table_name='images')
+    op.drop_index(op.f('ix_images_good_id'), table_name='images')
+    op.drop_index(op.f('ix_shares_location_id'), table_name='shares')
+    op.drop_index(op.f('ix_goods_location_id'), table_name='goods')
+    op.drop_index('ix_shares_user_id_start_date_id', table_name='shares')
+    op.drop_index('ix_images_user_id_id', table_name='images')
+    op.drop_index('ix_locations_user_id_id', table_name='locations')
+    op.drop_index('ix_goods_owner_id_id', table_name='goods')
@@ -0,0 +1,24 @@
+"""Add share period index
+
+Revision ID: e4a90b7c3f18
+Revises: c7d15e2b9a46
+Create Date: 2026-10-18 15:21:09.413877
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a90b7c3f18'
+down_revision = 'c7d15e2b9a46'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shares_good_id_period', 'shares', ['good_id', 'start_date', sa.text('coalesce(end_date, planned_end_date)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shares_good_id_period', table_name='shares')
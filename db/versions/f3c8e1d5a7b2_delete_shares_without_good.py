@@ -0,0 +1,26 @@
+"""Delete shares without good
+
+Revision ID: f3c8e1d5a7b2
+Revises: e7b1a4c9d062
+Create Date: 2026-10-18 21:14:08.305127
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3c8e1d5a7b2'
+down_revision = 'e7b1a4c9d062'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # deleting a good used to set good_id of its shares to NULL, which the Share response model rejects
+    op.execute("UPDATE images SET share_id = NULL, version = version + 1 WHERE share_id IN (SELECT id FROM shares WHERE good_id IS NULL)")
+    op.execute("DELETE FROM shares WHERE good_id IS NULL")
+
+
+def downgrade():
+    # the deleted shares are gone
+    pass
@@ -0,0 +1,122 @@
+import asyncio
+import contextvars
+import logging
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+from sqlalchemy.orm import sessionmaker
+
+from .database import engine
+
+logger = logging.getLogger(__name__)
+
+# Set DB_WRITE_QUEUE=1 to funnel all crud writes through a single writer thread with group commits.
+DB_WRITE_QUEUE = os.environ.get("DB_WRITE_QUEUE", "0") == "1"
+DB_WRITE_QUEUE_MAX_BATCH = int(os.environ.get("DB_WRITE_QUEUE_MAX_BATCH", "64"))
+# seconds the writer waits for more jobs before committing a batch that is not full yet
+DB_WRITE_QUEUE_MAX_DELAY = float(os.environ.get("DB_WRITE_QUEUE_MAX_DELAY", "0"))
+
+
+class WriteQueue:
+    """Runs sync crud write functions on one writer thread, committing concurrent writes together.
+
+    Every job runs inside its own SAVEPOINT: the `db.commit()` calls in crud.py release that
+    savepoint, and a failing job only rolls back its own work. The enclosing transaction is
+    committed once per batch, so N concurrent writes cost one commit (and one fsync) instead of N.
+    """
+
+    def __init__(self, session_factory: Callable, max_batch: int = DB_WRITE_QUEUE_MAX_BATCH, max_delay: float = DB_WRITE_QUEUE_MAX_DELAY):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._jobs = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                self._jobs.put(None)
+                self._thread.join()
+                self._thread = None
+
+    async def submit(self, fn: Callable, *args, **kwargs):
+        """Run `fn(session, *args, **kwargs)` on the writer and return its result once the batch is committed."""
+        self.start()
+        future = Future()
+        # the job runs in the caller's context, e.g. so its SQL is counted for the caller's request
+        self._jobs.put((contextvars.copy_context(), fn, args, kwargs, future))
+        return await asyncio.wrap_future(future)
+
+    def _next_batch(self):
+        job = self._jobs.get()
+        if job is None:
+            return None
+        batch = [job]
+        while len(batch) < self.max_batch:
+            try:
+                job = self._jobs.get(timeout=self.max_delay) if self.max_delay else self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # commit what we have, then stop on the next round
+                self._jobs.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            self._commit(batch)
+
+    def _commit(self, batch) -> None:
+        done = []
+        session = self.session_factory()
+        try:
+            # the jobs read before they write; on SQLite another process may write in between. While
+            # another process holds the write lock this fails before any job ran, failing the whole batch
+            session.connection(execution_options={"sqlite_immediate": True})
+            for context, fn, args, kwargs, future in batch:
+                savepoint = session.begin_nested()
+                try:
+                    res = context.run(fn, session, *args, **kwargs)
+                except Exception as exc:
+                    if savepoint.is_active:
+                        savepoint.rollback()
+                    future.set_exception(exc)
+                    continue
+                done.append((future, res))
+            session.commit()
+        except Exception as exc:
+            logger.exception("Group commit of %d writes failed", len(batch))
+            # the batch may have failed before all of its jobs ran, e.g. when the database was locked;
+            # the jobs that ran have been rolled back with it
+            for *_, future in batch:
+                if not future.done():
+                    future.set_exception(exc)
+            try:
+                session.rollback()
+            except Exception:
+                logger.exception("Rollback of the failed group commit failed")
+            return
+        finally:
+            session.close()
+        for future, res in done:
+            future.set_result(res)
+
+
+write_queue: Optional[WriteQueue] = None
+if DB_WRITE_QUEUE:
+    write_queue = WriteQueue(sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False))
@@ -1,13 +1,25 @@
-import base64
-from typing import List, Optional
-
-from fastapi import FastAPI, Depends, HTTPException, File
-from fastapi.responses import Response
+import json
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, List, Optional, Set, Tuple
+
+from fastapi import FastAPI, Depends, HTTPException, File, Header, Query, Request, UploadFile
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
+from pydantic import ValidationError, parse_obj_as
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from starlette.requests import ClientDisconnect
 
-from db import crud, models, schemas
-from db.database import SessionLocal, engine
+from db import async_crud, availability, compression, export, jobs, metrics, models, schemas, serializer, uploads, variants
+from db.crud import VersionConflict
+from db.database import AsyncSessionLocal, async_engine, engine
+from db.pagination import encode_cursor, decode_cursor
+from db.responsecache import response_cache
+from db.storage import blob_store, CHUNK_SIZE
+from db.writequeue import write_queue
 
 
 app = FastAPI(title='Sharegut API', description='PoC backend for sharegut. Create, read, update and delete users, goods, shares, locations and images. Also supports image uploads. WARNING: there is no auth whatsoever.')
@@ -22,207 +34,787 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Image-Variant", "ETag", "Location", "Tus-Resumable", "Tus-Max-Size", "Upload-Offset", "Upload-Length"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
+app.add_middleware(compression.CompressionMiddleware)
+# outermost, so the response sizes it records are the compressed ones
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine)
+
+
+@app.on_event("startup")
+def start_write_queue():
+    if write_queue is not None:
+        write_queue.start()
+
+
+@app.on_event("shutdown")
+def stop_write_queue():
+    if write_queue is not None:
+        write_queue.stop()
+
+
+@app.on_event("shutdown")
+def stop_variant_workers():
+    variants.shutdown()
+
+
+@app.on_event("startup")
+def start_job_worker():
+    if jobs.worker is not None:
+        jobs.worker.start()
+
+
+@app.on_event("shutdown")
+async def stop_job_worker():
+    if jobs.worker is not None:
+        await jobs.worker.stop()
+
+
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+
+@app.get("/metrics", response_class=Response, include_in_schema=False)
+async def read_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/jobs/", response_model=schemas.JobStatus, description="Background jobs that are queued, running or failed, e.g. the cleanup after deleted users.")
+async def read_jobs(db: AsyncSession = Depends(get_db)):
+    return await async_crud.get_job_status(db)
+
+
+def parse_cursor(cursor: Optional[str], *types: type):
+    """The sort key of the last row of the previous page, as `types`; 400 if the cursor does not hold one."""
+    try:
+        return decode_cursor(cursor, *types) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def set_next_cursor(response: Response, rows: list, limit: int, *key: Any):
+    """Point X-Next-Cursor at the row after a full page; `key` is the sort key of its last row."""
+    if len(rows) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(*key)
+
+
+FIELDS_DESCRIPTION = "Comma separated fields to return, e.g. `id,title`. Unselected columns and relationships are not loaded."
+
+
+def parse_fields(fields: Optional[str], schema) -> Optional[Tuple[str, ...]]:
+    """The `fields=` of a list endpoint as field names of `schema`, in schema order."""
+    if fields is None:
+        return None
+    names = {name.strip() for name in fields.split(",")} - {""}
+    unknown = names - set(schema.__fields__)
+    if unknown or not names:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}" if unknown else "No fields selected")
+    return tuple(name for name in schema.__fields__ if name in names)
+
+
+def render_json(schema, obj, fields: Optional[Tuple[str, ...]] = None) -> bytes:
+    """JSON of `obj` (or a list of them) as `schema`, the same bytes the response_model path sends."""
+    if serializer.FAST_JSON or fields is not None:
+        # a projection leaves the other attributes unloaded, pydantic must not touch them
+        return serializer.serialize(schema, obj, fields)
+    return JSONResponse(jsonable_encoder(parse_obj_as(List[schema] if isinstance(obj, list) else schema, obj))).body
+
+
+def response_headers(response: Response) -> dict:
+    """Headers set on the injected `response`, to carry over into a Response returned directly."""
+    return {name: value for name, value in response.headers.items() if name != "content-length"}
+
+
+def json_response(response: Optional[Response], schema, obj, fields: Optional[Tuple[str, ...]] = None):
+    """With FAST_JSON=1 or a `fields=` projection serialize here instead of through the route's response_model."""
+    if not serializer.FAST_JSON and fields is None:
+        return obj
+    return Response(render_json(schema, obj, fields), media_type="application/json", headers=response_headers(response) if response is not None else None)
+
+
+async def cached_response(key: str, encoding: Optional[str]) -> Optional[Response]:
+    """The cached JSON response under `key`, as its `encoding` variant when the client accepts one."""
+    if encoding is not None:
+        cached = await response_cache.get(f"{key}:{encoding}")
+        if cached is not None:
+            body, headers = cached
+            return Response(body, media_type="application/json", headers=headers)
+    cached = await response_cache.get(key)
+    if cached is None:
+        return None
+    body, headers = cached
+    return await compressed_response(key, encoding, body, headers)
+
+
+async def compressed_response(key: str, encoding: Optional[str], body: bytes, headers: dict) -> Response:
+    """Compress a cacheable body once and cache that variant too, instead of leaving it to CompressionMiddleware on every hit."""
+    if encoding is not None and len(body) >= compression.COMPRESSION_MIN_SIZE:
+        body = await run_in_threadpool(compression.compress, encoding, body)
+        headers = dict(headers, **{"Content-Encoding": encoding, "Vary": "Accept-Encoding"})
+        await response_cache.set(f"{key}:{encoding}", body, headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+async def get_current_user(email: str, db: AsyncSession = Depends(get_db)):
+    current_user = await async_crud.resolve_user(db, email)
+    if current_user is None:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    return current_user
+
+
+BULK_MAX_ITEMS = 10000
+NDJSON_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+
+async def read_bulk_items(request: Request, schema) -> Tuple[list, List[schemas.BulkItemResult]]:
+    """Parse a bulk body, a JSON array or NDJSON, and validate every item on its own.
+
+    Returns the valid (index, item) pairs and an error result for each invalid item.
+    """
+    body = await request.body()
+    raw, results = [], []
+    if request.headers.get("content-type", "").split(";")[0].strip() in NDJSON_TYPES:
+        for index, line in enumerate(line for line in body.splitlines() if line.strip()):
+            try:
+                raw.append((index, json.loads(line)))
+            except ValueError:
+                results.append(schemas.BulkItemResult(index=index, error="Invalid JSON"))
+        count = len(raw) + len(results)
+    else:
+        try:
+            items = json.loads(body)
+        except ValueError:
+            items = None
+        if not isinstance(items, list):
+            raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+        raw = list(enumerate(items))
+        count = len(raw)
+    if count > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per request")
+    valid = []
+    for index, item in raw:
+        try:
+            valid.append((index, parse_obj_as(schema, item)))
+        except ValidationError as e:
+            results.append(schemas.BulkItemResult(index=index, error=e.errors()))
+    return valid, results
+
+
+def matched_results(valid: list, found: Set[int]) -> List[schemas.BulkItemResult]:
+    results = []
+    for index, item in valid:
+        item_id = getattr(item, "id", item)
+        results.append(schemas.BulkItemResult(index=index, id=item_id, error=None if item_id in found else "Not found"))
+    return results
+
+
+def bulk_result(results: List[schemas.BulkItemResult]) -> schemas.BulkResult:
+    results.sort(key=lambda r: r.index)
+    failed = sum(1 for r in results if r.error is not None)
+    return schemas.BulkResult(succeeded=len(results) - failed, failed=failed, items=results)
+
+
+def export_response(stream, schema, format: str, filename: str, **kwargs) -> StreamingResponse:
+    """Stream all rows of `stream(db, **kwargs)` as NDJSON or CSV, encoded one partition at a time."""
+    async def body():
+        # own session: the request scoped one from get_db may be closed before streaming ends
+        async with AsyncSessionLocal() as db:
+            if format == "csv":
+                yield export.csv_header(schema)
+            async for rows in stream(db, **kwargs):
+                yield export.to_csv(schema, rows) if format == "csv" else export.to_ndjson(schema, rows)
+    headers = {"Content-Disposition": f'attachment; filename="{filename}.{format}"'}
+    return StreamingResponse(body(), media_type=export.EXPORT_MEDIA_TYPES[format], headers=headers)
 
 
 @app.post("/users/", response_model=schemas.User)
-def create_user(user: schemas.UserCreate, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email=user.email)
+async def create_user(user: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    db_user = await async_crud.get_user_by_email(db, email=user.email)
     if db_user:
         raise HTTPException(status_code=400, detail="Email already registered")
-    db_user = crud.get_user_by_name(db, name=user.name)
+    db_user = await async_crud.get_user_by_name(db, name=user.name)
     if db_user:
         raise HTTPException(status_code=400, detail="Name already registered")
-    return crud.create_user(db=db, user=user)
+    return await async_crud.create_user(db=db, user=user)
 
 
 @app.get("/users/", response_model=List[schemas.User])
-def read_users(email: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    users = crud.get_users(db, email, skip=skip, limit=limit)
-    if not users:
-        raise HTTPException(status_code=401, detail="Not authorized")
-    return users
+async def read_users(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    after = parse_cursor(cursor, int)
+    selected = parse_fields(fields, schemas.User)
+    users = await async_crud.get_users(db, current_user, skip=skip, limit=limit, after=after and after[0], fields=selected)
+    if users:
+        set_next_cursor(response, users, limit, users[-1].id)
+    return json_response(response, schemas.User, users, selected)
 
 
 @app.get("/users/me", response_model=schemas.User)
-def read_user_me(email: str, db: Session = Depends(get_db)):
-    db_user = crud.get_user_by_email(db, email)
+async def read_user_me(email: str, db: AsyncSession = Depends(get_db)):
+    db_user = await async_crud.get_user_by_email(db, email)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    return json_response(None, schemas.User, db_user)
 
 
 @app.get("/users/{user_id}", response_model=schemas.User)
-def read_user(user_id: int, email: str, db: Session = Depends(get_db)):
-    db_user = crud.get_user(db, email, user_id=user_id)
+async def read_user(user_id: int, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_user = await async_crud.get_user(db, current_user, user_id=user_id)
     if db_user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return db_user
+    return json_response(None, schemas.User, db_user)
 
 
-@app.put("/users/{user_id}", response_model=schemas.User)
-def update_user(user_id: int, email: str, user: schemas.UserUpdate, db: Session = Depends(get_db)):
-    res = crud.update_user(db, email, user, user_id)
+# PATCH: sparse updates, optionally conditional on the row version sent as `If-Match: "<version>"`
+
+PATCH_DESCRIPTION = "Only the fields sent are changed. With `If-Match` set to the `ETag` of an earlier response (the row version), the update is only made if nobody changed the row since, else 409."
+
+
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    tag = if_match.strip()
+    tag = tag[2:] if tag.startswith("W/") else tag
+    try:
+        return int(tag.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail='If-Match must be a row version, e.g. "3"')
+
+
+async def patch(response: Response, update, if_match: Optional[str], **kwargs):
+    try:
+        res = await update(version=parse_if_match(if_match), **kwargs)
+    except VersionConflict as e:
+        raise HTTPException(status_code=409, detail=str(e), headers={"ETag": f'"{e.version}"'})
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
+    response.headers["ETag"] = f'"{res.version}"'
     return res
 
 
-@app.delete("/users/{user_id}", response_model=int)
-def delete_user(user_id: int, email: str, db: Session = Depends(get_db)):
-    res = crud.delete_user(db, email, user_id=user_id)
+@app.put("/users/{user_id}", response_model=schemas.User)
+async def update_user(user_id: int, user: schemas.UserUpdate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.update_user(db, current_user, user, user_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
-@app.get("/goods/", response_model=List[schemas.Good])
-def read_goods(skip: int = 0, limit: int = 100, q: Optional[str] = None, db: Session = Depends(get_db)):
-    res = crud.get_goods(db, skip=skip, limit=limit, q=q)
+@app.patch("/users/{user_id}", response_model=schemas.User, description=PATCH_DESCRIPTION)
+async def patch_user(user_id: int, user: schemas.UserPatch, response: Response, if_match: Optional[str] = Header(None), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await patch(response, async_crud.patch_user, if_match, db=db, current_user=current_user, user=user, user_id=user_id)
+
+
+@app.delete("/users/{user_id}", response_model=int)
+async def delete_user(user_id: int, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.delete_user(db, current_user, user_id=user_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.get("/goods/", response_model=List[schemas.Good])
+async def read_goods(response: Response, skip: int = 0, limit: int = 100, q: Optional[str] = None, cursor: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), accept_encoding: Optional[str] = Header(None), db: AsyncSession = Depends(get_db)):
+    if cursor and q is not None:
+        raise HTTPException(status_code=400, detail="Search results are ranked, page them with skip instead of cursor")
+    after = parse_cursor(cursor, int)
+    selected = parse_fields(fields, schemas.Good)
+    if response_cache is not None:
+        key = await response_cache.key("goods", ["goods"], skip=skip, limit=limit, q=q, cursor=cursor, fields=selected)
+        cached = await cached_response(key, compression.negotiate(accept_encoding))
+        if cached is not None:
+            return cached
+    res = await async_crud.get_goods(db, skip=skip, limit=limit, q=q, after=after and after[0], fields=selected)
+    if q is None and res:
+        set_next_cursor(response, res, limit, res[-1].id)
+    if response_cache is None:
+        return json_response(response, schemas.Good, res, selected)
+    body = render_json(schemas.Good, res, selected)
+    headers = response_headers(response)
+    await response_cache.set(key, body, headers)
+    return await compressed_response(key, compression.negotiate(accept_encoding), body, headers)
+
+
+@app.get("/goods/nearby", response_model=List[schemas.GoodDistance], response_description="Goods sorted by distance. If there may be more, the X-Next-Cursor header holds the cursor of the next page.")
+async def read_goods_nearby(response: Response, lat: float = Query(..., ge=-90, le=90), lon: float = Query(..., ge=-180, le=180), radius_km: float = Query(10, gt=0, le=20040), limit: int = 100, cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    after = parse_cursor(cursor, float, int)
+    res = await async_crud.get_goods_nearby(db, lat, lon, radius_km, limit=limit, after=after)
+    if res:
+        good, distance = res[-1]
+        set_next_cursor(response, res, limit, distance, good.id)
+    if serializer.FAST_JSON:
+        body = serializer.dumps([dict(serializer.to_dict(schemas.Good, good), distance_km=distance) for good, distance in res])
+        return Response(body, media_type="application/json", headers=response_headers(response))
+    return [schemas.GoodDistance(**schemas.Good.from_orm(good).dict(), distance_km=distance) for good, distance in res]
+
+
+@app.get("/goods/export", response_class=StreamingResponse, response_description="All goods as NDJSON (one schemas.Good per line) or CSV with nested fields flattened")
+async def export_goods(format: str = Query("ndjson", regex="^(ndjson|csv)$")):
+    return export_response(async_crud.stream_goods, schemas.Good, format, filename="goods")
+
+
+AVAILABILITY_MAX_GOODS = 1000
+
+
+async def read_availability(db: AsyncSession, good_ids: List[int], start: datetime, end: Optional[datetime]) -> List[schemas.Availability]:
+    if end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="`to` must be after `from`")
+    busy = await async_crud.get_availability(db, good_ids, start, end)
+    return [
+        schemas.Availability(good_id=good_id, available=not busy.get(good_id), busy=[schemas.BusyPeriod(start_date=r.start_date, end_date=r.end) for r in busy.get(good_id, [])])
+        for good_id in good_ids
+    ]
+
+
+@app.get("/goods/availability", response_model=List[schemas.Availability], response_description="Per good, whether it is free for the whole of [from, to) and the shares in the way. Without `to` the period is open ended.")
+async def read_goods_availability(good_id: List[int] = Query(...), start: datetime = Query(..., alias="from"), end: Optional[datetime] = Query(None, alias="to"), db: AsyncSession = Depends(get_db)):
+    if len(good_id) > AVAILABILITY_MAX_GOODS:
+        raise HTTPException(status_code=400, detail=f"At most {AVAILABILITY_MAX_GOODS} goods per request")
+    return await read_availability(db, list(dict.fromkeys(good_id)), start, end)
+
+
+@app.get("/goods/{good_id}/availability", response_model=schemas.Availability, response_description="Whether the good is free for the whole of [from, to) and the shares in the way. Without `to` the period is open ended.")
+async def read_good_availability(good_id: int, start: datetime = Query(..., alias="from"), end: Optional[datetime] = Query(None, alias="to"), db: AsyncSession = Depends(get_db)):
+    return (await read_availability(db, [good_id], start, end))[0]
+
+
 @app.post("/users/{user_id}/goods/", response_model=schemas.Good)
-def create_good_for_user(user_id: int, email: str, good: schemas.GoodCreate, db: Session = Depends(get_db)):
-    res = crud.create_user_good(db, email, good=good, user_id=user_id)
+async def create_good_for_user(user_id: int, good: schemas.GoodCreate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.create_user_good(db, current_user, good=good, user_id=user_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.post("/users/{user_id}/goods/bulk", response_model=schemas.BulkResult, response_description="Per item id or validation error, in request order. The body is a JSON array or NDJSON of GoodCreate.")
+async def create_goods_bulk(user_id: int, request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.GoodCreate)
+    ids = await async_crud.bulk_create_goods(db, current_user, [item for _, item in valid], user_id=user_id)
+    if ids is None:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    results += [schemas.BulkItemResult(index=index, id=item_id) for (index, _), item_id in zip(valid, ids)]
+    return bulk_result(results)
+
+
+@app.put("/goods/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of GoodBulkUpdate.")
+async def update_goods_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.GoodBulkUpdate)
+    found = await async_crud.bulk_update_goods(db, current_user, [item for _, item in valid])
+    return bulk_result(results + matched_results(valid, found))
+
+
+@app.delete("/goods/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of ids.")
+async def delete_goods_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, int)
+    found = await async_crud.bulk_delete_goods(db, current_user, [item for _, item in valid])
+    return bulk_result(results + matched_results(valid, found))
+
+
 @app.put("/goods/{good_id}", response_model=schemas.Good)
-def update_good(good_id: int, email: str, good: schemas.GoodUpdate, db: Session = Depends(get_db)):
-    res = crud.update_good(db, email, good=good, good_id=good_id)
+async def update_good(good_id: int, good: schemas.GoodUpdate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.update_good(db, current_user, good=good, good_id=good_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.patch("/goods/{good_id}", response_model=schemas.Good, description=PATCH_DESCRIPTION)
+async def patch_good(good_id: int, good: schemas.GoodPatch, response: Response, if_match: Optional[str] = Header(None), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await patch(response, async_crud.patch_good, if_match, db=db, current_user=current_user, good=good, good_id=good_id)
+
+
 @app.delete("/goods/{good_id}", response_model=int)
-def delete_good(good_id: int, email: str, db: Session = Depends(get_db)):
-    res = crud.delete_good(db, email, good_id=good_id)
+async def delete_good(good_id: int, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.delete_good(db, current_user, good_id=good_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
 @app.get("/locations/", response_model=List[schemas.Location])
-def read_locations(email: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    res = crud.get_locations(db, email, skip=skip, limit=limit)
-    if not res:
-        raise HTTPException(status_code=401, detail="Not authorized")
-    return res
+async def read_locations(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    after = parse_cursor(cursor, int)
+    selected = parse_fields(fields, schemas.Location)
+    res = await async_crud.get_locations(db, current_user, skip=skip, limit=limit, after=after and after[0], fields=selected)
+    if res:
+        set_next_cursor(response, res, limit, res[-1].id)
+    return json_response(response, schemas.Location, res, selected)
 
 
 @app.post("/users/{user_id}/locations/", response_model=schemas.Location)
-def create_location_for_user(user_id: int, email: str, location: schemas.LocationCreate, db: Session = Depends(get_db)):
-    res = crud.create_location(db, email, location=location, user_id=user_id)
+async def create_location_for_user(user_id: int, location: schemas.LocationCreate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.create_location(db, current_user, location=location, user_id=user_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.post("/users/{user_id}/locations/bulk", response_model=schemas.BulkResult, response_description="Per item id or validation error, in request order. The body is a JSON array or NDJSON of LocationCreate.")
+async def create_locations_bulk(user_id: int, request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.LocationCreate)
+    ids = await async_crud.bulk_create_locations(db, current_user, [item for _, item in valid], user_id=user_id)
+    if ids is None:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    results += [schemas.BulkItemResult(index=index, id=item_id) for (index, _), item_id in zip(valid, ids)]
+    return bulk_result(results)
+
+
+@app.put("/locations/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of LocationBulkUpdate.")
+async def update_locations_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.LocationBulkUpdate)
+    found = await async_crud.bulk_update_locations(db, current_user, [item for _, item in valid])
+    return bulk_result(results + matched_results(valid, found))
+
+
+@app.delete("/locations/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of ids.")
+async def delete_locations_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, int)
+    found = await async_crud.bulk_delete_locations(db, current_user, [item for _, item in valid])
+    return bulk_result(results + matched_results(valid, found))
+
+
 @app.put("/locations/{location_id}", response_model=schemas.Location)
-def update_location(location_id: int, email: str, location: schemas.LocationUpdate, db: Session = Depends(get_db)):
-    res = crud.update_location(db, email, location=location, location_id=location_id)
+async def update_location(location_id: int, location: schemas.LocationUpdate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.update_location(db, current_user, location=location, location_id=location_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.patch("/locations/{location_id}", response_model=schemas.Location, description=PATCH_DESCRIPTION)
+async def patch_location(location_id: int, location: schemas.LocationPatch, response: Response, if_match: Optional[str] = Header(None), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await patch(response, async_crud.patch_location, if_match, db=db, current_user=current_user, location=location, location_id=location_id)
+
+
 @app.delete("/location/{location_id}", response_model=int)
-def delete_location(location_id: int, email: str, db: Session = Depends(get_db)):
-    res = crud.delete_location(db, email, location_id=location_id)
+async def delete_location(location_id: int, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.delete_location(db, current_user, location_id=location_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
 @app.get("/shares/", response_model=List[schemas.Share])
-def read_locations(email: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    res = crud.get_shares(db, email, skip=skip, limit=limit)
-    if not res:
-        raise HTTPException(status_code=401, detail="Not authorized")
-    return res
+async def read_shares(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    after = parse_cursor(cursor, datetime, int)
+    selected = parse_fields(fields, schemas.Share)
+    res = await async_crud.get_shares(db, current_user, skip=skip, limit=limit, after=after, fields=selected)
+    if res:
+        set_next_cursor(response, res, limit, res[-1].start_date.isoformat(), res[-1].id)
+    return json_response(response, schemas.Share, res, selected)
+
+
+@app.get("/shares/export", response_class=StreamingResponse, response_description="All shares of the user as NDJSON (one schemas.Share per line) or CSV with nested fields flattened")
+async def export_shares(format: str = Query("ndjson", regex="^(ndjson|csv)$"), current_user: schemas.CurrentUser = Depends(get_current_user)):
+    return export_response(async_crud.stream_shares, schemas.Share, format, filename="shares", current_user=current_user)
 
 
 @app.post("/users/{user_id}/shares/", response_model=schemas.Share)
-def create_share_for_user(user_id: int, email: str, share: schemas.ShareCreate, db: Session = Depends(get_db)):
-    res = crud.create_share(db, email, share=share, user_id=user_id)
+async def create_share_for_user(user_id: int, share: schemas.ShareCreate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    try:
+        res = await async_crud.create_share(db, current_user, share=share, user_id=user_id)
+    except availability.ShareConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+SHARE_OVERLAP = "Overlaps another share of the good"
+
+
+@app.post("/users/{user_id}/shares/bulk", response_model=schemas.BulkResult, response_description="Per item id or validation error, in request order. The body is a JSON array or NDJSON of ShareCreate.")
+async def create_shares_bulk(user_id: int, request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.ShareCreate)
+    ids = await async_crud.bulk_create_shares(db, current_user, [item for _, item in valid], user_id=user_id)
+    if ids is None:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    results += [schemas.BulkItemResult(index=index, id=item_id, error=None if item_id else SHARE_OVERLAP) for (index, _), item_id in zip(valid, ids)]
+    return bulk_result(results)
+
+
+@app.put("/shares/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of ShareBulkUpdate.")
+async def update_shares_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.ShareBulkUpdate)
+    found, rejected = await async_crud.bulk_update_shares(db, current_user, [item for _, item in valid])
+    results += [r if r.id not in rejected else schemas.BulkItemResult(index=r.index, id=r.id, error=SHARE_OVERLAP) for r in matched_results(valid, found)]
+    return bulk_result(results)
+
+
+@app.delete("/shares/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of ids.")
+async def delete_shares_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, int)
+    found = await async_crud.bulk_delete_shares(db, current_user, [item for _, item in valid])
+    return bulk_result(results + matched_results(valid, found))
+
+
 @app.put("/shares/{share_id}", response_model=schemas.Share)
-def update_share(share_id: int, email: str, share: schemas.ShareUpdate, db: Session = Depends(get_db)):
-    res = crud.update_share(db, email, share=share, share_id=share_id)
+async def update_share(share_id: int, share: schemas.ShareUpdate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    try:
+        res = await async_crud.update_share(db, current_user, share=share, share_id=share_id)
+    except availability.ShareConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.patch("/shares/{share_id}", response_model=schemas.Share, description=PATCH_DESCRIPTION)
+async def patch_share(share_id: int, share: schemas.SharePatch, response: Response, if_match: Optional[str] = Header(None), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    try:
+        return await patch(response, async_crud.patch_share, if_match, db=db, current_user=current_user, share=share, share_id=share_id)
+    except availability.ShareConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
 @app.delete("/share/{share_id}", response_model=int)
-def delete_share(share_id: int, email: str, db: Session = Depends(get_db)):
-    res = crud.delete_share(db, email, share_id=share_id)
+async def delete_share(share_id: int, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.delete_share(db, current_user, share_id=share_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
 @app.get("/images/", response_model=List[schemas.ImageNoContent])
-def read_images(email: str, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    res = crud.get_images(db, email, skip=skip, limit=limit)
-    if not res:
-        raise HTTPException(status_code=401, detail="Not authorized")
-    return res
+async def read_images(response: Response, skip: int = 0, limit: int = 100, cursor: Optional[str] = None, fields: Optional[str] = Query(None, description=FIELDS_DESCRIPTION), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    after = parse_cursor(cursor, int)
+    selected = parse_fields(fields, schemas.ImageNoContent)
+    res = await async_crud.get_images(db, current_user, skip=skip, limit=limit, after=after and after[0], fields=selected)
+    if res:
+        set_next_cursor(response, res, limit, res[-1].id)
+    return json_response(response, schemas.ImageNoContent, res, selected)
 
 
 @app.post("/users/{user_id}/images/", response_model=schemas.Image)
-def create_image_for_user(user_id: int, email: str, image: schemas.ImageCreate, db: Session = Depends(get_db)):
-    res = crud.create_image(db, email, image=image, user_id=user_id)
+async def create_image_for_user(user_id: int, image: schemas.ImageCreate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.create_image(db, current_user, image=image, user_id=user_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.post("/users/{user_id}/images/bulk", response_model=schemas.BulkResult, response_description="Per item id or validation error, in request order. The body is a JSON array or NDJSON of ImageCreate.")
+async def create_images_bulk(user_id: int, request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.ImageCreate)
+    ids = await async_crud.bulk_create_images(db, current_user, [item for _, item in valid], user_id=user_id)
+    if ids is None:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    results += [schemas.BulkItemResult(index=index, id=item_id) for (index, _), item_id in zip(valid, ids)]
+    return bulk_result(results)
+
+
+@app.put("/images/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of ImageBulkUpdate.")
+async def update_images_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, schemas.ImageBulkUpdate)
+    found = await async_crud.bulk_update_images(db, current_user, [item for _, item in valid])
+    return bulk_result(results + matched_results(valid, found))
+
+
+@app.delete("/images/bulk", response_model=schemas.BulkResult, response_description="Per item result, in request order. The body is a JSON array or NDJSON of ids.")
+async def delete_images_bulk(request: Request, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    valid, results = await read_bulk_items(request, int)
+    found = await async_crud.bulk_delete_images(db, current_user, [item for _, item in valid])
+    return bulk_result(results + matched_results(valid, found))
+
+
 @app.post("/upload/images/{image_id}", response_model=schemas.ImageNoContent)
-def upload_image_content(image_id: int, email: str, file: bytes = File(...), db: Session = Depends(get_db)):
-    res = crud.add_image_file(db, email, image_id=image_id, content=base64.b64encode(file))
+async def upload_image_content(image_id: int, file: UploadFile = File(...), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    # before the upload is stored, nothing would collect the blob of a rejected one
+    db_image = await async_crud.get_image(db, current_user, image_id=image_id)
+    if not db_image or db_image.user_id != current_user.id:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    digest, size = await run_in_threadpool(blob_store.put_file, file.file)
+    res = await async_crud.add_image_file(db, current_user, image_id=image_id, digest=digest, size=size)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
+    variants.schedule_variants(blob_store, digest)
     return res
 
 
-@app.get("/images/{image_id}", response_class=Response, response_description="Binary image data, content-type as stored in the image model")
-def read_image_content(image_id: int, email: str, db: Session = Depends(get_db)):
-    db_image = crud.get_image(db, email, image_id=image_id)
+# resumable uploads, see db/uploads.py
+
+def upload_info(upload_id: str, current_user: schemas.CurrentUser) -> dict:
+    info = uploads.info(upload_id)
+    if not info or info["user_id"] != current_user.id:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    return info
+
+
+def upload_headers(info: dict) -> dict:
+    return {"Tus-Resumable": uploads.TUS_VERSION, "Upload-Offset": str(info["offset"]), "Upload-Length": str(info["length"]), "Cache-Control": "no-store"}
+
+
+@app.post("/upload/images/{image_id}/resumable", status_code=201, response_class=Response, response_description="Empty. `Location` is the URL to PATCH the content to.")
+async def create_image_upload(image_id: int, upload_length: int = Header(..., ge=0), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if upload_length > uploads.MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="Upload too large", headers={"Tus-Max-Size": str(uploads.MAX_UPLOAD_SIZE)})
+    db_image = await async_crud.get_image(db, current_user, image_id=image_id)
+    if not db_image or db_image.user_id != current_user.id:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    upload_id = await run_in_threadpool(uploads.create, image_id, current_user.id, upload_length)
+    return Response(status_code=201, headers={"Location": f"/upload/resumable/{upload_id}", "Tus-Resumable": uploads.TUS_VERSION, "Upload-Offset": "0"})
+
+
+@app.head("/upload/resumable/{upload_id}", response_class=Response)
+async def read_image_upload(upload_id: str, current_user: schemas.CurrentUser = Depends(get_current_user)):
+    return Response(headers=upload_headers(upload_info(upload_id, current_user)))
+
+
+@app.patch("/upload/resumable/{upload_id}", response_class=Response, response_description="204 with the new `Upload-Offset`, or the image once the last byte arrived.")
+async def append_image_upload(upload_id: str, request: Request, upload_offset: int = Header(...), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    if request.headers.get("content-type") != "application/offset+octet-stream":
+        raise HTTPException(status_code=415, detail="Content-Type must be application/offset+octet-stream")
+    info = upload_info(upload_id, current_user)
+    try:
+        f = await run_in_threadpool(uploads.open_at, upload_id, upload_offset)
+    except uploads.UploadConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    offset = upload_offset
+    try:
+        # each chunk is written as it arrives; whatever made it to disk before a disconnect counts
+        async for chunk in request.stream():
+            if offset + len(chunk) > info["length"]:
+                raise HTTPException(status_code=413, detail="Upload exceeds Upload-Length")
+            await run_in_threadpool(f.write, chunk)
+            offset += len(chunk)
+    except ClientDisconnect:
+        pass
+    finally:
+        await run_in_threadpool(f.close)
+    info["offset"] = offset
+    if offset < info["length"]:
+        return Response(status_code=204, headers=upload_headers(info))
+    digest, size = await run_in_threadpool(uploads.finish, upload_id, blob_store)
+    res = await async_crud.add_image_file(db, current_user, image_id=info["image_id"], digest=digest, size=size)
+    if not res:
+        raise HTTPException(status_code=401, detail="Not authorized")
+    variants.schedule_variants(blob_store, digest)
+    return Response(schemas.ImageNoContent.from_orm(res).json(), media_type="application/json", headers=upload_headers(info))
+
+
+@app.delete("/upload/resumable/{upload_id}", status_code=204, response_class=Response)
+async def delete_image_upload(upload_id: str, current_user: schemas.CurrentUser = Depends(get_current_user)):
+    upload_info(upload_id, current_user)
+    await run_in_threadpool(uploads.delete, upload_id)
+    return Response(status_code=204, headers={"Tus-Resumable": uploads.TUS_VERSION})
+
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive (start, end); multi-range requests are served in full."""
+    m = re.fullmatch(r"bytes=(\d*)-(\d*)", range_header.strip())
+    if not m or m.group(1) == m.group(2) == "":
+        return None
+    if m.group(1) == "":
+        start, end = max(size - int(m.group(2)), 0), size - 1
+    else:
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    if start > end or start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def iter_blob(digest: str, start: int, length: int, variant: Optional[str] = None):
+    with blob_store.open(digest, variant) as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+# `?v=<digest>` makes an image URL content-addressed: what it returns can never change, so it may be cached for good
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == "*":
+        return True
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return etag in [t[2:] if t.startswith("W/") else t for t in tags]
+
+
+def not_modified_since(if_modified_since: str, updated_at: datetime) -> bool:
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have second resolution
+    return updated_at.replace(microsecond=0, tzinfo=timezone.utc) <= since
+
+
+@app.get("/images/{image_id}", response_class=Response, response_description="Binary image data, content-type as stored in the image model. Supports single HTTP byte ranges and conditional requests. `variant` selects a resized copy (thumb, medium, thumb_webp, medium_webp); the original is served while it is not generated yet. With `v` set to the image digest the response is cacheable forever.")
+async def read_image_content(image_id: int, variant: Optional[str] = Query(None, regex="^(" + "|".join(variants.VARIANTS) + ")$"), v: Optional[str] = None, range: Optional[str] = Header(None), if_range: Optional[str] = Header(None), if_none_match: Optional[str] = Header(None), if_modified_since: Optional[str] = Header(None), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    db_image = await async_crud.get_image(db, current_user, image_id=image_id)
     if not db_image:
         raise HTTPException(status_code=401, detail="Not authorized")
-    content = base64.b64decode(db_image.content)
-    return Response(content=content, media_type=db_image.mime_type)
+    if not db_image.digest:
+        raise HTTPException(status_code=404, detail="Image content not found")
+    media_type = db_image.mime_type
+    requested = variant
+    if variant and blob_store.exists(db_image.digest, variant):
+        media_type = variants.VARIANTS[variant][2]
+    else:
+        variant = None
+    etag = f'"{db_image.digest}.{variant}"' if variant else f'"{db_image.digest}"'
+    # a fallback to the original must not be pinned under the variant's URL
+    immutable = v == db_image.digest and variant == requested
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL,
+        "X-Image-Variant": variant or "original",
+    }
+    if db_image.updated_at:
+        headers["Last-Modified"] = format_datetime(db_image.updated_at.replace(tzinfo=timezone.utc), usegmt=True)
+    # If-None-Match takes precedence over If-Modified-Since (RFC 7232, section 6)
+    if if_none_match is not None:
+        not_modified = etag_matches(if_none_match, etag)
+    else:
+        not_modified = bool(if_modified_since and db_image.updated_at and not_modified_since(if_modified_since, db_image.updated_at))
+    if not_modified:
+        return Response(status_code=304, headers=headers)
+    if not blob_store.exists(db_image.digest):
+        raise HTTPException(status_code=404, detail="Image content not found")
+    headers["Accept-Ranges"] = "bytes"
+    size = blob_store.size(db_image.digest, variant)
+    if if_range is not None and if_range.strip() != etag:
+        range = None
+    byte_range = parse_range(range, size) if range else None
+    if byte_range:
+        start, end = byte_range
+        headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+        return StreamingResponse(iter_blob(db_image.digest, start, end - start + 1, variant), status_code=206, media_type=media_type, headers=headers)
+    path = blob_store.local_path(db_image.digest, variant)
+    if path:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(iter_blob(db_image.digest, 0, size, variant), media_type=media_type, headers=headers)
 
 
 @app.put("/images/{image_id}", response_model=schemas.ImageNoContent)
-def update_image(image_id: int, email: str, image: schemas.ImageUpdate, db: Session = Depends(get_db)):
-    res = crud.update_image(db, email, image=image, image_id=image_id)
+async def update_image(image_id: int, image: schemas.ImageUpdate, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.update_image(db, current_user, image=image, image_id=image_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
 
 
+@app.patch("/images/{image_id}", response_model=schemas.ImageNoContent, description=PATCH_DESCRIPTION)
+async def patch_image(image_id: int, image: schemas.ImagePatch, response: Response, if_match: Optional[str] = Header(None), current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    return await patch(response, async_crud.patch_image, if_match, db=db, current_user=current_user, image=image, image_id=image_id)
+
+
 @app.delete("/images/{image_id}", response_model=int)
-def delete_image(image_id: int, email: str, db: Session = Depends(get_db)):
-    res = crud.delete_image(db, email, image_id=image_id)
+async def delete_image(image_id: int, current_user: schemas.CurrentUser = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    res = await async_crud.delete_image(db, current_user, image_id=image_id)
     if not res:
         raise HTTPException(status_code=401, detail="Not authorized")
     return res
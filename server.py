@@ -0,0 +1,80 @@
+"""Run the API in several worker processes: python server.py --workers 4
+
+The workers are uvicorn processes sharing one listening socket. They are started fresh rather
+than forked from a process that imported the app, so each one creates its own database pools,
+write queue, job worker and image process pool. With more than one worker, and unless
+RESPONSE_CACHE_URL points at a cache already, a shared response cache (db/sharedcache.py) runs
+next to them on a Unix socket, so a write in one worker invalidates the cached responses of all.
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import uvicorn
+from uvicorn.supervisors import Multiprocess
+
+from db import sharedcache
+from db.responsecache import RESPONSE_CACHE, RESPONSE_CACHE_SIZE, RESPONSE_CACHE_URL
+
+# the worker count convention of uvicorn and gunicorn
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+
+
+class Supervisor(Multiprocess):
+    """uvicorn's, except that a SIGTERM sent to the supervisor alone, as process managers do, stops
+    the workers too instead of waiting for them forever."""
+
+    def shutdown(self) -> None:
+        for process in self.processes:
+            process.terminate()
+        super().shutdown()
+
+
+def start_shared_cache(path: str, timeout: float = 10) -> multiprocessing.Process:
+    process = multiprocessing.get_context("spawn").Process(target=sharedcache.run, args=(path, RESPONSE_CACHE_SIZE), name="response-cache", daemon=True)
+    process.start()
+    # the workers would fail their first cached requests if the socket was not there yet
+    deadline = time.monotonic() + timeout
+    while not sharedcache.ready(path):
+        if not process.is_alive() or time.monotonic() > deadline:
+            process.terminate()
+            raise RuntimeError("The shared response cache did not start")
+        time.sleep(0.05)
+    return process
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY, help="worker processes, default WEB_CONCURRENCY or the number of CPUs")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    cache, cache_dir = None, None
+    if args.workers > 1 and RESPONSE_CACHE and not RESPONSE_CACHE_URL:
+        cache_dir = tempfile.mkdtemp(prefix="sharegut-")
+        path = os.path.join(cache_dir, "response-cache.sock")
+        cache = start_shared_cache(path)
+        os.environ["RESPONSE_CACHE_URL"] = "local://" + path
+    # image variants are rendered on a process pool per worker, share the CPUs between them
+    os.environ.setdefault("IMAGE_WORKERS", str(max((os.cpu_count() or 2) // 2 // args.workers, 1)))
+    try:
+        config = uvicorn.Config("main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level)
+        server = uvicorn.Server(config)
+        if args.workers > 1:
+            Supervisor(config, target=server.run, sockets=[config.bind_socket()]).run()
+        else:
+            server.run()
+    finally:
+        if cache is not None:
+            cache.terminate()
+            cache.join()
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""The app against a throwaway database.
+
+The tests run on a SQLite database in a new temporary directory, which is also the working
+directory for ./blobs and the uploads. With DATABASE_URL set they run against that database
+instead; it is migrated to head and gets rows added, so it has to be a throwaway one. They
+create users of their own and only look at those users' rows, so they can share the database.
+"""
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks import workspace  # noqa: E402
+
+# before db.database creates its engines on ./database.db
+WORKDIR = workspace.prepare(tempfile.mkdtemp(prefix="sharegut-test-"))
+
+
+def pytest_sessionfinish(session, exitstatus):
+    os.chdir(REPO_ROOT)
+    shutil.rmtree(WORKDIR, ignore_errors=True)
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    from main import app
+    with TestClient(app) as c:
+        yield c
+
+
+@pytest.fixture(scope="session")
+def new_user(client):
+    """Create a user with a unique name and email; returns the created user with its email."""
+    def create(name: str = "test") -> dict:
+        # names are unique too
+        name = f"{name}-{uuid.uuid4().hex}"
+        email = f"{name}@example.com"
+        res = client.post("/users/", json={"name": name, "email": email})
+        assert res.status_code == 200, res.text
+        return dict(res.json(), email=email)
+    return create
+
+
+@pytest.fixture
+def run_jobs(client):
+    """Run the background jobs that are due, as the app's worker does, until none is left."""
+    from db import jobs, models
+    from db.database import SessionLocal
+
+    def running() -> int:
+        db = SessionLocal()
+        try:
+            return db.query(models.Job).filter(models.Job.status == jobs.RUNNING, models.Job.run_at > datetime.utcnow()).count()
+        finally:
+            db.close()
+
+    def run(timeout: float = 10):
+        # on the loop of the TestClient, so the app's worker finishes the jobs it claimed meanwhile
+        loop = asyncio.get_event_loop()
+        deadline = time.monotonic() + timeout
+        while loop.run_until_complete(jobs.JobWorker().run_due()) or running():
+            assert time.monotonic() < deadline, "background jobs did not finish"
+            loop.run_until_complete(asyncio.sleep(0.05))
+    return run
+
+
+@pytest.fixture
+def postgres():
+    """The engine of the test database; skips the test unless DATABASE_URL points at Postgres."""
+    from db.database import engine
+    if engine.dialect.name != "postgresql":
+        pytest.skip("needs DATABASE_URL=postgresql://... of a throwaway database")
+    return engine
@@ -0,0 +1,143 @@
+import threading
+from datetime import datetime
+
+import pytest
+
+import main
+from db import availability, crud, schemas
+from db.database import SessionLocal
+
+
+@pytest.fixture
+def good(client, new_user):
+    """A good without shares, with its owner's id and email."""
+    user = new_user("calendar")
+    res = client.post(f"/users/{user['id']}/goods/", params={"email": user["email"]}, json={"title": "calendar drill", "location_id": None})
+    assert res.status_code == 200, res.text
+    return dict(res.json(), user_id=user["id"], email=user["email"])
+
+
+def day(n: int) -> str:
+    return f"2030-01-{n:02}T00:00:00"
+
+
+def share(client, good: dict, start: int, end: int = None, **fields):
+    body = dict({"good_id": good["id"], "start_date": day(start), "planned_end_date": day(end) if end else None, "location_id": None}, **fields)
+    return client.post(f"/users/{good['user_id']}/shares/", params={"email": good["email"]}, json=body)
+
+
+def available(client, good: dict, start: int, end: int = None) -> dict:
+    params = {"from": day(start)}
+    if end:
+        params["to"] = day(end)
+    res = client.get(f"/goods/{good['id']}/availability", params=params)
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_overlapping_share_is_rejected(client, good):
+    assert share(client, good, 5, 10).status_code == 200
+    for start, end in [(4, 6), (9, 12), (6, 7), (1, 20), (5, 10)]:
+        res = share(client, good, start, end)
+        assert res.status_code == 409, (start, end)
+        assert res.json()["detail"] == "The good is already shared in that period"
+    shares = client.get("/shares/", params={"email": good["email"]}).json()
+    assert len(shares) == 1
+
+
+def test_adjacent_periods(client, good):
+    assert share(client, good, 5, 10).status_code == 200
+    # periods are half open: one may start the moment the other ends
+    assert share(client, good, 10, 12).status_code == 200
+    assert share(client, good, 3, 5).status_code == 200
+    assert share(client, good, 4, 5).status_code == 409
+
+
+def test_open_ended_share(client, good):
+    assert share(client, good, 10).status_code == 200
+    assert share(client, good, 20, 21).status_code == 409
+    assert share(client, good, 8, 10).status_code == 200
+    assert share(client, good, 9).status_code == 409
+
+
+def test_end_date_frees_the_rest_of_the_planned_period(client, good):
+    first = share(client, good, 5, 10).json()
+    assert share(client, good, 7, 9).status_code == 409
+    res = client.patch(f"/shares/{first['id']}", params={"email": good["email"]}, json={"end_date": day(7)})
+    assert res.status_code == 200, res.text
+    assert share(client, good, 7, 9).status_code == 200
+
+
+def test_updates_into_an_overlap(client, good):
+    share(client, good, 5, 10)
+    second = share(client, good, 10, 12).json()
+    path, params = f"/shares/{second['id']}", {"email": good["email"]}
+    res = client.put(path, params=params, json={"good_id": good["id"], "start_date": day(9), "planned_end_date": day(12), "location_id": None})
+    assert res.status_code == 409
+    res = client.patch(path, params=params, json={"start_date": day(8)})
+    assert res.status_code == 409
+    # both were rolled back
+    shares = {s["id"]: s for s in client.get("/shares/", params=params).json()}
+    assert shares[second["id"]]["start_date"] == day(10)
+    assert shares[second["id"]]["version"] == second["version"]
+    res = client.patch(path, params=params, json={"planned_end_date": day(15)})
+    assert res.status_code == 200, res.text
+
+
+def test_availability_of_a_good(client, good):
+    share(client, good, 5, 10)
+    share(client, good, 12)
+    assert available(client, good, 1, 5) == {"good_id": good["id"], "available": True, "busy": []}
+    assert available(client, good, 10, 12)["available"]
+    res = available(client, good, 1, 6)
+    assert not res["available"]
+    assert res["busy"] == [{"start_date": day(5), "end_date": day(10)}]
+    # without `to` until forever, which the open ended share is in the way of
+    res = available(client, good, 10)
+    assert res["busy"] == [{"start_date": day(12), "end_date": None}]
+    assert len(available(client, good, 1)["busy"]) == 2
+
+
+def test_availability_of_many_goods(client, good):
+    other = dict(good, id=client.post(f"/users/{good['user_id']}/goods/", params={"email": good["email"]}, json={"title": "free drill", "location_id": None}).json()["id"])
+    share(client, good, 5, 10)
+    res = client.get("/goods/availability", params={"good_id": [other["id"], good["id"], other["id"]], "from": day(1), "to": day(6)})
+    assert res.status_code == 200, res.text
+    # in request order, without duplicates
+    assert [(a["good_id"], a["available"]) for a in res.json()] == [(other["id"], True), (good["id"], False)]
+
+
+def test_availability_arguments(client, good, monkeypatch):
+    res = client.get(f"/goods/{good['id']}/availability", params={"from": day(5), "to": day(5)})
+    assert res.status_code == 400
+    monkeypatch.setattr(main, "AVAILABILITY_MAX_GOODS", 2)
+    res = client.get("/goods/availability", params={"good_id": [1, 2, 3], "from": day(1)})
+    assert res.status_code == 400
+
+
+def test_concurrent_overlapping_shares(good):
+    """Only one of several writers racing for the same period gets it: the row locks of lock_goods
+    on Postgres, the database write lock on SQLite."""
+    current_user = schemas.CurrentUser(id=good["user_id"], email=good["email"])
+    barrier = threading.Barrier(4)
+    results = []
+
+    def create(start: int):
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            body = schemas.ShareCreate(good_id=good["id"], start_date=datetime(2030, 1, start), planned_end_date=datetime(2030, 1, 10), location_id=None)
+            results.append(crud.create_share(db, current_user, body, good["user_id"]).id)
+        except availability.ShareConflict as e:
+            results.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=create, args=(start,)) for start in range(1, 5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(30)
+    assert len(results) == 4
+    assert sum(isinstance(r, int) for r in results) == 1
+    assert sum(isinstance(r, availability.ShareConflict) for r in results) == 3
@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def user(client, new_user):
+    user = new_user("bulk")
+    res = client.post(f"/users/{user['id']}/goods/", params={"email": user["email"]}, json={"title": "bulk drill", "location_id": None})
+    assert res.status_code == 200, res.text
+    return dict(user, good_id=res.json()["id"])
+
+
+def bulk(client, user: dict, method: str, path: str, items=None, **kwargs):
+    if items is not None:
+        kwargs["json"] = items
+    return client.request(method, path.format(user_id=user["id"]), params={"email": user["email"]}, **kwargs)
+
+
+def errors(result: dict) -> list:
+    return [item["index"] for item in result["items"] if item["error"] is not None]
+
+
+def titles(client, user: dict) -> dict:
+    return {good["id"]: good["title"] for good in client.get("/users/me", params={"email": user["email"]}).json()["goods"]}
+
+
+def test_invalid_items_fail_on_their_own(client, user):
+    res = bulk(client, user, "POST", "/users/{user_id}/goods/bulk", [{"title": "a"}, {"description": "no title"}, {"title": "c"}])
+    assert res.status_code == 200, res.text
+    result = res.json()
+    assert (result["succeeded"], result["failed"]) == (2, 1)
+    assert [item["index"] for item in result["items"]] == [0, 1, 2]
+    assert errors(result) == [1]
+    assert result["items"][1]["error"][0]["loc"][-1] == "title"
+    ids = [item["id"] for item in result["items"] if item["id"]]
+    assert [titles(client, user)[i] for i in ids] == ["a", "c"]
+
+
+def test_ndjson(client, user):
+    body = b'{"title": "x"}\n\nnot json\n{"title": "y"}\n'
+    res = bulk(client, user, "POST", "/users/{user_id}/goods/bulk", data=body, headers={"Content-Type": "application/x-ndjson"})
+    assert res.status_code == 200, res.text
+    result = res.json()
+    # empty lines are skipped, they take no index
+    assert errors(result) == [1]
+    assert result["items"][1]["error"] == "Invalid JSON"
+    assert result["succeeded"] == 2
+
+
+def test_update_and_delete_of_rows_of_others(client, new_user, user):
+    other = new_user("bulk-other")
+    res = bulk(client, other, "PUT", "/goods/bulk", [{"id": user["good_id"], "title": "taken", "location_id": None}])
+    assert errors(res.json()) == [0]
+    assert res.json()["items"][0]["error"] == "Not found"
+    res = bulk(client, other, "DELETE", "/goods/bulk", [user["good_id"], "x"])
+    assert errors(res.json()) == [0, 1]
+    assert titles(client, user)[user["good_id"]] == "bulk drill"
+    res = bulk(client, user, "PUT", "/goods/bulk", [{"id": user["good_id"], "title": "renamed", "location_id": None}])
+    assert res.json()["succeeded"] == 1
+    assert titles(client, user)[user["good_id"]] == "renamed"
+
+
+def test_too_many_items(client, user, monkeypatch):
+    monkeypatch.setattr(main, "BULK_MAX_ITEMS", 2)
+    res = bulk(client, user, "POST", "/users/{user_id}/goods/bulk", [{"title": str(i)} for i in range(3)])
+    assert res.status_code == 413
+    res = bulk(client, user, "POST", "/users/{user_id}/goods/bulk", data="\n".join(json.dumps({"title": str(i)}) for i in range(3)), headers={"Content-Type": "application/x-ndjson"})
+    assert res.status_code == 413
+    res = bulk(client, user, "POST", "/users/{user_id}/goods/bulk", [{"title": str(i)} for i in range(2)])
+    assert res.status_code == 200
+
+
+def test_not_a_list(client, user):
+    res = bulk(client, user, "POST", "/users/{user_id}/goods/bulk", {"title": "x"})
+    assert res.status_code == 400
+
+
+def test_overlapping_shares_are_left_out(client, user):
+    def share(day: int, days: int = 2) -> dict:
+        return {"good_id": user["good_id"], "start_date": f"2030-01-{day:02}T00:00:00", "planned_end_date": f"2030-01-{day + days:02}T00:00:00", "location_id": None}
+
+    res = bulk(client, user, "POST", "/users/{user_id}/shares/bulk", [share(1), share(2), share(3), share(4)])
+    result = res.json()
+    # the 2nd overlaps the 1st; the 3rd starts when the 1st ends, the 4th overlaps the 3rd
+    assert errors(result) == [1, 3]
+    assert {item["error"] for item in result["items"] if item["error"]} == {main.SHARE_OVERLAP}
+    kept = [item["id"] for item in result["items"] if item["id"]]
+    shares = client.get("/shares/", params={"email": user["email"]}).json()
+    assert sorted(s["id"] for s in shares) == kept
+
+    first, third = kept
+    res = bulk(client, user, "PUT", "/shares/bulk", [dict(share(1, 1), id=first), dict(share(1), id=third)])
+    result = res.json()
+    # the 1st gets shorter, the 3rd would still overlap it
+    assert errors(result) == [1]
+    shares = {s["id"]: s for s in client.get("/shares/", params={"email": user["email"]}).json()}
+    assert shares[first]["planned_end_date"] == "2030-01-02T00:00:00"
+    assert shares[third]["start_date"] == "2030-01-03T00:00:00"
@@ -0,0 +1,113 @@
+import gzip
+import uuid
+
+import pytest
+
+import main
+from db import compression
+
+
+@pytest.mark.parametrize("accept_encoding, expected", [
+    (None, None),
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("GZIP", "gzip"),
+    ("deflate, gzip;q=0.5", "gzip"),
+    ("gzip;q=0", None),
+    ("gzip;q=x", None),
+    ("*", "first"),
+    ("*, gzip;q=0", "first but gzip"),
+    ("gzip, zstd, br", "first"),
+    ("gzip;q=1.0, zstd;q=0.5, br;q=0.5", "gzip"),
+])
+def test_negotiate(accept_encoding, expected):
+    if expected == "first":
+        expected = compression.encodings[0]
+    elif expected == "first but gzip":
+        expected = next((e for e in compression.encodings if e != "gzip"), None)
+    assert compression.negotiate(accept_encoding) == expected
+
+
+def test_negotiate_follows_the_server_preference(monkeypatch):
+    monkeypatch.setattr(compression, "encodings", ["gzip", "zstd"])
+    assert compression.negotiate("zstd, gzip") == "gzip"
+    assert compression.negotiate("zstd, br") == "zstd"
+    monkeypatch.setattr(compression, "encodings", [])
+    assert compression.negotiate("gzip") is None
+
+
+def decompress(encoding: str, data: bytes) -> bytes:
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    if encoding == "br":
+        return compression.brotli.decompress(data)
+    return compression.zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def raw(client, path: str, params: dict, encoding: str = None):
+    """The response with its body as sent, not decoded."""
+    res = client.get(path, params=params, headers={"Accept-Encoding": encoding or "identity"}, stream=True)
+    return res, res.raw.read(decode_content=False)
+
+
+@pytest.fixture(scope="module")
+def goods(client, new_user):
+    """`q` finding goods whose JSON is well above COMPRESSION_MIN_SIZE, each shared by their owner."""
+    user = new_user("compressed")
+    q = f"zipped{uuid.uuid4().hex}"
+    for i in range(10):
+        res = client.post(f"/users/{user['id']}/goods/", params={"email": user["email"]}, json={"title": f"{q} {i}", "description": "a long description " * 20, "location_id": None})
+        assert res.status_code == 200, res.text
+        res = client.post(f"/users/{user['id']}/shares/", params={"email": user["email"]}, json={"good_id": res.json()["id"], "start_date": "2030-01-01T00:00:00", "location_id": None})
+        assert res.status_code == 200, res.text
+    return dict(user, q=q)
+
+
+@pytest.mark.parametrize("encoding", ["gzip", "br", "zstd"])
+def test_compressed(client, goods, encoding):
+    if encoding not in compression.encodings:
+        pytest.skip(f"{encoding} is not available")
+    # /users/me is not cached, CompressionMiddleware compresses it
+    for path, params in [("/users/me", {"email": goods["email"]}), ("/goods/", {"q": goods["q"]})]:
+        identity, body = raw(client, path, params)
+        assert "content-encoding" not in identity.headers
+        assert len(body) >= compression.COMPRESSION_MIN_SIZE
+        res, compressed = raw(client, path, params, encoding)
+        assert res.headers["content-encoding"] == encoding
+        assert "Accept-Encoding" in res.headers["vary"]
+        assert int(res.headers["content-length"]) == len(compressed) < len(body)
+        assert decompress(encoding, compressed) == body
+
+
+def test_small_responses_are_not_compressed(client, goods):
+    res, body = raw(client, "/locations/", {"email": goods["email"]}, "gzip")
+    assert len(body) < compression.COMPRESSION_MIN_SIZE
+    assert "content-encoding" not in res.headers
+
+
+def test_export_is_compressed_as_a_stream(client, goods):
+    params = {"email": goods["email"], "format": "csv"}
+    _, body = raw(client, "/shares/export", params)
+    res, compressed = raw(client, "/shares/export", params, "gzip")
+    assert res.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(compressed) == body
+    assert len(body.splitlines()) == 11
+
+
+def test_cached_pages_are_compressed_once(client, goods, monkeypatch):
+    if main.response_cache is None:
+        pytest.skip("RESPONSE_CACHE=0")
+    calls = []
+    compress = compression.compress
+    monkeypatch.setattr(compression, "compress", lambda encoding, data: calls.append(encoding) or compress(encoding, data))
+    params = {"q": goods["q"], "limit": 9}
+    _, body = raw(client, "/goods/", params)
+    first, compressed = raw(client, "/goods/", params, "gzip")
+    assert calls == ["gzip"]
+    again, cached = raw(client, "/goods/", params, "gzip")
+    # served from the cache as compressed before, not by CompressionMiddleware
+    assert calls == ["gzip"]
+    assert cached == compressed
+    assert again.headers["content-encoding"] == "gzip"
+    assert gzip.decompress(cached) == body
@@ -0,0 +1,60 @@
+import random
+import re
+
+import pytest
+
+from db import geo
+from db.querycount import QueryCounter
+
+# somewhere no other test puts locations, different on every run
+CENTER = (random.uniform(-60, 60), random.uniform(-170, 170))
+# km north of CENTER of the goods' locations; the last ones are outside a 10 km radius
+OFFSETS_KM = [0.5, 1.0, 1.0, 2.5, 4.0, 6.0, 9.5, 12.0, 30.0]
+
+
+@pytest.fixture(scope="module")
+def goods(client, new_user):
+    """Ids of goods at OFFSETS_KM from CENTER, in that order."""
+    user = new_user("geo")
+    params = {"email": user["email"]}
+    ids = []
+    for i, km in enumerate(OFFSETS_KM):
+        location = {"name": f"spot {i}", "zip": "00000", "city": "Nowhere", "address": f"Spot {i}", "lat": CENTER[0] + km / geo.KM_PER_DEGREE, "lon": CENTER[1]}
+        res = client.post(f"/users/{user['id']}/locations/", params=params, json=location)
+        assert res.status_code == 200, res.text
+        res = client.post(f"/users/{user['id']}/goods/", params=params, json={"title": f"near {i}", "location_id": res.json()["id"]})
+        assert res.status_code == 200, res.text
+        ids.append(res.json()["id"])
+    return ids
+
+
+def test_pages_in_distance_order(client, goods):
+    seen, distances, cursor = [], [], None
+    while True:
+        params = {"lat": CENTER[0], "lon": CENTER[1], "radius_km": 10, "limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        res = client.get("/goods/nearby", params=params)
+        assert res.status_code == 200, res.text
+        page = res.json()
+        assert len(page) <= 2
+        seen += [good["id"] for good in page]
+        distances += [good["distance_km"] for good in page]
+        cursor = res.headers.get("x-next-cursor")
+        if not cursor:
+            break
+    within = [good_id for good_id, km in zip(goods, OFFSETS_KM) if km <= 10]
+    assert seen == within
+    assert distances == sorted(distances)
+    assert distances == pytest.approx([km for km in OFFSETS_KM if km <= 10], abs=0.01)
+
+
+def test_loads_only_the_page(client, goods):
+    with QueryCounter() as counter:
+        res = client.get("/goods/nearby", params={"lat": CENTER[0], "lon": CENTER[1], "radius_km": 20040, "limit": 3})
+    assert res.status_code == 200, res.text
+    assert [good["id"] for good in res.json()] == goods[:3]
+    # the candidates of the whole box are read as (id, lat, lon), full rows only for the 3 goods of the page
+    loads = [s for s in counter.statements if re.search(r"FROM goods JOIN locations", s) and "goods.title" in s]
+    assert len(loads) == 1
+    assert re.search(r"goods\.id IN \((\S+, ){2}\S+\)", loads[0])
@@ -0,0 +1,151 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+from email.utils import format_datetime, parsedate_to_datetime
+
+import pytest
+
+import main
+from db import variants
+from db.storage import blob_store
+
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de0000000c4944415478da63f8cfc00000030101004f6d2cd20000000049454e44ae426082")
+
+
+@pytest.fixture
+def image(client, new_user):
+    """An image without content, with its owner's email."""
+    user = new_user("images")
+    res = client.post(f"/users/{user['id']}/images/", params={"email": user["email"]}, json={"name": "a.bin", "mime_type": "application/octet-stream"})
+    assert res.status_code == 200, res.text
+    return dict(res.json(), email=user["email"])
+
+
+def upload(client, image: dict, content: bytes, email: str = None):
+    return client.post(f"/upload/images/{image['id']}", params={"email": email or image["email"]}, files={"file": ("a.bin", content, "application/octet-stream")})
+
+
+def test_upload_to_an_image_of_another_user(client, new_user, image):
+    other = new_user("intruder")
+    content = os.urandom(1024)
+    res = upload(client, image, content, email=other["email"])
+    assert res.status_code == 401
+    # rejected before anything was stored
+    assert not blob_store.exists(hashlib.sha256(content).hexdigest())
+    res = upload(client, image, content)
+    assert res.status_code == 200, res.text
+    assert blob_store.exists(hashlib.sha256(content).hexdigest())
+
+
+@pytest.mark.skipif(variants.PILImage is None, reason="needs Pillow")
+def test_variants_are_rendered_in_spawned_workers(client, image):
+    from PIL import features
+    res = upload(client, image, PNG)
+    assert res.status_code == 200, res.text
+    digest = res.json()["digest"]
+    # the webp ones fail where Pillow was built without libwebp
+    variants.schedule_variants(blob_store, digest).exception(timeout=60)
+    assert variants._executor._mp_context.get_start_method() == "spawn"
+    supported = [name for name, (_, format, _) in variants.VARIANTS.items() if format != "WEBP" or features.check("webp")]
+    assert all(blob_store.exists(digest, name) for name in supported)
+
+
+@pytest.fixture
+def content(client, image):
+    """An image with 1000 random bytes of content; the bytes are `data`."""
+    data = os.urandom(1000)
+    res = upload(client, image, data)
+    assert res.status_code == 200, res.text
+    return dict(res.json(), email=image["email"], data=data)
+
+
+def get(client, content: dict, headers: dict = None, **params):
+    return client.get(f"/images/{content['id']}", params=dict(params, email=content["email"]), headers=headers or {})
+
+
+def test_validators(client, content):
+    res = get(client, content)
+    assert res.status_code == 200
+    assert res.content == content["data"]
+    assert res.headers["etag"] == f'"{content["digest"]}"'
+    assert res.headers["cache-control"] == main.REVALIDATE_CACHE_CONTROL
+    assert res.headers["accept-ranges"] == "bytes"
+    assert parsedate_to_datetime(res.headers["last-modified"]).replace(tzinfo=None) == datetime.fromisoformat(content["updated_at"]).replace(microsecond=0)
+
+
+@pytest.mark.parametrize("if_none_match, status", [
+    ('"{digest}"', 304),
+    ('W/"{digest}"', 304),
+    ('"other", "{digest}"', 304),
+    ("*", 304),
+    ('"other"', 200),
+    ('"{digest}.thumb"', 200),
+])
+def test_if_none_match(client, content, if_none_match, status):
+    res = get(client, content, {"If-None-Match": if_none_match.format(digest=content["digest"])})
+    assert res.status_code == status
+    if status == 304:
+        assert res.content == b""
+        assert res.headers["etag"] == f'"{content["digest"]}"'
+
+
+def test_if_modified_since(client, content):
+    last_modified = get(client, content).headers["last-modified"]
+    assert get(client, content, {"If-Modified-Since": last_modified}).status_code == 304
+    earlier = format_datetime(parsedate_to_datetime(last_modified) - timedelta(seconds=1), usegmt=True)
+    assert get(client, content, {"If-Modified-Since": earlier}).status_code == 200
+    assert get(client, content, {"If-Modified-Since": "not a date"}).status_code == 200
+    # If-None-Match decides when both are sent
+    assert get(client, content, {"If-Modified-Since": last_modified, "If-None-Match": '"other"'}).status_code == 200
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=0-9", 0, 9),
+    ("bytes=990-", 990, 999),
+    ("bytes=-10", 990, 999),
+    ("bytes=-5000", 0, 999),
+    ("bytes=500-5000", 500, 999),
+])
+def test_range(client, content, range_header, start, end):
+    res = get(client, content, {"Range": range_header})
+    assert res.status_code == 206
+    assert res.headers["content-range"] == f"bytes {start}-{end}/1000"
+    assert res.content == content["data"][start:end + 1]
+
+
+@pytest.mark.parametrize("range_header", ["bytes=1000-", "bytes=20-10"])
+def test_range_not_satisfiable(client, content, range_header):
+    res = get(client, content, {"Range": range_header})
+    assert res.status_code == 416
+    assert res.headers["content-range"] == "bytes */1000"
+
+
+@pytest.mark.parametrize("range_header", ["bytes=0-1,5-6", "items=0-1", "bytes=-"])
+def test_ranges_served_in_full(client, content, range_header):
+    res = get(client, content, {"Range": range_header})
+    assert res.status_code == 200
+    assert res.content == content["data"]
+
+
+def test_if_range(client, content):
+    res = get(client, content, {"Range": "bytes=0-9", "If-Range": f'"{content["digest"]}"'})
+    assert res.status_code == 206
+    assert res.content == content["data"][:10]
+    # the content changed since the client's partial copy, it gets all of it
+    res = get(client, content, {"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert res.status_code == 200
+    assert res.content == content["data"]
+
+
+def test_versioned_url_is_immutable(client, content):
+    assert get(client, content, v=content["digest"]).headers["cache-control"] == main.IMMUTABLE_CACHE_CONTROL
+    assert get(client, content, v="0" * 64).headers["cache-control"] == main.REVALIDATE_CACHE_CONTROL
+    # served the original instead of a variant that is not there (yet)
+    res = get(client, content, v=content["digest"], variant="thumb")
+    assert res.headers["x-image-variant"] == "original"
+    assert res.headers["cache-control"] == main.REVALIDATE_CACHE_CONTROL
+
+
+def test_image_without_content(client, image):
+    res = client.get(f"/images/{image['id']}", params={"email": image["email"]})
+    assert res.status_code == 404
@@ -0,0 +1,189 @@
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from db import crud, jobs, models
+from db.database import SessionLocal
+from db.storage import blob_store
+
+# what the jobs of the test handlers below were called with
+calls = []
+
+
+@jobs.handler("test_record")
+def record(db, value):
+    calls.append(value)
+
+
+@jobs.handler("test_fail")
+def fail(db, value):
+    raise RuntimeError(f"boom {value}")
+
+
+def day(n: int) -> str:
+    return f"2030-01-{n:02}T00:00:00"
+
+
+def post(client, user: dict, path: str, body: dict) -> dict:
+    res = client.post(path.format(user_id=user["id"]), params={"email": user["email"]}, json=body)
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def shares(client, user: dict) -> list:
+    res = client.get("/shares/", params={"email": user["email"]})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+@pytest.fixture
+def shared_good(client, new_user):
+    """A good of `owner`, shared by its owner and by `other`, with an image of the owner's share."""
+    owner, other = new_user("lender"), new_user("borrower")
+    good = post(client, owner, "/users/{user_id}/goods/", {"title": "lent drill", "location_id": None})
+    own = post(client, owner, "/users/{user_id}/shares/", {"good_id": good["id"], "start_date": day(1), "planned_end_date": day(2), "location_id": None})
+    post(client, other, "/users/{user_id}/shares/", {"good_id": good["id"], "start_date": day(3), "planned_end_date": day(4), "location_id": None})
+    image = post(client, owner, "/users/{user_id}/images/", {"name": "receipt.png", "share_id": own["id"]})
+    return dict(owner=owner, other=other, good=good, image=image)
+
+
+def test_deleting_a_good_deletes_its_shares(client, run_jobs, shared_good):
+    owner, other = shared_good["owner"], shared_good["other"]
+    res = client.delete(f"/goods/{shared_good['good']['id']}", params={"email": owner["email"]})
+    assert res.status_code == 200, res.text
+    run_jobs()
+    # no share without a good, which schemas.Share cannot show
+    assert shares(client, owner) == shares(client, other) == []
+    res = client.get("/users/me", params={"email": owner["email"]})
+    assert res.status_code == 200, res.text
+    images = client.get("/images/", params={"email": owner["email"]}).json()
+    assert [(i["id"], i["good_id"], i["share_id"]) for i in images] == [(shared_good["image"]["id"], None, None)]
+
+
+def test_deleting_a_user_deletes_the_shares_of_their_goods(client, run_jobs, shared_good):
+    owner, other = shared_good["owner"], shared_good["other"]
+    res = client.delete(f"/users/{owner['id']}", params={"email": owner["email"]})
+    assert res.status_code == 200, res.text
+    run_jobs()
+    assert shares(client, other) == []
+    res = client.get("/users/", params={"email": other["email"], "cursor": None, "limit": 1000})
+    assert res.status_code == 200, res.text
+
+
+def job_row(job_id: int) -> models.Job:
+    db = SessionLocal()
+    try:
+        return db.query(models.Job).filter(models.Job.id == job_id).one()
+    finally:
+        db.close()
+
+
+def enqueue(kind: str, **payload) -> int:
+    db = SessionLocal()
+    try:
+        jobs.enqueue(db, kind, **payload)
+        db.commit()
+        return db.query(models.Job.id).filter(models.Job.kind == kind).order_by(models.Job.id.desc()).first().id
+    finally:
+        db.close()
+
+
+def make_due(job_id: int) -> None:
+    db = SessionLocal()
+    try:
+        db.query(models.Job).filter(models.Job.id == job_id).update({models.Job.run_at: datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+    finally:
+        db.close()
+
+
+def remove(job_id: int) -> None:
+    db = SessionLocal()
+    try:
+        db.query(models.Job).filter(models.Job.id == job_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_run_once_and_delete(run_jobs):
+    value = os.urandom(8).hex()
+    job_id = enqueue("test_record", value=value)
+    run_jobs()
+    assert calls.count(value) == 1
+    db = SessionLocal()
+    try:
+        assert db.query(models.Job).filter(models.Job.id == job_id).count() == 0
+    finally:
+        db.close()
+
+
+def test_claim_leases(run_jobs):
+    run_jobs()
+    job_id = enqueue("test_record", value="leased")
+    try:
+        before = datetime.utcnow()
+        assert [job.id for job in jobs.claim()] == [job_id]
+        job = job_row(job_id)
+        assert (job.status, job.attempts) == (jobs.RUNNING, 1)
+        assert job.run_at >= before + timedelta(seconds=jobs.JOB_LEASE_SECONDS)
+        # another worker does not get it while the lease lasts
+        assert job_id not in [job.id for job in jobs.claim()]
+        # but once it expired, e.g. because the worker died
+        make_due(job_id)
+        assert job_id in [job.id for job in jobs.claim()]
+        assert job_row(job_id).attempts == 2
+    finally:
+        remove(job_id)
+
+
+def test_retry_with_backoff_until_failed(client, run_jobs, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_MAX_ATTEMPTS", 3)
+    value = os.urandom(8).hex()
+    job_id = enqueue("test_fail", value=value)
+    try:
+        for attempt in (1, 2):
+            before = datetime.utcnow()
+            run_jobs()
+            job = job_row(job_id)
+            assert (job.status, job.attempts, job.last_error) == (jobs.PENDING, attempt, f"RuntimeError: boom {value}")
+            delay = jobs.JOB_RETRY_SECONDS * 2 ** (attempt - 1)
+            assert before + timedelta(seconds=delay) <= job.run_at <= datetime.utcnow() + timedelta(seconds=delay)
+            make_due(job_id)
+        run_jobs()
+        job = job_row(job_id)
+        assert (job.status, job.attempts) == (jobs.FAILED, 3)
+        # kept for inspection, and not run again
+        run_jobs()
+        assert job_row(job_id).attempts == 3
+        failed = client.get("/jobs/").json()["failed"]
+        assert job_id in [job["id"] for job in failed]
+    finally:
+        remove(job_id)
+
+
+def test_collect_blobs_keeps_recent_and_referenced_blobs():
+    recent, old, referenced = (blob_store.put(os.urandom(64)) for _ in range(3))
+    an_hour_ago = time.time() - 3600
+    for digest in (old, referenced):
+        os.utime(blob_store.local_path(digest), (an_hour_ago, an_hour_ago))
+    db = SessionLocal()
+    try:
+        db.add(models.Image(name="kept.png", digest=referenced, version=1))
+        db.flush()
+        crud.collect_blobs(db, digests=[recent, old, referenced])
+        assert not blob_store.exists(old)
+        assert blob_store.exists(recent) and blob_store.exists(referenced)
+        db.flush()
+        # the recent one is looked at again after the grace period
+        job = db.query(models.Job).filter(models.Job.kind == "collect_blobs").order_by(models.Job.id.desc()).first()
+        assert json.loads(job.payload) == {"digests": [recent]}
+        assert job.run_at >= datetime.utcnow() + timedelta(seconds=crud.BLOB_GRACE_SECONDS - 60)
+    finally:
+        db.rollback()
+        db.close()
+        for digest in (recent, referenced):
+            blob_store.delete(digest)
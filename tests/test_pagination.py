@@ -0,0 +1,56 @@
+import base64
+import json
+
+import pytest
+
+
+def cursor(value) -> str:
+    return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip("=")
+
+
+@pytest.fixture(scope="module")
+def user(client, new_user):
+    user = new_user("pages")
+    for i in range(3):
+        res = client.post(f"/users/{user['id']}/goods/", params={"email": user["email"]}, json={"title": f"page {i}", "location_id": None})
+        assert res.status_code == 200, res.text
+    return user
+
+
+ID_KEYED = ["/users/", "/goods/", "/locations/", "/images/"]
+NEARBY = {"lat": 52.5, "lon": 13.4}
+
+
+@pytest.mark.parametrize("path", ID_KEYED)
+@pytest.mark.parametrize("value", [[{"a": 1}], [[1]], ["x"], [True], [1.5], [None], [1, 2], [], {"id": 1}, "1"])
+def test_id_cursor_of_the_wrong_type(client, user, path, value):
+    res = client.get(path, params={"email": user["email"], "cursor": cursor(value)})
+    assert res.status_code == 400
+    assert res.json() == {"detail": "Invalid cursor"}
+
+
+@pytest.mark.parametrize("value", [[1, 2], ["2020-01-01T00:00:00", "1"], ["yesterday", 1], [20200101, 1], ["2020-01-01T00:00:00", 1.5], [["2020-01-01"], 1]])
+def test_share_cursor_of_the_wrong_type(client, user, value):
+    res = client.get("/shares/", params={"email": user["email"], "cursor": cursor(value)})
+    assert res.status_code == 400
+
+
+@pytest.mark.parametrize("value", [["1.5", 1], [1.5, "1"], [None, 1], [1.5, 1.5], [True, 1]])
+def test_nearby_cursor_of_the_wrong_type(client, value):
+    res = client.get("/goods/nearby", params=dict(NEARBY, cursor=cursor(value)))
+    assert res.status_code == 400
+
+
+def test_not_base64_json(client, user):
+    res = client.get("/goods/", params={"cursor": "!!!"})
+    assert res.status_code == 400
+
+
+def test_cursor_pages(client, user):
+    res = client.get("/users/", params={"email": user["email"], "cursor": cursor([user["id"] - 1]), "limit": 1})
+    assert res.status_code == 200
+    assert [u["id"] for u in res.json()] == [user["id"]]
+    res = client.get("/shares/", params={"email": user["email"], "cursor": cursor(["2020-01-01T00:00:00", 1])})
+    assert res.status_code == 200
+    res = client.get("/goods/nearby", params=dict(NEARBY, cursor=cursor([1, 1])))
+    assert res.status_code == 200
@@ -0,0 +1,94 @@
+import re
+
+import pytest
+
+from db.querycount import QueryCounter
+
+
+@pytest.fixture
+def good(client, new_user):
+    """A good with a description, with its owner's email."""
+    user = new_user("patch")
+    res = client.post(f"/users/{user['id']}/goods/", params={"email": user["email"]}, json={"title": "patch drill", "description": "old", "location_id": None})
+    assert res.status_code == 200, res.text
+    return dict(res.json(), email=user["email"])
+
+
+def patch(client, good: dict, body: dict, if_match: str = None, email: str = None):
+    headers = {"If-Match": if_match} if if_match is not None else {}
+    return client.patch(f"/goods/{good['id']}", params={"email": email or good["email"]}, headers=headers, json=body)
+
+
+def stored(client, good: dict) -> dict:
+    goods = client.get("/users/me", params={"email": good["email"]}).json()["goods"]
+    return next(g for g in goods if g["id"] == good["id"])
+
+
+def test_only_the_fields_sent_are_changed(client, good):
+    with QueryCounter() as counter:
+        res = patch(client, good, {"description": "new"})
+    assert res.status_code == 200, res.text
+    assert res.headers["etag"] == f'"{good["version"] + 1}"'
+    assert (res.json()["title"], res.json()["description"], res.json()["version"]) == ("patch drill", "new", good["version"] + 1)
+    assert stored(client, good) == res.json()
+    updates = [s for s in counter.statements if s.startswith("UPDATE goods")]
+    assert len(updates) == 1
+    # not every column, as merge did
+    assert set(re.findall(r"(\w+)=", updates[0].split(" WHERE ")[0])) == {"description", "version"}
+
+
+def test_if_match(client, good):
+    version = good["version"]
+    res = patch(client, good, {"description": "first"}, if_match=f'"{version}"')
+    assert res.status_code == 200, res.text
+    # a second client still holding the old version
+    res = patch(client, good, {"description": "second"}, if_match=f'"{version}"')
+    assert res.status_code == 409
+    assert res.headers["etag"] == f'"{version + 1}"'
+    assert stored(client, good)["description"] == "first"
+    assert stored(client, good)["version"] == version + 1
+    # weak tags and * match as well
+    assert patch(client, good, {"description": "weak"}, if_match=f'W/"{version + 1}"').status_code == 200
+    assert patch(client, good, {"description": "any"}, if_match="*").status_code == 200
+    assert stored(client, good)["description"] == "any"
+
+
+def test_malformed_if_match(client, good):
+    res = patch(client, good, {"description": "x"}, if_match='"abc"')
+    assert res.status_code == 400
+    assert stored(client, good)["description"] == "old"
+
+
+def test_nulls(client, good):
+    assert patch(client, good, {"title": None}).status_code == 422
+    assert stored(client, good)["title"] == "patch drill"
+    # description is optional, null clears it
+    res = patch(client, good, {"description": None})
+    assert res.status_code == 200, res.text
+    assert res.json()["description"] is None
+
+
+def test_other_nulls(client, new_user):
+    user = new_user("patch-null")
+    params = {"email": user["email"]}
+    res = client.patch(f"/users/{user['id']}", params=params, json={"name": None})
+    assert res.status_code == 422
+    location = client.post(f"/users/{user['id']}/locations/", params=params, json={"name": "Hof", "zip": "10115", "city": "Berlin", "address": "Straße 1", "lat": 52.0, "lon": 13.4}).json()
+    assert client.patch(f"/locations/{location['id']}", params=params, json={"lat": None}).status_code == 422
+    res = client.patch(f"/locations/{location['id']}", params=params, json={"name": "Hinterhof"})
+    assert res.status_code == 200, res.text
+    assert (res.json()["name"], res.json()["lat"]) == ("Hinterhof", 52.0)
+
+
+def test_rows_of_other_users(client, new_user, good):
+    other = new_user("patch-other")
+    assert patch(client, good, {"description": "taken"}, email=other["email"]).status_code == 401
+    # with If-Match too, a conflict would tell the version of someone else's row
+    assert patch(client, good, {"description": "taken"}, if_match='"1"', email=other["email"]).status_code == 401
+    assert stored(client, good)["description"] == "old"
+    assert stored(client, good)["version"] == good["version"]
+
+
+def test_unknown_row(client, good):
+    res = client.patch("/goods/0", params={"email": good["email"]}, json={"description": "x"}, headers={"If-Match": '"1"'})
+    assert res.status_code == 401
@@ -0,0 +1,112 @@
+"""The code paths only Postgres takes: UPDATE ... RETURNING, the tsvector search, the row locks of
+share writes and the sequences after seeding. Run with DATABASE_URL=postgresql://..., see the README.
+"""
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from benchmarks.workspace import REPO_ROOT
+from db import availability, crud, models, schemas
+from db.database import SessionLocal
+from db.querycount import QueryCounter
+
+START = datetime(2030, 1, 1)
+
+
+@pytest.fixture
+def owner(client, new_user):
+    """A user with one good; the good's id is `good_id`."""
+    user = new_user("pg")
+    res = client.post(f"/users/{user['id']}/goods/", params={"email": user["email"]}, json={"title": f"pg {uuid.uuid4().hex} hammer", "location_id": None})
+    assert res.status_code == 200, res.text
+    return dict(user, good_id=res.json()["id"], title=res.json()["title"])
+
+
+def test_patch_is_one_update_returning(client, postgres, owner):
+    path, params = f"/goods/{owner['good_id']}", {"email": owner["email"]}
+    with QueryCounter() as counter:
+        res = client.patch(path, params=params, headers={"If-Match": '"1"'}, json={"description": "patched"})
+    assert res.status_code == 200, res.text
+    assert res.headers["etag"] == '"2"'
+    assert res.json()["description"] == "patched"
+    updates = [s for s in counter.statements if s.startswith("UPDATE goods")]
+    assert len(updates) == 1 and "RETURNING" in updates[0]
+    res = client.patch(path, params=params, headers={"If-Match": '"1"'}, json={"description": "stale"})
+    assert res.status_code == 409
+    assert res.headers["etag"] == '"2"'
+
+
+def test_search_uses_the_tsvector(client, postgres, owner):
+    # a prefix of the last word, as typed so far
+    q = owner["title"].split()[1] + " ham"
+    with QueryCounter() as counter:
+        res = client.get("/goods/", params={"q": q})
+    assert res.status_code == 200, res.text
+    assert [good["id"] for good in res.json()] == [owner["good_id"]]
+    assert any("to_tsvector" in s and "@@" in s for s in counter.statements)
+
+
+def test_share_writes_wait_for_the_good_lock(postgres, owner):
+    current_user = schemas.CurrentUser(id=owner["id"], email=owner["email"])
+    share = schemas.ShareCreate(good_id=owner["good_id"], start_date=START, planned_end_date=START + timedelta(days=7), location_id=None)
+    first = SessionLocal()
+    try:
+        availability.lock_goods(first, [owner["good_id"]])
+        first.add(models.Share(**share.dict(), user_id=owner["id"]))
+        first.flush()
+        errors = []
+
+        def create():
+            db = SessionLocal()
+            try:
+                crud.create_share(db, current_user, share, owner["id"])
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.close()
+
+        second = threading.Thread(target=create)
+        second.start()
+        second.join(0.5)
+        # waiting in lock_goods, SELECT ... FOR UPDATE, for the first transaction
+        assert second.is_alive()
+        first.commit()
+    finally:
+        first.close()
+    second.join(10)
+    assert not second.is_alive()
+    assert len(errors) == 1 and isinstance(errors[0], availability.ShareConflict), errors
+
+
+def test_seed_moves_the_sequences(postgres, tmp_path):
+    name = f"sharegut_seed_{uuid.uuid4().hex}"
+    admin = create_engine(postgres.url, isolation_level="AUTOCOMMIT")
+    try:
+        with admin.connect() as conn:
+            conn.execute(text(f'CREATE DATABASE "{name}"'))
+        url = postgres.url.set(database=name)
+        try:
+            seed = "import sys; from benchmarks import workspace; workspace.prepare(sys.argv[1]); from benchmarks.seed import Volumes, seed; seed(Volumes(2, 2, 2, 2, 2))"
+            subprocess.run([sys.executable, "-c", seed, str(tmp_path)], cwd=REPO_ROOT, env=dict(os.environ, DATABASE_URL=url.render_as_string(hide_password=False)), check=True)
+            seeded = create_engine(url)
+            try:
+                with seeded.begin() as conn:
+                    # rows without an explicit id get the next one instead of colliding with the seeded ids
+                    for table in ("users", "locations", "goods", "shares", "images"):
+                        next_id = conn.execute(text(f"SELECT nextval(pg_get_serial_sequence('{table}', 'id'))")).scalar()
+                        assert next_id == 3, table
+                    user_id = conn.execute(models.User.__table__.insert().values(name="after seed", email="after@example.com").returning(models.User.id)).scalar()
+                    assert user_id == 4
+            finally:
+                seeded.dispose()
+        finally:
+            with admin.connect() as conn:
+                conn.execute(text(f'DROP DATABASE "{name}" WITH (FORCE)'))
+    finally:
+        admin.dispose()
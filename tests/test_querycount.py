@@ -0,0 +1,79 @@
+"""Statement budgets of the read endpoints, so an N+1 regression fails the tests.
+
+Every relationship the responses embed has several rows per parent, so loading one of them
+lazily per row would run more statements than the budget allows.
+"""
+import pytest
+
+from db.querycount import QueryCounter
+
+ROWS = 3
+PNG = bytes.fromhex("89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de0000000c4944415478da63f8cfc00000030101004f6d2cd20000000049454e44ae426082")
+
+# the most statements each request may run, with ROWS goods, locations and shares of 2 images each
+BUDGETS = {
+    "GET /users/": 7,
+    "GET /users/me": 7,
+    "GET /users/{user_id}": 7,
+    "GET /goods/": 2,
+    "GET /goods/?q=": 2,
+    "GET /goods/nearby": 3,
+    "GET /goods/availability": 1,
+    "GET /shares/": 2,
+    "GET /locations/": 1,
+    "GET /images/": 1,
+    "GET /images/{image_id}": 1,
+}
+
+
+@pytest.fixture(scope="module")
+def owner(client, new_user):
+    """A user with ROWS locations, goods and shares, each good and share with a location and two images."""
+    user = new_user("budget")
+    params = {"email": user["email"]}
+    url = lambda path: path.format(user_id=user["id"])
+
+    def post(path, body):
+        res = client.post(url(path), params=params, json=body)
+        assert res.status_code == 200, res.text
+        return res.json()["id"]
+
+    locations = [post("/users/{user_id}/locations/", {"name": f"place {i}", "zip": "10115", "city": "Berlin", "address": f"Street {i}", "lat": 52.52, "lon": 13.40}) for i in range(ROWS)]
+    goods = [post("/users/{user_id}/goods/", {"title": f"budget drill {i}", "description": "for the statement budget", "location_id": locations[i]}) for i in range(ROWS)]
+    shares = [post("/users/{user_id}/shares/", {"good_id": goods[i], "start_date": "2020-01-01T00:00:00", "planned_end_date": "2020-01-08T00:00:00", "location_id": locations[i]}) for i in range(ROWS)]
+    images = []
+    for i in range(ROWS):
+        for k in range(2):
+            images.append(post("/users/{user_id}/images/", {"name": f"good {i} {k}", "good_id": goods[i]}))
+            images.append(post("/users/{user_id}/images/", {"name": f"share {i} {k}", "share_id": shares[i]}))
+    res = client.post(f"/upload/images/{images[0]}", params=params, files={"file": ("pixel.png", PNG, "image/png")})
+    assert res.status_code == 200, res.text
+    return dict(user, goods=goods, images=images)
+
+
+def requests(owner):
+    email = owner["email"]
+    return {
+        "GET /users/": ("/users/", {"email": email}),
+        "GET /users/me": ("/users/me", {"email": email}),
+        "GET /users/{user_id}": (f"/users/{owner['id']}", {"email": email}),
+        "GET /goods/": ("/goods/", {"limit": 20, "skip": 0}),
+        "GET /goods/?q=": ("/goods/", {"q": "budget"}),
+        "GET /goods/nearby": ("/goods/nearby", {"lat": 52.52, "lon": 13.40, "radius_km": 1}),
+        "GET /goods/availability": ("/goods/availability", [("good_id", good_id) for good_id in owner["goods"]] + [("from", "2020-01-01T00:00:00")]),
+        "GET /shares/": ("/shares/", {"email": email}),
+        "GET /locations/": ("/locations/", {"email": email}),
+        "GET /images/": ("/images/", {"email": email}),
+        "GET /images/{image_id}": (f"/images/{owner['images'][0]}", {"email": email}),
+    }
+
+
+@pytest.mark.parametrize("name", BUDGETS)
+def test_statement_budget(client, owner, name):
+    path, params = requests(owner)[name]
+    # the caller's id is cached after the first request, the budgets leave that lookup out
+    client.get("/users/me", params={"email": owner["email"]})
+    with QueryCounter() as counter:
+        res = client.get(path, params=params)
+    assert res.status_code == 200, res.text
+    assert counter.count <= BUDGETS[name], f"{counter.count} statements, budget {BUDGETS[name]}:\n" + "\n".join(counter.statements)
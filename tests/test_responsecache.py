@@ -0,0 +1,74 @@
+import time
+import uuid
+
+import pytest
+
+import main
+from db import jobs
+from db.database import engine
+from db.querycount import QueryCounter
+
+
+@pytest.fixture
+def good(client, new_user):
+    """A good at a location, titled with a word of its own to search for as `q`."""
+    if main.response_cache is None:
+        pytest.skip("RESPONSE_CACHE=0")
+    user = new_user("cached")
+    params = {"email": user["email"]}
+    location = client.post(f"/users/{user['id']}/locations/", params=params, json={"name": "Hof", "zip": "10115", "city": "Berlin", "address": "Straße 1", "lat": 52.0, "lon": 13.4}).json()
+    q = f"cached{uuid.uuid4().hex}"
+    res = client.post(f"/users/{user['id']}/goods/", params=params, json={"title": f"{q} drill", "location_id": location["id"]})
+    assert res.status_code == 200, res.text
+    return dict(res.json(), q=q, email=user["email"], user_id=user["id"])
+
+
+def search(client, good: dict) -> list:
+    res = client.get("/goods/", params={"q": good["q"]})
+    assert res.status_code == 200, res.text
+    return res.json()
+
+
+def test_hits_run_no_sql(client, good):
+    first = search(client, good)
+    with QueryCounter() as counter:
+        assert search(client, good) == first
+    assert counter.count == 0
+
+
+def test_patch_invalidates(client, good):
+    assert search(client, good)[0]["description"] is None
+    res = client.patch(f"/goods/{good['id']}", params={"email": good["email"]}, json={"description": "patched"})
+    assert res.status_code == 200, res.text
+    assert search(client, good)[0]["description"] == "patched"
+
+
+def test_bulk_update_invalidates(client, good):
+    search(client, good)
+    res = client.put("/goods/bulk", params={"email": good["email"]}, json=[{"id": good["id"], "title": f"{good['q']} hammer", "description": "bulk", "location_id": None}])
+    assert res.json()["succeeded"] == 1
+    found = search(client, good)
+    assert (found[0]["title"], found[0]["location"]) == (f"{good['q']} hammer", None)
+
+
+def test_bulk_create_invalidates(client, good):
+    assert len(search(client, good)) == 1
+    res = client.post(f"/users/{good['user_id']}/goods/bulk", params={"email": good["email"]}, json=[{"title": f"{good['q']} saw", "location_id": None}])
+    assert res.json()["succeeded"] == 1
+    assert len(search(client, good)) == 2
+
+
+def test_job_invalidates(client, good, monkeypatch):
+    version = good["version"]
+    # jobs wait until the page is cached
+    monkeypatch.setattr(jobs, "claim", lambda limit: [])
+    res = client.delete(f"/location/{good['location']['id']}", params={"email": good["email"]})
+    assert res.status_code == 200, res.text
+    if engine.dialect.name == "sqlite":
+        # the job that detaches the good from the location has not run yet
+        assert search(client, good)[0]["version"] == version
+    monkeypatch.undo()
+    deadline = time.monotonic() + 10
+    while search(client, good)[0]["version"] == version:
+        assert time.monotonic() < deadline, "the cached page still has the good as it was before the job"
+        time.sleep(0.05)
@@ -0,0 +1,32 @@
+import pytest
+
+from db import models
+from db.database import SessionLocal
+from db.search import title_contains
+
+
+@pytest.fixture(scope="module")
+def owner_id(client, new_user):
+    user = new_user("search")
+    titles = ["100% wool", "100 percent wool", "snake_case", "snakeXcase", "back\\slash"]
+    for title in titles:
+        res = client.post(f"/users/{user['id']}/goods/", params={"email": user["email"]}, json={"title": title, "location_id": None})
+        assert res.status_code == 200, res.text
+    return user["id"]
+
+
+@pytest.mark.parametrize("q, expected", [
+    ("%", ["100% wool"]),
+    ("0% w", ["100% wool"]),
+    ("_", ["snake_case"]),
+    ("e_c", ["snake_case"]),
+    ("\\", ["back\\slash"]),
+    ("wool", ["100 percent wool", "100% wool"]),
+])
+def test_like_fallback_matches_wildcards_literally(owner_id, q, expected):
+    db = SessionLocal()
+    try:
+        matches = db.query(models.Good.title).filter(models.Good.owner_id == owner_id, title_contains(q))
+        assert sorted(title for title, in matches) == expected
+    finally:
+        db.close()
@@ -0,0 +1,140 @@
+"""The FAST_JSON serializer against the stock path: pydantic validation, jsonable_encoder, JSONResponse.
+
+Both must produce the same bytes for every response schema, with orjson and with the json
+module it falls back to.
+"""
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from typing import List, Optional, Tuple
+
+import pytest
+from fastapi.encoders import jsonable_encoder
+from pydantic import parse_obj_as
+from starlette.responses import JSONResponse
+
+import main
+from db import schemas, serializer
+from db.pagination import encode_cursor
+
+NOW = datetime(2021, 3, 14, 15, 9, 26, 535897)
+
+
+def stock(schema, obj, fields: Optional[Tuple[str, ...]] = None) -> bytes:
+    """What the route's response_model produces, restricted to `fields` when given."""
+    parsed = parse_obj_as(List[schema] if isinstance(obj, list) else schema, obj)
+    return JSONResponse(jsonable_encoder(parsed, include=set(fields) if fields else None)).body
+
+
+@pytest.fixture(params=["orjson", "json"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        if serializer.orjson is None:
+            pytest.skip("orjson is not installed")
+    else:
+        monkeypatch.setattr(serializer, "orjson", None)
+    return request.param
+
+
+def location(i: int, **changes):
+    return SimpleNamespace(**dict(dict(id=i, user_id=1, name=f"Spot {i}", zip="10115", city="Berlin", address="Straße 1 – Hof", lat=52, lon=13.404954, public=True, version=1), **changes))
+
+
+def image(i: int, **changes):
+    return SimpleNamespace(**dict(dict(id=i, user_id=1, name=f"image {i}.png", url=None, mime_type="image/png", good_id=1, share_id=None, digest="ab" * 32, size=1234, updated_at=NOW, version=3), **changes))
+
+
+def good(i: int, **changes):
+    return SimpleNamespace(**dict(dict(id=i, owner_id=1, title=f"Drill {i}", description=None, version=2, location=location(i), images=[image(i), image(i + 100, updated_at=None, digest=None, size=None)]), **changes))
+
+
+def share(i: int, **changes):
+    return SimpleNamespace(**dict(dict(id=i, user_id=1, good_id=i, start_date=NOW, planned_end_date=NOW + timedelta(days=7), end_date=None, version=1, location=None, images=[image(i, share_id=i, good_id=None)]), **changes))
+
+
+def user(i: int, **changes):
+    return SimpleNamespace(**dict(dict(id=i, name="Zoë \"quoted\" \\ user", is_active=True, public=False, version=1, goods=[good(1), good(2, location=None, images=[])], locations=[location(1), location(2, lat=-0.5)], shares=[share(1), share(2, end_date=NOW.replace(tzinfo=timezone.utc))], images=[]), **changes))
+
+
+CASES = {
+    "Location": (schemas.Location, [location(1), location(2, lat=0, lon=-180)]),
+    "Image": (schemas.Image, [image(1), image(2, url="https://example.com/a?b=c&d", good_id=None, share_id=7, updated_at=NOW.replace(microsecond=0))]),
+    "ImageNoContent": (schemas.ImageNoContent, [image(1), image(2, mime_type=None)]),
+    "Good": (schemas.Good, [good(1), good(2, description="émoji 🚀", location=None, images=[])]),
+    "GoodDistance": (schemas.GoodDistance, [SimpleNamespace(**vars(good(1)), distance_km=0.0), SimpleNamespace(**vars(good(2)), distance_km=12.345678)]),
+    "Share": (schemas.Share, [share(1), share(2, location=location(3), planned_end_date=None, end_date=NOW + timedelta(days=1))]),
+    "User": (schemas.User, [user(1), user(2, goods=[], locations=[], shares=[])]),
+    # the routes build these as models, not from ORM rows
+    "Availability": (schemas.Availability, [schemas.Availability(good_id=1, available=True), schemas.Availability(good_id=2, available=False, busy=[schemas.BusyPeriod(start_date=NOW), schemas.BusyPeriod(start_date=NOW, end_date=NOW + timedelta(hours=1))])]),
+    "BulkResult": (schemas.BulkResult, [schemas.BulkResult(succeeded=1, failed=1, items=[schemas.BulkItemResult(index=0, id=5), schemas.BulkItemResult(index=1, error=[{"loc": ["title"], "msg": "field required"}])])]),
+    "JobStatus": (schemas.JobStatus, [schemas.JobStatus(counts={"collect_blobs": {"pending": 2}}, oldest_pending=NOW, failed=[schemas.Job(id=1, kind="boom", status="failed", attempts=5, run_at=NOW, created_at=NOW, last_error=None)]), schemas.JobStatus(counts={}, oldest_pending=None, failed=[])]),
+}
+
+
+@pytest.mark.parametrize("name", CASES)
+def test_schema(encoder, name):
+    schema, objs = CASES[name]
+    assert serializer.serialize(schema, objs) == stock(schema, objs)
+    for obj in objs:
+        assert serializer.serialize(schema, obj) == stock(schema, obj)
+        assert serializer.dumps(serializer.to_dict(schema, obj)) == stock(schema, obj)
+
+
+@pytest.mark.parametrize("name, fields", [
+    ("User", ("id", "name")),
+    ("User", ("goods",)),
+    ("Good", ("id", "title")),
+    ("Good", ("images", "location", "title")),
+    ("Share", ("start_date", "end_date", "images")),
+    ("Location", ("lat",)),
+    ("ImageNoContent", ("updated_at", "digest")),
+])
+def test_fields(encoder, name, fields):
+    schema, objs = CASES[name]
+    # in schema order, as main.parse_fields passes them
+    fields = tuple(f for f in schema.__fields__ if f in fields)
+    assert serializer.serialize(schema, objs, fields) == stock(schema, objs, fields)
+
+
+@pytest.fixture(scope="module")
+def owner(client, new_user):
+    """A user with a location, goods with images, and a share."""
+    u = new_user("json")
+    params = {"email": u["email"]}
+
+    def post(path, body):
+        res = client.post(path.format(user_id=u["id"]), params=params, json=body)
+        assert res.status_code == 200, res.text
+        return res.json()["id"]
+
+    location_id = post("/users/{user_id}/locations/", {"name": "Hof", "zip": "10115", "city": "Berlin", "address": "Straße 1", "lat": 52.0, "lon": 13.404954})
+    goods = [post("/users/{user_id}/goods/", {"title": f"json drill {i}", "description": None if i else "ünïcode", "location_id": location_id if i else None}) for i in range(2)]
+    post("/users/{user_id}/images/", {"name": "a.png", "good_id": goods[0]})
+    post("/users/{user_id}/shares/", {"good_id": goods[1], "start_date": "2021-03-14T15:09:26.535897", "location_id": location_id})
+    return u
+
+
+@pytest.mark.parametrize("path, params", [
+    ("/users/", {"limit": 1}),
+    ("/users/", {"limit": 1, "fields": "id,name,goods"}),
+    ("/users/me", {}),
+    ("/goods/", {"q": "json drill"}),
+    ("/goods/", {"q": "json drill", "fields": "title,images"}),
+    ("/goods/nearby", {"lat": 52.0, "lon": 13.404954, "radius_km": 0.1}),
+    ("/shares/", {}),
+    ("/locations/", {}),
+    ("/images/", {}),
+])
+def test_routes(client, owner, encoder, monkeypatch, path, params):
+    params = dict(params, email=owner["email"])
+    if path == "/users/":
+        # only the owner, whose rows nobody changes while the test runs
+        params["cursor"] = encode_cursor(owner["id"] - 1)
+    # the response cache would answer the second request with the body of the first
+    monkeypatch.setattr(main, "response_cache", None)
+    monkeypatch.setattr(serializer, "FAST_JSON", False)
+    expected = client.get(path, params=params)
+    monkeypatch.setattr(serializer, "FAST_JSON", True)
+    res = client.get(path, params=params)
+    assert res.status_code == expected.status_code == 200
+    assert res.json()
+    assert res.content == expected.content
@@ -0,0 +1,130 @@
+import hashlib
+import os
+
+import pytest
+
+from db import uploads
+from db.storage import blob_store
+
+OCTETS = {"Content-Type": "application/offset+octet-stream"}
+
+
+@pytest.fixture
+def image(client, new_user):
+    user = new_user("uploads")
+    res = client.post(f"/users/{user['id']}/images/", params={"email": user["email"]}, json={"name": "big.bin", "mime_type": "application/octet-stream"})
+    assert res.status_code == 200, res.text
+    return dict(res.json(), email=user["email"])
+
+
+def start(client, image: dict, length: int) -> str:
+    res = client.post(f"/upload/images/{image['id']}/resumable", params={"email": image["email"]}, headers={"Upload-Length": str(length)})
+    assert res.status_code == 201, res.text
+    assert res.headers["upload-offset"] == "0"
+    return res.headers["location"]
+
+
+def patch(client, image: dict, location: str, offset: int, data: bytes, headers=OCTETS):
+    return client.patch(location, params={"email": image["email"]}, headers=dict(headers, **{"Upload-Offset": str(offset)}), data=data)
+
+
+def head(client, image: dict, location: str):
+    # streamed: the test client would try to read the body of a 404, which a HEAD response does not send
+    return client.head(location, params={"email": image["email"]}, stream=True)
+
+
+def offset(client, image: dict, location: str) -> int:
+    res = head(client, image, location)
+    assert res.status_code == 200
+    assert res.headers["cache-control"] == "no-store"
+    return int(res.headers["upload-offset"])
+
+
+def test_upload_in_pieces(client, image):
+    data = os.urandom(3000)
+    location = start(client, image, len(data))
+    res = patch(client, image, location, 0, data[:1000])
+    assert res.status_code == 204
+    assert res.headers["upload-offset"] == "1000"
+    # resumed after an interruption, from the offset the server has
+    assert offset(client, image, location) == 1000
+    res = patch(client, image, location, 1000, data[1000:2500])
+    assert res.status_code == 204
+    res = patch(client, image, location, 2500, data[2500:])
+    assert res.status_code == 200, res.text
+    digest = hashlib.sha256(data).hexdigest()
+    assert res.json()["digest"] == digest
+    assert res.json()["size"] == len(data)
+    with blob_store.open(digest) as f:
+        assert f.read() == data
+    # the partial upload is gone once it is stored
+    assert head(client, image, location).status_code == 404
+    res = client.get(f"/images/{image['id']}", params={"email": image["email"]})
+    assert res.content == data
+
+
+def test_offset_mismatch(client, image):
+    location = start(client, image, 100)
+    assert patch(client, image, location, 0, b"x" * 10).status_code == 204
+    res = patch(client, image, location, 5, b"y" * 10)
+    assert res.status_code == 409
+    assert res.json()["detail"] == "Upload offset is 10"
+    assert patch(client, image, location, 20, b"y" * 10).status_code == 409
+    assert offset(client, image, location) == 10
+
+
+@pytest.mark.skipif(uploads.fcntl is None, reason="concurrent PATCHes are not detected without fcntl")
+def test_concurrent_patch(client, image):
+    location = start(client, image, 100)
+    upload_id = location.rsplit("/", 1)[1]
+    f = uploads.open_at(upload_id, 0)
+    try:
+        res = patch(client, image, location, 0, b"x" * 10)
+    finally:
+        f.close()
+    assert res.status_code == 409
+    assert res.json()["detail"] == "Upload is in progress"
+    assert patch(client, image, location, 0, b"x" * 10).status_code == 204
+
+
+def test_too_large(client, image, monkeypatch):
+    monkeypatch.setattr(uploads, "MAX_UPLOAD_SIZE", 1000)
+    res = client.post(f"/upload/images/{image['id']}/resumable", params={"email": image["email"]}, headers={"Upload-Length": "1001"})
+    assert res.status_code == 413
+    assert res.headers["tus-max-size"] == "1000"
+    # more bytes than announced
+    location = start(client, image, 10)
+    assert patch(client, image, location, 0, b"x" * 11).status_code == 413
+
+
+def test_content_type(client, image):
+    location = start(client, image, 10)
+    res = patch(client, image, location, 0, b"x" * 10, headers={"Content-Type": "application/octet-stream"})
+    assert res.status_code == 415
+    assert offset(client, image, location) == 0
+
+
+def test_delete(client, image):
+    location = start(client, image, 100)
+    patch(client, image, location, 0, b"x" * 10)
+    res = client.delete(location, params={"email": image["email"]})
+    assert res.status_code == 204
+    assert head(client, image, location).status_code == 404
+    assert patch(client, image, location, 10, b"x" * 10).status_code == 404
+    assert client.delete(location, params={"email": image["email"]}).status_code == 404
+
+
+def test_uploads_of_other_users(client, new_user, image):
+    other = new_user("uploads-other")
+    res = client.post(f"/upload/images/{image['id']}/resumable", params={"email": other["email"]}, headers={"Upload-Length": "10"})
+    assert res.status_code == 401
+    location = start(client, image, 10)
+    assert head(client, other, location).status_code == 404
+    assert patch(client, dict(image, email=other["email"]), location, 0, b"x" * 10).status_code == 404
+    assert client.delete(location, params={"email": other["email"]}).status_code == 404
+    assert offset(client, image, location) == 0
+
+
+def test_unknown_upload(client, image):
+    assert head(client, image, "/upload/resumable/" + "0" * 32).status_code == 404
+    assert head(client, image, "/upload/resumable/..%2F..%2Fetc").status_code == 404
@@ -0,0 +1,83 @@
+import asyncio
+import sqlite3
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from db import models, sqlite
+from db.database import engine
+from db.writequeue import WriteQueue
+
+
+@pytest.fixture
+def write_queue():
+    """A WriteQueue on the test database that gives up on a lock after 200 ms and batches what arrives within 100 ms."""
+    if engine.dialect.name != "sqlite":
+        pytest.skip("locks the SQLite database file")
+    queue_engine = create_engine(engine.url, connect_args={"check_same_thread": False})
+    sqlite.configure_engine(queue_engine, explicit_transactions=True)
+
+    @event.listens_for(queue_engine, "connect")
+    def short_busy_timeout(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA busy_timeout=200")
+
+    wq = WriteQueue(sessionmaker(bind=queue_engine, autocommit=False, autoflush=False, expire_on_commit=False), max_delay=0.1)
+    yield wq
+    wq.stop()
+    queue_engine.dispose()
+
+
+def touch_user(db, user_id: int) -> int:
+    res = db.query(models.User).filter(models.User.id == user_id).update({models.User.version: models.User.version + 1}, synchronize_session=False)
+    db.commit()
+    return res
+
+
+def submit_all(wq: WriteQueue, n: int, fn, *args) -> list:
+    """Submit `n` calls of `fn` at once; their results or exceptions."""
+    async def submit():
+        return await asyncio.wait_for(asyncio.gather(*(wq.submit(fn, *args) for _ in range(n)), return_exceptions=True), 10)
+
+    # a loop of its own, asyncio.run would leave none behind for the TestClient
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(submit())
+    finally:
+        loop.close()
+
+
+def test_locked_database_fails_the_whole_batch(write_queue, new_user):
+    user = new_user("locked")
+    lock = sqlite3.connect(engine.url.database, isolation_level=None)
+    try:
+        lock.execute("BEGIN IMMEDIATE")
+        results = submit_all(write_queue, 3, touch_user, user["id"])
+        lock.execute("ROLLBACK")
+    finally:
+        lock.close()
+    assert len(results) == 3
+    assert all(isinstance(r, OperationalError) and "locked" in str(r) for r in results), results
+    # the writer is still there once the lock is gone
+    assert submit_all(write_queue, 2, touch_user, user["id"]) == [1, 1]
+
+
+def test_locked_database_fails_at_begin(write_queue, new_user):
+    user = new_user("begin")
+    calls = []
+
+    def job(db):
+        calls.append(1)
+        return touch_user(db, user["id"])
+
+    lock = sqlite3.connect(engine.url.database, isolation_level=None)
+    try:
+        lock.execute("BEGIN IMMEDIATE")
+        results = submit_all(write_queue, 2, job)
+        lock.execute("ROLLBACK")
+    finally:
+        lock.close()
+    # the write lock is taken up front, so no job read anything it could not write back
+    assert calls == []
+    assert all(isinstance(r, OperationalError) and "BEGIN IMMEDIATE" in str(r) for r in results), results